@@ -0,0 +1,298 @@
+"""Work-balanced level selection. The data is binned on a fine set of
+candidate level values in a streaming pass over the mesh, then the levels
+are picked from the candidates so that every band between the minimum
+and maximum level holds about the same share of the work, measured as the
+number of cells, the volume, or the number of boundary faces of the band.
+"""
+
+import shutil
+import tempfile
+import warnings
+import numpy as np
+import meshio
+
+from IsogeomGenerator import voxel, vtkscan
+
+
+MODES = ['quantile', 'volume', 'surface']
+
+
+def candidate_levels(minN, maxN, nbins=1024):
+    """Generate the fine set of candidate level values. The values are
+    logarithmically spaced if minN is positive, otherwise linearly
+    spaced.
+
+    Input:
+    ------
+        minN: float, minimum level value
+        maxN: float, maximum level value
+        nbins: (optional), int, number of bins between minN and maxN.
+            Default=1024
+
+    Returns:
+    --------
+        edges: array of floats (nbins + 1), candidate level values
+    """
+    if minN > 0:
+        return np.logspace(np.log10(minN), np.log10(maxN), num=nbins + 1)
+    return np.linspace(minN, maxN, num=nbins + 1)
+
+
+def _values(filename, data):
+    """Read the data values of a mesh that is not a legacy VTK file."""
+    mf = meshio.read(filename)
+    for cell_type in ['hexahedron', 'tetra']:
+        cell_data = mf.cell_data.get(cell_type, {})
+        if data in cell_data:
+            return np.asarray(cell_data[data]).ravel()
+    if data in mf.point_data:
+        return np.asarray(mf.point_data[data]).ravel()
+    raise RuntimeError("Data {} not found on mesh.".format(data))
+
+
+def _bin_grid(filename, data, edges, dirname):
+    """Classify the cell data of a Cartesian mesh into a grid of bins."""
+    if vtkscan.is_legacy_vtk(filename):
+        return vtkscan.band_grid(filename, data, edges, dirname)
+    mf = meshio.read(filename)
+    cell_data = mf.cell_data.get('hexahedron', {})
+    if data not in cell_data:
+        raise RuntimeError("Cell data {} not found on the hexahedra of "
+                           "the mesh.".format(data))
+    coords, grid = voxel.cartesian_grid(mf.points, mf.cells['hexahedron'],
+                                        cell_data[data])
+    return coords, voxel.classify(grid, edges)
+
+
+def bin_weights(filename, data, edges, mode='quantile', tile=64):
+    """Measure the work in each bin between consecutive candidate levels.
+
+    Input:
+    ------
+        filename: string, path to the mesh file
+        data: string, name of the data on the mesh
+        edges: sorted array of floats, candidate level values
+        mode: (optional), str, 'quantile' (default) counts the values in
+            each bin, 'volume' sums the volume of the cells in each bin
+            (Cartesian meshes with cell data only)
+        tile: (optional), int, number of cells along each edge of a block
+            when summing volumes. Default=64
+
+    Returns:
+    --------
+        weights: array of floats (len(edges) + 1), work in each bin
+            (edges[i - 1], edges[i]], the first and last bin hold the
+            values outside of the candidate levels
+    """
+    nbins = len(edges) + 1
+    if mode == 'quantile':
+        if vtkscan.is_legacy_vtk(filename):
+            counts = vtkscan.scan(filename, data, levels=edges)['counts']
+        else:
+            bins = voxel.classify(_values(filename, data), edges)
+            counts = np.bincount(bins, minlength=nbins)
+        return np.asarray(counts, dtype=np.float64)
+
+    if mode == 'volume':
+        dirname = tempfile.mkdtemp()
+        try:
+            coords, bins = _bin_grid(filename, data, edges, dirname)
+            widths = [np.diff(c) for c in coords]
+            weights = np.zeros(nbins, dtype=np.float64)
+            for start, stop in voxel.blocks(bins.shape, tile):
+                sl = tuple(slice(i, j) for i, j in zip(start, stop))
+                w = [widths[a][sl[a]] for a in range(3)]
+                vol = np.einsum('i,j,k->ijk', *w)
+                weights += np.bincount(np.asarray(bins[sl]).ravel(),
+                                       weights=vol.ravel(),
+                                       minlength=nbins)
+            del bins
+        finally:
+            shutil.rmtree(dirname, ignore_errors=True)
+        return weights
+
+    raise RuntimeError("Bin weight mode {} not recognized.".format(mode))
+
+
+def bin_transitions(filename, data, edges, tile=64):
+    """Count the faces between the cells of each pair of bins and on the
+    exterior of each bin (Cartesian meshes with cell data only).
+
+    Input:
+    ------
+        filename: string, path to the mesh file
+        data: string, name of the cell data on the mesh
+        edges: sorted array of floats, candidate level values
+        tile: (optional), int, number of cells along each edge of a
+            block. Default=64
+
+    Returns:
+    --------
+        pairs: 2D array of ints, number of faces shared by each pair of
+            bins (see voxel.transition_counts())
+        exterior: array of ints, number of exterior faces of each bin
+    """
+    dirname = tempfile.mkdtemp()
+    try:
+        coords, bins = _bin_grid(filename, data, edges, dirname)
+        pairs, exterior = voxel.transition_counts(bins, len(edges) + 1,
+                                                  tile=tile)
+        del bins
+    finally:
+        shutil.rmtree(dirname, ignore_errors=True)
+    return pairs, exterior
+
+
+def balanced_levels(N, edges, weights):
+    """Pick N levels from the candidates, including the first and last,
+    so that the N - 1 bands between them have about the same weight.
+
+    Input:
+    ------
+        N: int, number of levels
+        edges: sorted array of floats, candidate level values
+        weights: array of floats (len(edges) + 1), weight of each bin
+            from bin_weights()
+
+    Returns:
+    --------
+        levels: list of floats, selected level values
+    """
+    # cumulative weight up to each candidate level
+    cum = np.concatenate([[0.], np.cumsum(weights[1:len(edges)])])
+    if cum[-1] <= 0:
+        raise RuntimeError("No data between {} and {} to balance the "
+                           "levels.".format(edges[0], edges[-1]))
+    targets = cum[-1] * np.arange(1, N - 1) / float(N - 1)
+    idx = np.searchsorted(cum, targets, side='left')
+    return _select(edges, idx)
+
+
+def surface_levels(N, edges, pairs, exterior):
+    """Pick N levels from the candidates, including the first and last,
+    so that the N - 1 bands between them have roughly the same number of
+    boundary faces. Each band is grown from the previous level for as
+    long as its face count stays within a target, and the smallest
+    target that needs no more than N - 1 bands is found by bisection.
+
+    Input:
+    ------
+        N: int, number of levels
+        edges: sorted array of floats, candidate level values
+        pairs: 2D array of ints, faces shared by each pair of bins
+            from bin_transitions()
+        exterior: array of ints, exterior faces of each bin from
+            bin_transitions()
+
+    Returns:
+    --------
+        levels: list of floats, selected level values
+    """
+    K = len(edges) - 1
+    cum_rows = np.concatenate([[0], np.cumsum(pairs.sum(axis=1) +
+                                              exterior)])
+    cum_pairs = np.zeros((len(pairs) + 1, len(pairs) + 1), dtype=np.int64)
+    cum_pairs[1:, 1:] = pairs.cumsum(axis=0).cumsum(axis=1)
+
+    def faces(p, q):
+        # boundary faces of the band from edges[p] to edges[q], which
+        # holds bins p + 1 to q
+        inner = cum_pairs[q + 1, q + 1] - cum_pairs[p + 1, q + 1] - \
+            cum_pairs[q + 1, p + 1] + cum_pairs[p + 1, p + 1]
+        return cum_rows[q + 1] - cum_rows[p + 1] - inner
+
+    def sweep(target):
+        # grow each band as far as it stays within the target, then back
+        # up over empty bins so the level sits just above the data
+        cuts = []
+        p = 0
+        while True:
+            f = faces(p, np.arange(p + 1, K + 1))
+            over = np.nonzero(f > target)[0]
+            if len(over) == 0:
+                return cuts
+            j = max(over[0] - 1, 0)
+            while j > 0 and f[j - 1] == f[j]:
+                j -= 1
+            if p + 1 + j >= K:
+                return cuts
+            p = p + 1 + j
+            cuts.append(p)
+
+    # smallest target that needs no more than N - 1 bands, no band can
+    # have more faces than all of the bins together
+    lo = 0
+    hi = cum_rows[K + 1] - cum_rows[1]
+    if hi <= 0:
+        raise RuntimeError("No data between {} and {} to balance the "
+                           "levels.".format(edges[0], edges[-1]))
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if len(sweep(mid)) <= N - 2:
+            hi = mid
+        else:
+            lo = mid
+    cuts = sweep(hi)
+
+    # split the bands with the most faces with any levels that are left
+    while len(cuts) < N - 2:
+        bounds = [0] + cuts + [K]
+        best = None
+        for p, q in zip(bounds[:-1], bounds[1:]):
+            r = np.arange(p + 1, q)
+            lower = faces(p, r)
+            upper = faces(r, q)
+            ok = (lower > 0) & (upper > 0)
+            if not np.any(ok):
+                continue
+            size = faces(p, q)
+            if best is None or size > best[0]:
+                score = np.where(ok, np.maximum(lower, upper), size + 1)
+                best = (size, r[np.argmin(score)])
+        if best is None:
+            break
+        cuts = sorted(cuts + [best[1]])
+
+    return _select(edges, np.array(cuts, dtype=int))
+
+
+def _select(edges, idx):
+    """Build the level list from the first and last candidate and the
+    interior candidates at idx, dropping any repeated values.
+    """
+    idx = np.unique(np.concatenate([[0], idx, [len(edges) - 1]]))
+    return [float(edges[i]) for i in idx]
+
+
+def generate(N, minN, maxN, filename, data, mode='quantile', nbins=1024):
+    """Generate N work-balanced levels between minN and maxN.
+
+    Input:
+    ------
+        N: int, number of levels to generate
+        minN: float, minimum level value
+        maxN: float, maximum level value
+        filename: string, path to the mesh file
+        data: string, name of the data on the mesh
+        mode: (optional), str, 'quantile' (default) for equal numbers of
+            cells, 'volume' for equal volumes, or 'surface' for equal
+            numbers of boundary faces in each band
+        nbins: (optional), int, number of candidate bins. Default=1024
+
+    Returns:
+    --------
+        levels: list of floats, selected level values (fewer than N if
+            the data is too concentrated to separate all of the levels)
+    """
+    N = int(N)
+    edges = candidate_levels(minN, maxN, nbins=nbins)
+    if mode == 'surface':
+        pairs, exterior = bin_transitions(filename, data, edges)
+        levels = surface_levels(N, edges, pairs, exterior)
+    else:
+        weights = bin_weights(filename, data, edges, mode=mode)
+        levels = balanced_levels(N, edges, weights)
+    if len(levels) < N:
+        warnings.warn("Only {} distinct levels could be placed between {} "
+                      "and {}.".format(len(levels), minN, maxN))
+    return levels
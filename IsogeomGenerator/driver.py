@@ -3,14 +3,19 @@ geometry creation.
 """
 
 import os
+import shutil
+import tempfile
 import warnings
 import numpy as np
 import math as m
+import meshio
 
+from IsogeomGenerator import balance, gridops, voxel, vtkscan
 
-def generate_levels(N, minN, maxN, mode='lin'):
-    """Auto-generate evenly-spaced level values between the min and max
-    value.
+
+def generate_levels(N, minN, maxN, mode='lin', meshfile=None, data=None):
+    """Auto-generate evenly-spaced or work-balanced level values between
+    the min and max value.
 
     Input:
     ------
@@ -19,12 +24,25 @@ def generate_levels(N, minN, maxN, mode='lin'):
             levels (ratio mode).
         minN: float, minimum level value
         maxN: float, maximum level value
-        mode: str, options are 'lin' (default), 'log', or 'ratio'.
+        mode: str, options are 'lin' (default), 'log', 'ratio',
+            'quantile', 'volume', or 'surface'.
             lin: N linearly spaced values between minN and maxN
             log: N logarithmically spaced values between minN and maxN
             ratio: levels that are spaced by a constant ratio N.
                 minN will be used as minimum level value and the maximum
                 level value is less than or equal to maxN.
+            quantile: N levels between minN and maxN chosen so that each
+                band holds the same number of mesh values
+            volume: N levels between minN and maxN chosen so that each
+                band has the same volume (Cartesian meshes with cell
+                data only)
+            surface: N levels between minN and maxN chosen so that each
+                band has roughly the same number of boundary faces
+                (Cartesian meshes with cell data only)
+        meshfile: (optional), str, path to the mesh file, required for
+            the quantile, volume, and surface modes
+        data: (optional), str, name of the data on the mesh, required for
+            the quantile, volume, and surface modes
 
     Returns:
     --------
@@ -32,14 +50,14 @@ def generate_levels(N, minN, maxN, mode='lin'):
     """
     if mode == 'lin':
         levels = list(np.linspace(minN, maxN,
-                                  num=N, endpoint=True))
+                                  num=int(N), endpoint=True))
         return levels
 
     if mode == 'log':
         base = 10.
         start = m.log(minN, base)
         stop = m.log(maxN, base)
-        levels = list(np.logspace(start, stop, num=N,
+        levels = list(np.logspace(start, stop, num=int(N),
                                   endpoint=True, base=base))
         return levels
 
@@ -56,12 +74,202 @@ def generate_levels(N, minN, maxN, mode='lin'):
                 break
         return levels
 
+    if mode in balance.MODES:
+        if meshfile is None or data is None:
+            raise RuntimeError("Level generation mode {} requires the "
+                               "mesh file and data name.".format(mode))
+        return balance.generate(N, minN, maxN, meshfile, data, mode=mode)
+
     raise RuntimeError("Level generation mode {} not " +
                        "recognized.".format(mode))
 
 
+def preview_mesh(filename, data, factor, method='mean', dirname=None):
+    """Block-aggregate the cell data of a Cartesian mesh by a factor
+    along each axis and write the coarse grid to a new mesh file. The
+    coarse mesh can be used in place of the original to quickly preview
+    where the isosurfaces land before the full resolution run.
+
+    Input:
+    ------
+        filename: string, path to the Cartesian mesh file with cell data
+        data: string, name of the cell data on the mesh
+        factor: int, number of cells merged along each axis
+        method: (optional), string, 'mean' (default) for the volume
+            weighted mean or 'max' for the maximum value of each block
+        dirname: (optional), string, existing folder to write the coarse
+            mesh to. Default: a new temporary folder
+
+    Returns:
+    --------
+        preview: string, path to the coarse mesh file (legacy VTK
+            rectilinear grid)
+    """
+    if dirname is None:
+        dirname = tempfile.mkdtemp()
+    preview = dirname + "/preview.vtk"
+    _rewrite_grid(filename, data, preview, "Preview",
+                  lambda grid, coords: gridops.aggregate(grid, coords,
+                                                         factor, method))
+    return preview
+
+
+def crop_mesh(filename, data, bounds, dirname=None):
+    """Cut the cells of a Cartesian mesh with cell data whose centers lie
+    within a box out of the mesh and write them to a new mesh file. The
+    cropped mesh can be used in place of the original to generate the
+    geometry of just that region, the outer faces of the cropped cells
+    become the exterior of the geometry.
+
+    Input:
+    ------
+        filename: string, path to the Cartesian mesh file with cell data
+        data: string, name of the cell data on the mesh
+        bounds: list of list of floats, minimum and maximum x, y, and z
+            of the region. Must be structured like
+            [[xmin, ymin, zmin], [xmax, ymax, zmax]]
+        dirname: (optional), string, existing folder to write the cropped
+            mesh to. Default: a new temporary folder
+
+    Returns:
+    --------
+        cropped: string, path to the cropped mesh file (legacy VTK
+            rectilinear grid)
+    """
+    if dirname is None:
+        dirname = tempfile.mkdtemp()
+    cropped = dirname + "/crop.vtk"
+    _rewrite_grid(filename, data, cropped, "Cropping",
+                  lambda grid, coords: gridops.crop(grid, coords, bounds))
+    return cropped
+
+
+def symmetric_mesh(filename, data, symmetry, dirname=None):
+    """Cut the upper half of a Cartesian mesh with cell data along each
+    symmetry axis and write it to a new mesh file. The geometry generated
+    from the reduced mesh is mirrored back across the symmetry planes by
+    IsGm(..., symmetry=symmetry). The data must be symmetric about the
+    center of the mesh along these axes.
+
+    Input:
+    ------
+        filename: string, path to the Cartesian mesh file with cell data
+        data: string, name of the cell data on the mesh
+        symmetry: list of strings, axes ('x', 'y', or 'z') normal to the
+            symmetry planes, which must be at the center of the mesh on
+            a cell face
+        dirname: (optional), string, existing folder to write the reduced
+            mesh to. Default: a new temporary folder
+
+    Returns:
+    --------
+        reduced: string, path to the reduced mesh file (legacy VTK
+            rectilinear grid)
+    """
+    if dirname is None:
+        dirname = tempfile.mkdtemp()
+    reduced = dirname + "/symmetric.vtk"
+    _rewrite_grid(filename, data, reduced, "Symmetry",
+                  lambda grid, coords: gridops.symmetric_half(grid, coords,
+                                                              symmetry))
+    return reduced
+
+
+def denoise_mesh(filename, data, levels, method='median', size=3,
+                 dirname=None):
+    """Filter the cell data of a Cartesian mesh to suppress the speckle
+    isovolumes that statistical noise creates and write the filtered grid
+    to a new mesh file. The face connected regions of cells of each band
+    are counted before and after the filter and reported. The grid of a
+    legacy VTK file is filtered from and into memory-mapped files, one
+    slab of cells at a time.
+
+    Input:
+    ------
+        filename: string, path to the Cartesian mesh file with cell data
+        data: string, name of the cell data on the mesh
+        levels: list of floats or string, level values or the path to a
+            file with one level value per line
+        method: (optional), string, 'median' (default) or 'gaussian' (see
+            gridops.denoise())
+        size: (optional), odd int, number of cells of the filter kernel
+            along each axis. Default=3
+        dirname: (optional), string, existing folder to write the filtered
+            mesh to. Default: a new temporary folder
+
+    Returns:
+    --------
+        denoised: string, path to the filtered mesh file (legacy VTK
+            rectilinear grid)
+        report: dict, levels and the number of regions of each band
+            'before' and 'after' the filter, and the number 'removed'
+    """
+    if isinstance(levels, str):
+        levels = np.loadtxt(levels, ndmin=1)
+    levels = sorted(float(level) for level in levels)
+    if dirname is None:
+        dirname = tempfile.mkdtemp()
+    denoised = dirname + "/denoise.vtk"
+    report = {'levels': levels}
+
+    scratch = dirname + "/denoise.npy"
+
+    def transform(grid, coords):
+        # a memory-mapped grid is filtered into a memory-mapped file
+        out = None
+        if isinstance(grid, np.memmap):
+            out = np.lib.format.open_memmap(scratch, mode='w+',
+                                            dtype=np.float64,
+                                            shape=grid.shape)
+        new_grid = gridops.denoise(grid, method, size, out)
+        nbands = len(levels) + 1
+        report['before'] = gridops.count_components(grid, nbands,
+                                                    levels).tolist()
+        report['after'] = gridops.count_components(new_grid, nbands,
+                                                   levels).tolist()
+        return coords, new_grid
+
+    try:
+        _rewrite_grid(filename, data, denoised, "Denoising", transform)
+    finally:
+        if os.path.isfile(scratch):
+            os.remove(scratch)
+    report['removed'] = sum(report['before']) - sum(report['after'])
+    return denoised, report
+
+
+def _rewrite_grid(filename, data, output, name, transform):
+    """Read the cell data of a Cartesian mesh into a grid, transform it,
+    and write the new grid to a legacy VTK rectilinear grid file. Legacy
+    VTK files are streamed into a memory-mapped grid next to the output
+    file.
+    """
+    if vtkscan.is_legacy_vtk(filename):
+        scratch = tempfile.mkdtemp(dir=os.path.dirname(output))
+        try:
+            coords, grid = vtkscan.value_grid(filename, data, scratch)
+            coords, grid = transform(grid, coords)
+            gridops.write_rectilinear_vtk(output, coords, grid, data)
+            del grid
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        return
+
+    mf = meshio.read(filename)
+    cell_data = mf.cell_data.get('hexahedron', {})
+    if data not in cell_data:
+        raise RuntimeError("{} requires cell data {} on a hexahedral "
+                           "mesh.".format(name, data))
+    coords, grid = voxel.cartesian_grid(mf.points, mf.cells['hexahedron'],
+                                        cell_data[data])
+    coords, grid = transform(grid, coords)
+    gridops.write_rectilinear_vtk(output, coords, grid, data)
+
+
 def generate_volumes(ivdb, filename, data=None, db=os.getcwd() + "/tmp",
-                     levelinfo=None):
+                     levelinfo=None, workers=1, backend='visit',
+                     incremental=False, tile=None, engine_procs=None,
+                     labeled=False):
     """Creates an STL file for each isovolume. N+1 files are
     generated and stored in the dbname folder.
 
@@ -80,6 +288,23 @@ def generate_volumes(ivdb, filename, data=None, db=os.getcwd() + "/tmp",
                 line of the file should have exactly one float to be
                 used as a level value.
             list: list of user-defined values to use for contour levels
+        workers: (optional), int, number of VisIt sessions to split the
+            isovolume generation across. Default=1 (serial).
+        backend: (optional), string, 'visit' (default) or 'numpy'. The
+            numpy backend extracts all isovolumes of a Cartesian mesh
+            with cell data in a single pass without VisIt.
+        incremental: (optional), bool, if True, reuse the database and
+            only regenerate the isovolumes whose level bounds changed.
+            Default=False.
+        tile: (optional), int, number of cells along each edge of the
+            blocks used by the numpy backend to extract the isovolumes
+            of meshes that do not fit in memory. Default=None
+        engine_procs: (optional), int, number of MPI ranks of a local
+            parallel VisIt compute engine used for the extraction.
+            Default=None (serial engine)
+        labeled: (optional), bool, if True, the numpy backend writes all
+            isovolumes to a single VTK file with a band label on every
+            triangle instead of one STL file each. Default=False
     """
     # initialize attributes
     if data is not None:
@@ -107,7 +332,9 @@ def generate_volumes(ivdb, filename, data=None, db=os.getcwd() + "/tmp",
 
     # create volumes
     print("Generating isovolumes...")
-    ivdb.generate_vols(filename)
+    ivdb.generate_vols(filename, workers=workers, backend=backend,
+                       incremental=incremental, tile=tile,
+                       engine_procs=engine_procs, labeled=labeled)
     print("...Isovolumes files generated!")
 
     # write levels to file in database
@@ -119,7 +346,8 @@ def generate_volumes(ivdb, filename, data=None, db=os.getcwd() + "/tmp",
 
 def create_geometry(isogeom, ivdb=None, data=None, dbname=None,
                     levelfile=None, tag_for_viz=False, norm=1.0,
-                    tags=None, sname=None, sdir=None):
+                    tags=None, sname=None, sdir=None, lod=None,
+                    weld=False):
     """Over-arching function to do all steps to create a single
     isosurface geometry for DAGMC using pyMOAB.
 
@@ -154,7 +382,18 @@ def create_geometry(isogeom, ivdb=None, data=None, dbname=None,
         sname: (optional), str, name of file (including extension) for the
             written geometry file. Acceptable file types are VTK and H5M.
             Default name: isogeom.h5m
+        lod: (optional), list of floats, levels of detail to write in
+            addition to the full geometry (see write_lods()). Requires an
+            H5M geometry file.
+        weld: (optional), bool, if True, merge the coincident vertices of
+            all isovolumes when the database is read, so that coincident
+            surfaces are found by shared vertices and the geometry file
+            has no duplicate vertices. Default=False
     """
+    if lod is not None and sname is not None and \
+            not sname.endswith('.h5m'):
+        raise RuntimeError("Levels of detail require an h5m geometry "
+                           "file, not {}.".format(sname))
     if ivdb is not None:
         isogeom.read_isovol(ivdb)
 
@@ -194,7 +433,7 @@ def create_geometry(isogeom, ivdb=None, data=None, dbname=None,
         warnings.warn("levels already set, ignoring levelfile.")
 
     print("Reading database...")
-    isogeom.read_database()
+    isogeom.read_database(weld=weld)
     print("... Reading complete!")
 
     # Step 1: Separate Isovolume Surfaces
@@ -207,7 +446,13 @@ def create_geometry(isogeom, ivdb=None, data=None, dbname=None,
     isogeom.imprint_merge(norm)
     print("...Merging complete!")
 
-    # Step 3: Assign Parent-Child Relationship
+    # Step 3: Mirror the geometry across its symmetry planes
+    if isogeom.symmetry:
+        print("Reflecting geometry...")
+        isogeom.reflect()
+        print("...Reflection complete!")
+
+    # Step 4: Assign Parent-Child Relationship
     isogeom.make_family()
 
     if tag_for_viz:
@@ -224,3 +469,111 @@ def create_geometry(isogeom, ivdb=None, data=None, dbname=None,
         sname = 'isogeom.h5m'
 
     isogeom.write_geometry(sname, sdir)
+
+    if lod is not None:
+        write_lods(sdir + "/" + sname, lod)
+
+
+def write_lods(geomfile, lod):
+    """Write levels of detail of a geometry file. Every surface of the
+    geometry is decimated (see refine_isogeom.refine_surfaces()) so that
+    level of detail f keeps about 1/f of its triangles. Surface and
+    volume sets, their IDs, and the curve/boundary vertices are kept, so
+    the levels of detail are interchangeable. Level of detail 1 is the
+    geometry file itself.
+
+    Input:
+    ------
+        geomfile: string, path to the H5M geometry file
+        lod: list of floats, level of detail factors (at least 1)
+
+    Returns:
+    --------
+        files: list of strings, path to the file written for each level
+            of detail above 1, named <geomfile>_lod<f>.h5m
+    """
+    if not geomfile.endswith('.h5m'):
+        raise RuntimeError("Levels of detail require an h5m geometry "
+                           "file, not {}.".format(geomfile))
+    if min(lod) < 1:
+        raise RuntimeError("Level of detail factors must be at least 1.")
+
+    # vtk is only required to write levels of detail
+    from IsogeomGenerator import refine_isogeom
+
+    files = []
+    for factor in sorted(set(lod)):
+        if factor == 1:
+            continue
+        output = geomfile[:-len('.h5m')] + "_lod{:g}.h5m".format(factor)
+        print("Writing level of detail {}...".format(factor))
+        refine_isogeom.refine_surfaces(geomfile, 1. - 1. / factor, None,
+                                       output, False)
+        files.append(output)
+    return files
+
+
+def generate_series(steps, levelinfo, db=os.getcwd() + "/tmp", tile=64,
+                    tag_for_viz=False, norm=1.0, tags=None, sname=None,
+                    sdir=None, lod=None, weld=False):
+    """Create an isosurface geometry for each mesh of a series of
+    Cartesian meshes with the same grid and slowly changing cell data.
+    The isovolumes are extracted with the numpy backend in blocks of
+    cells and only the blocks whose bands changed since the previous
+    mesh are extracted again (see series.BlockCache). Only the
+    extraction is reused, the geometry of every step is still read,
+    separated, and merged in full by create_geometry().
+
+    Input:
+    ------
+        steps: list of (filename, data) tuples, path to the vtk file with
+            the mesh and name of the cell data of each step
+        levelinfo: string or list of floats, level value information
+            (path to a file with one level value per line or list of
+            values), the same for every step
+        db: (optional), string, folder to store the databases in, the
+            database of step i is <db>/step<i>. Must be absolute path!
+            default: a folder called 'tmp' in the current directory
+        tile: (optional), int, number of cells along each edge of the
+            blocks. Default=64
+        tag_for_viz, norm, tags, lod, weld: (optional), see
+            create_geometry()
+        sname: (optional), str, name of the geometry file of each step.
+            Default name: isogeom.h5m
+        sdir: (optional), str, folder to write the geometry files to. If
+            provided, the file of step i is named <sname>_<i> (before the
+            extension). Default: the database folder of each step
+
+    Returns:
+    --------
+        geoms: list of strings, path to the geometry file of each step
+    """
+    # pymoab is only required to create the geometries
+    from IsogeomGenerator import isg, ivdb, series
+
+    if sname is None:
+        sname = 'isogeom.h5m'
+    geoms = []
+    with series.BlockCache() as cache:
+        for i, (filename, data) in enumerate(steps):
+            print("Series step {}: {}".format(i, filename))
+            iv = ivdb.IvDb(levels=levelinfo, data=data,
+                           db=db.rstrip("/") + "/step{}".format(i),
+                           cache=cache)
+            generate_volumes(iv, filename, backend='numpy', tile=tile)
+            print("...{} blocks reused, {} blocks extracted (the "
+                  "geometry is still created in full)".format(
+                      cache.reused, cache.extracted))
+
+            if sdir is None:
+                step_dir = iv.db
+                step_name = sname
+            else:
+                step_dir = sdir
+                root, ext = os.path.splitext(sname)
+                step_name = "{}_{}{}".format(root, i, ext)
+            create_geometry(isg.IsGm(ivdb=iv), tag_for_viz=tag_for_viz,
+                            norm=norm, tags=tags, sname=step_name,
+                            sdir=step_dir, lod=lod, weld=weld)
+            geoms.append(step_dir + "/" + step_name)
+    return geoms
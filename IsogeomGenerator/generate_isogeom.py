@@ -1,6 +1,8 @@
 import argparse
 import os
-from IsogeomGenerator import driver, isg, ivdb
+import shutil
+import tempfile
+from IsogeomGenerator import driver, isg, ivdb, plan
 
 """This is a script that can be installed for a user to easily run all the
 steps to create an isosurface geometry from a mesh file with scalar data from
@@ -49,9 +51,10 @@ def set_level_options(parser, moab):
         level_group.add_argument('-gl', '--generatelevels',
                                  action='store',
                                  nargs=1,
-                                 choices=['ratio', 'log', 'lin'],
+                                 choices=['ratio', 'log', 'lin',
+                                          'quantile', 'volume', 'surface'],
                                  default=[None],
-                                 metavar='ratio/log/lin',
+                                 metavar='MODE',
                                  type=str,
                                  help='Specifies the mode for generating ' +
                                  'level values to be used for the ' +
@@ -68,7 +71,21 @@ def set_level_options(parser, moab):
                                  'min and max values. ' +
                                  '(3) lin: N is the number of levels to be ' +
                                  'evenly spaced linearly between the min ' +
-                                 'and max values.'
+                                 'and max values. ' +
+                                 '(4) quantile: N is the number of levels ' +
+                                 'between the min and max values chosen so ' +
+                                 'that each band holds the same number of ' +
+                                 'mesh values. ' +
+                                 '(5) volume: N is the number of levels ' +
+                                 'between the min and max values chosen so ' +
+                                 'that each band has the same volume. ' +
+                                 '(6) surface: N is the number of levels ' +
+                                 'between the min and max values chosen so ' +
+                                 'that each band has roughly the same ' +
+                                 'number of boundary faces. ' +
+                                 'Modes 4-6 read the mesh to choose the ' +
+                                 'levels; volume and surface require a ' +
+                                 'Cartesian mesh with cell data.'
                                  )
         parser.add_argument('-lx', '--levelextrema',
                             action='store',
@@ -93,7 +110,7 @@ def set_level_options(parser, moab):
                             help='If generating levels (-gl), it is either ' +
                             'the ratio between adjacent level values (ratio ' +
                             'mode), or the number of levels to generate ' +
-                            '(log or lin mode).'
+                            '(all other modes).'
                             )
 
 
@@ -112,6 +129,189 @@ def set_visit_only_options(parser):
                         '(vtk format) that will be used to generate ' +
                         'isosurfaces.'
                         )
+    parser.add_argument('-j', '--jobs',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        default=[1],
+                        metavar='N',
+                        dest='jobs',
+                        type=int,
+                        help='Number of independent VisIt sessions to ' +
+                        'split the isovolume generation across. ' +
+                        'Default=1'
+                        )
+    parser.add_argument('-b', '--backend',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        choices=['visit', 'numpy'],
+                        default=['visit'],
+                        metavar='visit/numpy',
+                        dest='backend',
+                        type=str,
+                        help='Engine used to generate the isovolumes. ' +
+                        'visit: use the VisIt Isovolume operator for ' +
+                        'each level band. numpy: extract all isovolumes ' +
+                        'of a Cartesian mesh with cell data in a single ' +
+                        'pass without VisIt. Default=visit'
+                        )
+    parser.add_argument('-i', '--incremental',
+                        action='store_true',
+                        required=False,
+                        dest='incremental',
+                        help='If set, reuse an existing database and ' +
+                        'only regenerate the isovolumes whose level ' +
+                        'bounds changed since the previous run.'
+                        )
+    parser.add_argument('-T', '--tile',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        default=[None],
+                        metavar='N',
+                        dest='tile',
+                        type=int,
+                        help='Extract the isovolumes out of core in ' +
+                        'blocks of NxNxN cells (numpy backend only). ' +
+                        'Use for meshes that do not fit in memory.'
+                        )
+    parser.add_argument('--visit-np',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        default=[None],
+                        metavar='N',
+                        dest='engine_procs',
+                        type=int,
+                        help='Run a local parallel VisIt compute engine ' +
+                        'with N MPI ranks (started with mpirun) to ' +
+                        'extract the isovolumes (visit backend only).'
+                        )
+    parser.add_argument('--labeled',
+                        action='store_true',
+                        required=False,
+                        dest='labeled',
+                        help='If set, write all isovolumes to a single ' +
+                        'VTK file with a band label on every triangle ' +
+                        'instead of one STL file each (numpy backend ' +
+                        'only).'
+                        )
+    parser.add_argument('-p', '--preview',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        default=[None],
+                        metavar='FACTOR',
+                        dest='preview',
+                        type=int,
+                        help='Quick preview: merge blocks of FACTOR cells ' +
+                        'along each axis of a Cartesian mesh with cell ' +
+                        'data and run all steps on the coarse mesh.'
+                        )
+    parser.add_argument('--preview-method',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        choices=['mean', 'max'],
+                        default=['mean'],
+                        metavar='mean/max',
+                        dest='preview_method',
+                        type=str,
+                        help='Value of each merged block in preview mode. ' +
+                        'mean: volume weighted mean of the cells. max: ' +
+                        'maximum value of the cells. Default=mean'
+                        )
+    parser.add_argument('--bounds',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        default=[None],
+                        metavar='XMIN,YMIN,ZMIN,XMAX,YMAX,ZMAX',
+                        dest='bounds',
+                        type=parse_bounds,
+                        help='Region of interest: only use the cells of a ' +
+                        'Cartesian mesh with cell data whose centers are ' +
+                        'within these bounds. The outer faces of the ' +
+                        'cropped cells become the exterior of the ' +
+                        'geometry. Use --bounds=... if XMIN is negative.'
+                        )
+    parser.add_argument('--denoise',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        choices=['median', 'gaussian'],
+                        default=[None],
+                        metavar='median/gaussian',
+                        dest='denoise',
+                        type=str,
+                        help='Filter the cell data of a Cartesian mesh ' +
+                        'before the isovolumes are generated to remove ' +
+                        'the small regions created by statistical noise. ' +
+                        'median: median of the cells around each cell. ' +
+                        'gaussian: Gaussian weighted mean of the cells. ' +
+                        'The number of regions of each band before and ' +
+                        'after the filter is printed.'
+                        )
+    parser.add_argument('--denoise-size',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        default=[3],
+                        metavar='N',
+                        dest='denoise_size',
+                        type=int,
+                        help='Number of cells (odd) of the denoising ' +
+                        'kernel along each axis. Default=3'
+                        )
+
+
+def parse_bounds(value):
+    """Parse comma separated region of interest bounds.
+
+    Input:
+    ------
+        value: string, six values separated by commas,
+            'xmin,ymin,zmin,xmax,ymax,zmax'
+
+    Return:
+    -------
+        bounds: list of list of floats, [[xmin, ymin, zmin],
+            [xmax, ymax, zmax]]
+    """
+    try:
+        b = [float(f) for f in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "Bounds must be numbers: {}".format(value))
+    if len(b) != 6:
+        raise argparse.ArgumentTypeError(
+            "Bounds must be six values xmin,ymin,zmin,xmax,ymax,zmax: "
+            "{}".format(value))
+    if any(lo >= hi for lo, hi in zip(b[:3], b[3:])):
+        raise argparse.ArgumentTypeError(
+            "Lower bounds must be less than upper bounds: {}".format(value))
+    return [b[:3], b[3:]]
+
+
+def set_plan_only_options(parser):
+    """Set options specific to the planning mode.
+
+    Input:
+    ------
+        parser: ArgumentParser object to attach options to
+    """
+    parser.add_argument('-o', '--output',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        default=[None],
+                        metavar='REPORT',
+                        dest='output',
+                        type=str,
+                        help='Path of the JSON file to write the report ' +
+                        'to. If not set, the report is printed.'
+                        )
 
 
 def set_moab_only_options(parser):
@@ -178,6 +378,135 @@ def set_moab_only_options(parser):
                         'be tagged as float). ' +
                         'Option can be set more than once to set more tags.'
                         )
+    parser.add_argument('--lod',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        default=[None],
+                        metavar='F[,F,...]',
+                        dest='lod',
+                        type=parse_lod,
+                        help='Comma separated levels of detail to write ' +
+                        'in addition to the full geometry (.h5m only). ' +
+                        'Level of detail F keeps about 1/F of the ' +
+                        'triangles of every surface and is written to ' +
+                        '<geomfile>_lodF.h5m. Example: --lod 1,2,4'
+                        )
+    parser.add_argument('-w', '--weld',
+                        action='store_true',
+                        required=False,
+                        dest='weld',
+                        help='If set, coincident vertices of all ' +
+                        'isovolumes are merged when the database is read. ' +
+                        'Neighboring isovolumes then share the vertices ' +
+                        'of their common surfaces, which roughly halves ' +
+                        'the vertices in the geometry file.'
+                        )
+
+
+def parse_lod(value):
+    """Parse a comma separated list of level of detail factors.
+
+    Input:
+    ------
+        value: string, factors separated by commas, e.g. '1,2,4'
+
+    Return:
+    -------
+        lod: list of floats, level of detail factors
+    """
+    try:
+        lod = [float(f) for f in value.split(',') if f.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "Levels of detail must be numbers: {}".format(value))
+    if len(lod) == 0 or min(lod) < 1:
+        raise argparse.ArgumentTypeError(
+            "Levels of detail must be at least 1: {}".format(value))
+    return lod
+
+
+def set_series_only_options(parser):
+    """Set options specific to the series mode.
+
+    Input:
+    ------
+        parser: ArgumentParser object to attach options to
+    """
+    parser.add_argument('meshfile',
+                        action='store',
+                        nargs='+',
+                        type=str,
+                        help='Relative paths to the Cartesian mesh files ' +
+                        '(vtk format) of the series, in order. All meshes ' +
+                        'must have the same grid and cell data.'
+                        )
+    parser.add_argument('--series-data',
+                        action='store',
+                        nargs='+',
+                        required=False,
+                        default=None,
+                        metavar='DATANAME',
+                        dest='series_data',
+                        type=str,
+                        help='Name of the cell data of each mesh file, ' +
+                        'if it differs between the meshes. Default is ' +
+                        'dataname for every mesh file.'
+                        )
+    parser.add_argument('-T', '--tile',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        default=[64],
+                        metavar='N',
+                        dest='tile',
+                        type=int,
+                        help='Extract the isovolumes in blocks of NxNxN ' +
+                        'cells. Only the blocks that changed since the ' +
+                        'previous mesh are extracted again. Default=64'
+                        )
+
+
+def set_full_only_options(parser):
+    """Set options that need both the VisIt and MOAB steps.
+
+    Input:
+    ------
+        parser: ArgumentParser object to attach options to
+    """
+    parser.add_argument('-s', '--symmetry',
+                        action='store',
+                        nargs=1,
+                        required=False,
+                        default=[None],
+                        metavar='AXES',
+                        dest='symmetry',
+                        type=parse_symmetry,
+                        help='Axes normal to the symmetry planes of the ' +
+                        'data, e.g. x or xyz. Only the upper half of a ' +
+                        'Cartesian mesh with cell data along each axis is ' +
+                        'used and the geometry is mirrored back across the ' +
+                        'planes, which must be at the center of the mesh ' +
+                        'on a cell face.'
+                        )
+
+
+def parse_symmetry(value):
+    """Parse the axes normal to the symmetry planes.
+
+    Input:
+    ------
+        value: string, axes with optional commas, e.g. 'xy' or 'x,y'
+
+    Return:
+    -------
+        symmetry: list of strings, axes in x, y, z order
+    """
+    axes = value.replace(',', '').lower()
+    if len(axes) == 0 or any(a not in 'xyz' for a in axes):
+        raise argparse.ArgumentTypeError(
+            "Symmetry axes must be x, y, or z: {}".format(value))
+    return [a for a in 'xyz' if a in axes]
 
 
 def set_shared_options(parser, moab=False):
@@ -215,7 +544,8 @@ def set_shared_options(parser, moab=False):
 def parse_arguments():
     """Parse user args
 
-    There are three subparsers, one for each mode: full, visit, and moab.
+    There are five subparsers, one for each mode: full, visit, moab, plan,
+    and series.
     Full mode runs both the visit and moab steps. Each parser should have a
     full help message, simplified usage statement, and examples.
     """
@@ -253,6 +583,11 @@ different modes:
     moab: run only the second step using MOAB. This will generate a full DAGMC-
         compliant isosurface geometry starting from the database generated from
         the visit step.
+    plan: estimate the triangles, surfaces, memory, and run time of each step
+        from the Cartesian mesh file without running VisIt or MOAB.
+    series: run both steps for each mesh file of a series with the same grid,
+        only extracting the blocks of cells that changed since the previous
+        mesh file.
 """
     parser = argparse.ArgumentParser(description=mode_description,
                                      usage='generate_isogeom MODE [OPTIONS]',
@@ -294,6 +629,29 @@ Example Usage:
         the current directory:
 
         generate_isogeom full meshfile my_data -lf levelfile -db my_isogeom/
+
+    (4) Preview the geometry for a set of levels on a mesh that is coarsened
+        by merging blocks of 4x4x4 cells into their maximum value:
+
+        generate_isogeom full meshfile my_data -lf levelfile -p 4
+            --preview-method max -db my_preview/
+
+    (5) Create the geometry of just the region between -10 and 10 along
+        each axis:
+
+        generate_isogeom full meshfile my_data -lf levelfile
+            --bounds=-10,-10,-10,10,10,10
+
+    (6) Create the geometry of data that is symmetric about the center of
+        the mesh along x and y from one quarter of the mesh:
+
+        generate_isogeom full meshfile my_data -lf levelfile -s xy
+
+    (7) Remove the speckle isovolumes of noisy data with a median filter over
+        5x5x5 cells before creating the geometry:
+
+        generate_isogeom full meshfile my_data -lf levelfile --denoise median
+            --denoise-size 5
     """
     full_parser = subparsers.add_parser('full',
                                         description=full_description,
@@ -303,6 +661,7 @@ Example Usage:
     set_visit_only_options(full_parser)
     set_shared_options(full_parser)
     set_moab_only_options(full_parser)
+    set_full_only_options(full_parser)
     full_parser.set_defaults(which='full')
 
     # set visit only mode options
@@ -388,6 +747,79 @@ Example Usage:
     set_moab_only_options(moab_parser)
     moab_parser.set_defaults(which='moab')
 
+    # set plan mode options
+    plan_description = """
+Estimate the size of the geometry and the resources needed to generate it
+without running VisIt or MOAB. The mesh must be a Cartesian mesh with cell
+data. The number of triangles of each isovolume is counted from the faces
+where the level band changes on the grid. The peak MOAB memory and the run
+time of the generate_vols, separate_isovols, imprint_merge, and write_geometry
+stages are estimated from it and written as a JSON report.
+
+Levels information must be provided with either the -lf, -lv, or -gl option.
+"""
+    plan_usage = \
+        'generate_isogeom plan meshfile dataname [-lf/-lv/-gl] [OPTIONS]'
+    plan_examples = """
+Example Usage:
+    (1) Print the report for 15 levels spaced logarithmically between 1.0 and
+        2e+4 that will be generated with 8 VisIt sessions:
+
+        generate_isogeom plan meshfile my_data -gl log -lx 1.0 2.e4 -N 15 -j 8
+
+    (2) Write the report for the levels in 'levelfile' to 'plan.json':
+
+        generate_isogeom plan meshfile my_data -lf levelfile -o plan.json
+    """
+    plan_parser = subparsers.add_parser('plan',
+                                        description=plan_description,
+                                        usage=plan_usage,
+                                        epilog=plan_examples,
+                                        formatter_class=formatter)
+    set_visit_only_options(plan_parser)
+    set_shared_options(plan_parser)
+    set_plan_only_options(plan_parser)
+    plan_parser.set_defaults(which='plan')
+
+    # set series mode options
+    series_description = """
+Start-to-finish generation of a geometry for each Cartesian mesh file of a
+series, such as the iterations of a weight window process. All mesh files must
+have the same grid and cell data. The isovolumes are extracted without VisIt in
+blocks of cells and the blocks in which no band changed since the previous mesh
+file are reused. The database of each mesh file i is written to <db>/step<i>/.
+
+Levels information must be provided with either the -lf, -lv, or -gl option and
+is the same for every mesh file.
+"""
+    series_usage = \
+        'generate_isogeom series meshfile [meshfile ...] dataname ' + \
+        '[-lf/-lv/-gl] [OPTIONS]'
+    series_examples = """
+Example Usage:
+    (1) Create a geometry for each of three iterations with assigned level
+        values of 0.1 0.4 and 1.0 and write them to 'geoms/' as
+        ww_0.h5m, ww_1.h5m, and ww_2.h5m:
+
+        generate_isogeom series iter0.vtk iter1.vtk iter2.vtk my_data
+            -lv 0.1 0.4 1.0 -g ww.h5m -sp geoms/
+
+    (2) Compare blocks of 32x32x32 cells between iterations whose data is
+        named differently in each mesh file:
+
+        generate_isogeom series iter0.vtk iter1.vtk my_data -lf levelfile
+            --series-data ww_0 ww_1 -T 32
+    """
+    series_parser = subparsers.add_parser('series',
+                                          description=series_description,
+                                          usage=series_usage,
+                                          epilog=series_examples,
+                                          formatter_class=formatter)
+    set_series_only_options(series_parser)
+    set_shared_options(series_parser)
+    set_moab_only_options(series_parser)
+    series_parser.set_defaults(which='series')
+
     args = parser.parse_args()
     return args
 
@@ -423,16 +855,41 @@ def get_levels(args):
     elif args.generatelevels is not None:
         # option 3: generate levels
         check_level_gen(args)
-        minN = min(args.extN[0])
-        maxN = max(args.extN[0])
+        minN = min(args.extN)
+        maxN = max(args.extN)
         levels = driver.generate_levels(args.N[0], minN, maxN,
-                                        mode=args.generatelevels[0])
+                                        mode=args.generatelevels[0],
+                                        meshfile=args.meshfile[0],
+                                        data=args.dataname[0])
     else:
         raise RuntimeError("Mode for setting level information is not " +
                            "recognized")
     return levels
 
 
+def get_series_steps(args):
+    """Get the mesh file and data name of each step of a series.
+
+    Input:
+    ------
+        args: set of ArgumentParser args
+
+    Return:
+    -------
+        steps: list of (meshfile, dataname) tuples
+    """
+    meshes = args.meshfile
+    datas = args.series_data
+    if datas is None:
+        datas = args.dataname
+    if len(meshes) != len(datas) and 1 not in (len(meshes), len(datas)):
+        raise RuntimeError("{} mesh files and {} data names of the series "
+                           "do not match.".format(len(meshes), len(datas)))
+    nsteps = max(len(meshes), len(datas))
+    return [(meshes[min(i, len(meshes) - 1)], datas[min(i, len(datas) - 1)])
+            for i in range(nsteps)]
+
+
 def process_tags(tags):
     """Process the provided tag information to correct format.
 
@@ -461,9 +918,61 @@ def main():
     # get args
     args = parse_arguments()
 
+    # run on a cropped, filtered, and/or coarse copy of the mesh
+    scratch = tempfile.mkdtemp()
+    try:
+        if getattr(args, 'bounds', [None])[0] is not None:
+            args.meshfile[0] = driver.crop_mesh(args.meshfile[0],
+                                                args.dataname[0],
+                                                args.bounds[0],
+                                                dirname=scratch)
+        if getattr(args, 'symmetry', [None])[0] is not None:
+            args.meshfile[0] = driver.symmetric_mesh(args.meshfile[0],
+                                                     args.dataname[0],
+                                                     args.symmetry[0],
+                                                     dirname=scratch)
+
+        # levels are computed once, from the mesh region the geometry is
+        # made of (balanced level modes read the mesh data)
+        levels = get_levels(args)
+
+        if getattr(args, 'denoise', [None])[0] is not None:
+            args.meshfile[0], report = \
+                driver.denoise_mesh(args.meshfile[0], args.dataname[0],
+                                    levels, method=args.denoise[0],
+                                    size=args.denoise_size[0],
+                                    dirname=scratch)
+            for b, (n0, n1) in enumerate(zip(report['before'],
+                                             report['after'])):
+                print("band {}: {} regions before, {} after "
+                      "denoising".format(b, n0, n1))
+            print("{} regions removed by denoising".format(
+                report['removed']))
+        if getattr(args, 'preview', [None])[0] is not None:
+            args.meshfile[0] = \
+                driver.preview_mesh(args.meshfile[0], args.dataname[0],
+                                    args.preview[0],
+                                    method=args.preview_method[0],
+                                    dirname=scratch)
+        run(args, levels)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def run(args, levels=None):
+    """Run the steps of the selected mode.
+
+    Input:
+    ------
+        args: set of ArgumentParser args
+        levels: (optional), list of floats or string, level values or
+            path to a level file. Default: from the args (see
+            get_levels())
+    """
     # generate level info if necessary
     # levels is either a list of values or path to file
-    levels = get_levels(args)
+    if levels is None:
+        levels = get_levels(args)
 
     # get database information
     db = os.getcwd() + '/' + args.db[0]
@@ -473,13 +982,43 @@ def main():
 
     # run steps depending on mode
     mode = args.which
+    if mode == "plan":
+        tile = args.tile[0] if args.tile[0] is not None else 64
+        report = plan.estimate(args.meshfile[0], data, levels,
+                               backend=args.backend[0],
+                               workers=args.jobs[0], tile=tile,
+                               engine_procs=args.engine_procs[0])
+        plan.write_report(report, args.output[0])
+        return
+
+    if mode == "series":
+        if args.tags:
+            tags = process_tags(args.tags)
+        else:
+            tags = None
+        driver.generate_series(get_series_steps(args), levels, db=db,
+                               tile=args.tile[0],
+                               tag_for_viz=args.tagviz,
+                               norm=args.norm[0],
+                               tags=tags,
+                               sname=args.geomfile[0],
+                               sdir=args.savepath[0],
+                               lod=args.lod[0],
+                               weld=args.weld)
+        return
+
     visit_modes = ["full", "visit"]
     moab_modes = ["full", "moab"]
     iv = None  # initialize
 
     if mode in visit_modes:
         iv = ivdb.IvDb(levels=levels, data=data, db=db)
-        driver.generate_volumes(iv, args.meshfile[0])
+        driver.generate_volumes(iv, args.meshfile[0], workers=args.jobs[0],
+                                backend=args.backend[0],
+                                incremental=args.incremental,
+                                tile=args.tile[0],
+                                engine_procs=args.engine_procs[0],
+                                labeled=args.labeled)
 
     if mode in moab_modes:
         if args.tags:
@@ -489,7 +1028,7 @@ def main():
 
         # pass IvDb info if object exists from previous step
         if iv is not None:
-            ig = isg.IsGm(ivdb=iv)
+            ig = isg.IsGm(ivdb=iv, symmetry=args.symmetry[0])
         else:
             ig = isg.IsGm(levels=levels, data=data, db=db)
 
@@ -499,7 +1038,9 @@ def main():
                                norm=args.norm[0],
                                tags=tags,
                                sname=args.geomfile[0],
-                               sdir=args.savepath[0])
+                               sdir=args.savepath[0],
+                               lod=args.lod[0],
+                               weld=args.weld)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,44 @@
+"""Vectorized graph utilities shared by the grid transforms and the
+geometry surface separation.
+"""
+
+import numpy as np
+
+
+def label_components(n, first, second):
+    """Label the connected components of a graph with union-find. Every
+    component is labeled with its smallest node, found by linking the
+    roots of the two nodes of every edge at once and compressing all
+    paths until no edge joins two components.
+
+    Input:
+    ------
+        n: int, number of nodes
+        first: array of ints, first node of each edge
+        second: array of ints, second node of each edge
+
+    Returns:
+    --------
+        labels: array of ints (n), smallest node of the component of
+            each node
+    """
+    labels = np.arange(n)
+    first = np.asarray(first, dtype=np.int64)
+    second = np.asarray(second, dtype=np.int64)
+    while True:
+        a = labels[first]
+        b = labels[second]
+        joined = a != b
+        if not joined.any():
+            return labels
+        first = first[joined]
+        second = second[joined]
+        a = a[joined]
+        b = b[joined]
+        # link the larger root to the smaller one
+        np.minimum.at(labels, np.maximum(a, b), np.minimum(a, b))
+        while True:
+            compressed = labels[labels]
+            if np.array_equal(compressed, labels):
+                break
+            labels = compressed
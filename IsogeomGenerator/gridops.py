@@ -0,0 +1,299 @@
+"""Transforms of the cell values of Cartesian meshes arranged on a
+structured grid (see voxel.cartesian_grid()), and writing the transformed
+grid to a mesh file. Grids may be memory mapped and are read one slab of
+cells at a time.
+"""
+
+import numpy as np
+
+from IsogeomGenerator import graph, voxel
+
+
+def aggregate(grid, coords, factor, method='mean'):
+    """Coarsen a grid of cell values by merging blocks of factor cells
+    along each axis (smaller blocks at the upper ends if the number of
+    cells is not a multiple of factor). The grid is read one slab of
+    blocks at a time.
+
+    Input:
+    ------
+        grid: 3D array of floats, cell values (may be memory mapped)
+        coords: list of three arrays of floats, x, y, and z node
+            positions of the grid
+        factor: int, number of cells merged along each axis
+        method: (optional), string, 'mean' (default) for the volume
+            weighted mean or 'max' for the maximum value of each block
+
+    Returns:
+    --------
+        new_coords: list of three arrays of floats, node positions of
+            the coarse grid
+        new_grid: 3D array of floats, cell values of the coarse grid
+    """
+    if method not in ['mean', 'max']:
+        raise RuntimeError("Aggregation method {} not "
+                           "recognized.".format(method))
+    factor = int(factor)
+    if factor < 1:
+        raise RuntimeError("Aggregation factor must be at least 1.")
+    starts = [np.arange(0, n, factor) for n in grid.shape]
+    new_coords = [np.append(c[s], c[-1]) for c, s in zip(coords, starts)]
+    widths = [np.diff(c) for c in coords]
+
+    new_grid = np.empty(tuple(len(s) for s in starts))
+    for n, i in enumerate(starts[0]):
+        slab = np.asarray(grid[i:i + factor], dtype=np.float64)
+        if method == 'max':
+            block = np.maximum.reduceat(slab.max(axis=0), starts[1], axis=0)
+            new_grid[n] = np.maximum.reduceat(block, starts[2], axis=1)
+            continue
+        vol = np.einsum('i,j,k->ijk', widths[0][i:i + factor], widths[1],
+                        widths[2])
+        sums = slab * vol
+        for a in [1, 2]:
+            sums = np.add.reduceat(sums, starts[a], axis=a)
+            vol = np.add.reduceat(vol, starts[a], axis=a)
+        new_grid[n] = sums.sum(axis=0) / vol.sum(axis=0)
+    return new_coords, new_grid
+
+
+def crop(grid, coords, bounds):
+    """Cut the cells whose centers lie within a box out of a grid. The
+    faces of the outer cells that are kept are the new exterior of the
+    grid, so the box is snapped to the cell faces nearest to it.
+
+    Input:
+    ------
+        grid: 3D array of floats, cell values (may be memory mapped)
+        coords: list of three arrays of floats, x, y, and z node
+            positions of the grid
+        bounds: list of list of floats, minimum and maximum x, y, and z
+            of the box. Must be structured like
+            [[xmin, ymin, zmin], [xmax, ymax, zmax]]
+
+    Returns:
+    --------
+        new_coords: list of three arrays of floats, node positions of
+            the cropped grid
+        new_grid: 3D array of floats, cell values of the cropped grid (a
+            view of grid)
+    """
+    lower, upper = bounds
+    slices = []
+    for lo, hi, c in zip(lower, upper, coords):
+        if lo >= hi:
+            raise RuntimeError("Crop bounds {} are empty.".format(bounds))
+        c = np.asarray(c)
+        centers = (c[:-1] + c[1:]) / 2.
+        inside = np.nonzero((centers >= lo) & (centers <= hi))[0]
+        if len(inside) == 0:
+            raise RuntimeError("No cells within crop bounds "
+                               "{}.".format(bounds))
+        slices.append(slice(inside[0], inside[-1] + 1))
+    new_coords = [np.asarray(c)[s.start:s.stop + 1]
+                  for c, s in zip(coords, slices)]
+    return new_coords, grid[tuple(slices)]
+
+
+def symmetric_half(grid, coords, axes):
+    """Cut the upper half of a grid along each of the given axes. The
+    nodes of the grid must be symmetric about its center along these
+    axes and the center must be on a cell face, it is the lower extent
+    (the symmetry plane) of the half.
+
+    Input:
+    ------
+        grid: 3D array of floats, cell values (may be memory mapped)
+        coords: list of three arrays of floats, x, y, and z node
+            positions of the grid
+        axes: list of strings, axes ('x', 'y', or 'z') normal to the
+            symmetry planes
+
+    Returns:
+    --------
+        new_coords: list of three arrays of floats, node positions of
+            the half
+        new_grid: 3D array of floats, cell values of the half (a view of
+            grid)
+    """
+    new_coords = [np.asarray(c) for c in coords]
+    slices = [slice(None)] * 3
+    for axis in axes:
+        if axis not in voxel.AXES:
+            raise RuntimeError("Symmetry axis {} not "
+                               "recognized.".format(axis))
+        a = voxel.AXES.index(axis)
+        c = new_coords[a]
+        mid = len(c) // 2
+        if len(c) % 2 == 0 or \
+                not np.allclose(c + c[::-1], c[0] + c[-1]):
+            raise RuntimeError("Mesh is not symmetric about a {} plane "
+                               "on a cell face.".format(axis))
+        new_coords[a] = c[mid:]
+        slices[a] = slice(mid, None)
+    return new_coords, grid[tuple(slices)]
+
+
+def denoise(grid, method='median', size=3, out=None):
+    """Smooth a grid of cell values with a median or Gaussian filter to
+    suppress the small speckle regions that statistical noise creates
+    around the level values. The cells beyond the grid are taken as
+    copies of the outer cells. The grid is read and the filtered values
+    are written one slab of cells along x at a time.
+
+    Input:
+    ------
+        grid: 3D array of floats, cell values (may be memory mapped)
+        method: (optional), string, 'median' (default) for the median
+            of the size x size x size cells around each cell or
+            'gaussian' for a Gaussian weighted mean over the same cells
+            with a standard deviation of size/4 cells
+        size: (optional), odd int, number of cells of the filter kernel
+            along each axis. Default=3
+        out: (optional), 3D array of floats with the shape of the grid
+            (may be memory mapped), array to write the filtered values
+            to. Default: a new array in memory
+
+    Returns:
+    --------
+        new_grid: 3D array of floats, filtered cell values (out if
+            provided)
+    """
+    if method not in ['median', 'gaussian']:
+        raise RuntimeError("Denoising method {} not "
+                           "recognized.".format(method))
+    size = int(size)
+    if size < 1 or size % 2 == 0:
+        raise RuntimeError("Denoising kernel size must be a positive odd "
+                           "number, not {}.".format(size))
+    r = size // 2
+    nx, ny, nz = grid.shape
+    offsets = np.arange(-r, r + 1)
+    weights = np.exp(-0.5 * (offsets / (size / 4.)) ** 2)
+    weights /= weights.sum()
+
+    new_grid = np.empty(grid.shape) if out is None else out
+    for i in range(nx):
+        rows = np.clip(i + offsets, 0, nx - 1)
+        slab = np.pad(np.asarray(grid[rows], dtype=np.float64),
+                      ((0, 0), (r, r), (r, r)), mode='edge')
+        if method == 'median':
+            windows = [slab[:, j:j + ny, k:k + nz]
+                       for j in range(size) for k in range(size)]
+            new_grid[i] = np.median(np.concatenate(windows), axis=0)
+            continue
+        # the kernel is separable, filter along x, y, then z
+        plane = np.tensordot(weights, slab, axes=1)
+        plane = sum(w * plane[j:j + ny] for j, w in enumerate(weights))
+        new_grid[i] = sum(w * plane[:, k:k + nz]
+                          for k, w in enumerate(weights))
+    return new_grid
+
+
+def count_components(bands, nbands, levels=None):
+    """Count the face connected regions of cells of each band. The grid
+    is read one slab of cells along x at a time: the regions of a slab
+    are labeled and joined to the regions of the previous slab that they
+    touch, and a region is counted once the next slab does not continue
+    it.
+
+    Input:
+    ------
+        bands: 3D array of ints, band index per cell (may be memory
+            mapped)
+        nbands: int, total number of bands
+        levels: (optional), list of floats, if provided, bands holds the
+            cell values instead, which are classified against the levels
+            one slab at a time
+
+    Returns:
+    --------
+        counts: array of ints (nbands), number of regions of each band
+    """
+    nx, ny, nz = bands.shape
+    ids = np.arange(ny * nz).reshape(ny, nz)
+    counts = np.zeros(nbands, dtype=np.int64)
+    prev = None
+    for i in range(nx):
+        plane = np.asarray(bands[i])
+        if levels is not None:
+            plane = voxel.classify(plane, levels)
+
+        # regions of the slab, numbered from 0
+        first = []
+        second = []
+        for a in range(2):
+            lo = [slice(None)] * 2
+            hi = [slice(None)] * 2
+            lo[a] = slice(None, -1)
+            hi[a] = slice(1, None)
+            same = plane[tuple(lo)] == plane[tuple(hi)]
+            first.append(ids[tuple(lo)][same])
+            second.append(ids[tuple(hi)][same])
+        labels = graph.label_components(ny * nz, np.concatenate(first),
+                                        np.concatenate(second))
+        regions = np.unique(labels, return_inverse=True)[1].reshape(ny, nz)
+        nregions = int(regions.max()) + 1
+
+        if prev is not None:
+            prev_plane, prev_regions, prev_bands = prev
+            nprev = len(prev_bands)
+            # join the regions of both slabs through the faces between
+            # them, a group keeps the label of its first previous region
+            same = prev_plane == plane
+            groups = graph.label_components(nprev + nregions,
+                                            prev_regions[same],
+                                            regions[same] + nprev)
+            # groups without a region in this slab are complete
+            continued = np.zeros(nprev + nregions, dtype=bool)
+            continued[groups[nprev:]] = True
+            complete = np.unique(groups[:nprev][~continued[groups[:nprev]]])
+            counts += np.bincount(prev_bands[complete], minlength=nbands)
+            # regions of this slab joined through earlier slabs are one
+            regions = np.unique(groups[nprev:],
+                                return_inverse=True)[1].ravel()[regions]
+            nregions = int(regions.max()) + 1
+
+        region_bands = np.zeros(nregions, dtype=np.int64)
+        region_bands[regions.ravel()] = plane.ravel()
+        prev = (plane, regions, region_bands)
+
+    counts += np.bincount(prev[2], minlength=nbands)
+    return counts
+
+
+def write_rectilinear_vtk(filename, coords, grid, data):
+    """Write a grid of cell values to a binary legacy VTK rectilinear
+    grid file.
+
+    Input:
+    ------
+        filename: string, path of the file to write
+        coords: list of three arrays of floats, x, y, and z node
+            positions of the grid
+        grid: 3D array of floats, cell values indexed by [i, j, k] (may
+            be memory mapped)
+        data: string, name of the cell data
+    """
+    with open(filename, 'wb') as f:
+        f.write("# vtk DataFile Version 3.0\n"
+                "IsogeomGenerator rectilinear grid\n"
+                "BINARY\n"
+                "DATASET RECTILINEAR_GRID\n"
+                "DIMENSIONS {} {} {}\n".format(*[len(c) for c in coords])
+                .encode('ascii'))
+        for name, c in zip(['X', 'Y', 'Z'], coords):
+            f.write("{}_COORDINATES {} double\n".format(name, len(c))
+                    .encode('ascii'))
+            f.write(np.asarray(c, dtype='>f8').tobytes())
+            f.write("\n".encode('ascii'))
+        f.write("CELL_DATA {}\n"
+                "SCALARS {} double 1\n"
+                "LOOKUP_TABLE default\n".format(grid.size, data)
+                .encode('ascii'))
+        # cells are ordered with x changing fastest, written one slab of
+        # cells along z at a time
+        for k in range(grid.shape[2]):
+            f.write(np.asarray(grid[:, :, k], dtype='>f8').transpose()
+                    .tobytes())
+        f.write("\n".encode('ascii'))
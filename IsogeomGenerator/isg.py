@@ -6,6 +6,7 @@ import numpy as np
 import math as m
 
 from isg_gen import IsoGeomGen
+from IsogeomGenerator import graph, voxel
 
 from pymoab import core, types
 from pymoab.rng import Range, unite
@@ -27,13 +28,17 @@ class IsGm(IsoGeomGen):
             surface, and volume entity handles to each other.
         val_tag: MOAB tag entity handle, tag for surface value
         sense_tag: MOAB tag entity handle, tag for surface sense
+        symmetry: list of strings, axes ('x', 'y', or 'z') normal to the
+            symmetry planes of the geometry (None if not symmetric)
+        welded: bool, True if coincident vertices of all isovolumes were
+            merged when the database was read
 
     Methods:
     --------
     """
 
     def __init__(self, ivdb=None, levels=None, data=None, db=None,
-                 extents=None):
+                 extents=None, symmetry=None):
         """Create IsGm object. Information provided by an ivdb object
         will overwrite other data provided.
 
@@ -49,9 +54,21 @@ class IsGm(IsoGeomGen):
             extents: (optional) list of list of floats, minimum and
                 maximum values for x, y, and z in mesh. Must be
                 structured like [[xmin, ymin, zmin], [xmax, ymax, zmax]]
+            symmetry: (optional), list of strings, axes ('x', 'y', or
+                'z') normal to the symmetry planes. The database holds the
+                upper half of the geometry along each axis, whose lower
+                extent is the symmetry plane (see driver.symmetric_mesh()),
+                and reflect() mirrors it across the planes.
         """
         # initialize variables
         super(IsGm, self).__init__(levels, data, db, extents)
+        self.symmetry = symmetry
+        self.welded = False
+
+        # surfaces tagged as interior and surfaces with a value and sense
+        # tag, so the tags do not have to be read back from MOAB
+        self.__interior_surfs = set()
+        self.__tagged_surfs = set()
 
         # if ivdb object is provided, overwrite with that info
         if ivdb is not None:
@@ -93,51 +110,162 @@ class IsGm(IsoGeomGen):
         self.zmin = ivdb.zmin
         self.zmax = ivdb.zmax
 
-    def read_database(self):
+    def read_database(self, weld=False):
         """Read the files from the database and initialize the meshset info.
+        The database has either one STL file per isovolume or a single
+        VTK file with a band label on every triangle, which is split into
+        one file set per label.
+
+        Input:
+        ------
+            weld: (optional), bool, if True, merge the coincident vertices
+                of all isovolumes so that the surfaces shared by
+                neighboring isovolumes use the same vertices.
+                Default=False
         """
         # check that levels exist:
         if self.levels is None:
             raise RuntimeError("Object must have levels defined.")
 
-        # check there are correct number of files:
         file_list = sorted(os.listdir(self.db + "/vols/"))
-        if len(self.levels) != len(file_list):
-            raise RuntimeError("Number of levels does not match number of " +
-                               "isovolume files in the database.")
+        if file_list == [voxel.LABELED_FILE]:
+            self.__read_labeled(self.db + "/vols/" + voxel.LABELED_FILE)
+        else:
+            # check there are correct number of files:
+            if len(self.levels) != len(file_list):
+                raise RuntimeError("Number of levels does not match number "
+                                   "of isovolume files in the database.")
+
+            # read files
+            for f in file_list:
+                # get file name
+                fpath = self.db + "/vols/" + f
+                i = int(f.strip(".stl"))  # must be an integer
+
+                # load file and create EH for file-set
+                fs = self.mb.create_meshset()
+                self.mb.load_file(fpath, file_set=fs)
+                self.__add_isovol(i, fs)
 
-        # read files
-        for f in file_list:
-            # get file name
-            fpath = self.db + "/vols/" + f
-            i = int(f.strip(".stl"))  # must be an integer
+        if weld:
+            self.__weld()
 
-            # load file and create EH for file-set
+    def __read_labeled(self, fpath):
+        """Read the single labeled isovolume file and create a file set
+        with the vertices and triangles of each band.
+
+        Input:
+        ------
+            fpath: string, path to the labeled VTK file
+        """
+        points, conn, labels = voxel.read_labeled_vtk(fpath)
+        counts = np.bincount(labels, minlength=len(self.levels))
+        if len(counts) != len(self.levels) or np.any(counts == 0):
+            raise RuntimeError("Number of levels does not match number of "
+                               "isovolumes in the database.")
+
+        order = np.argsort(labels, kind='mergesort')
+        splits = np.cumsum(counts)[:-1]
+        for i, band_conn in enumerate(np.split(conn[order], splits)):
+            # vertices of the band and triangle connectivity in handles
+            used, local = np.unique(band_conn, return_inverse=True)
+            verts = self.mb.create_vertices(points[used].flatten())
+            handles = np.array(list(verts), dtype=np.uint64)
+            tris = self.mb.create_elements(types.MBTRI,
+                                           handles[local.reshape(-1, 3)])
             fs = self.mb.create_meshset()
-            self.mb.load_file(fpath, file_set=fs)
-
-            # initiate dictionary
-            iv_info = (i, fs)
-            self.isovol_meshsets[iv_info] = {}
-
-            # add value min/max info (min, max)
-            if i == 0:
-                self.isovol_meshsets[iv_info]['bounds'] =\
-                    (None, self.levels[i])
-            elif i == len(self.levels):
-                self.isovol_meshsets[iv_info]['bounds'] =\
-                    (self.levels[i - 1], None)
-            else:
-                self.isovol_meshsets[iv_info]['bounds'] =\
-                    (self.levels[i - 1], self.levels[i])
+            self.mb.add_entities(fs, verts)
+            self.mb.add_entities(fs, tris)
+            self.__add_isovol(i, fs)
+
+    def __weld(self):
+        """Merge the coincident vertices of all isovolumes. The first
+        vertex at each coordinate is kept, the triangles that use any
+        other vertex at that coordinate are replaced by triangles that
+        use the kept vertex, and the other vertices are deleted. All
+        coordinates are compared at once with a single sort.
+        """
+        ivs = sorted(self.isovol_meshsets.keys())
+        all_tris = [self.mb.get_entities_by_type(iv[1], types.MBTRI)
+                    for iv in ivs]
+        all_conn = [np.reshape(self.mb.get_connectivity(t), (-1, 3))
+                    for t in all_tris]
+        handles = np.unique(np.concatenate([c.ravel() for c in all_conn]))
+        if len(handles) == 0:
+            return
+
+        # kept vertex of every vertex
+        # adding 0. makes -0. and 0. the same coordinate
+        coords = np.reshape(self.mb.get_coords(handles), (-1, 3)) + 0.
+        first, inv = np.unique(coords, axis=0, return_index=True,
+                               return_inverse=True)[1:]
+        kept = handles[first][inv.ravel()]
+        dup = kept != handles
+
+        if np.any(dup):
+            for iv, tris, conn in zip(ivs, all_tris, all_conn):
+                fs = iv[1]
+                idx = np.searchsorted(handles, conn)
+                moved = np.any(dup[idx], axis=1)
+                if not np.any(moved):
+                    continue
+                old_tris = Range(np.fromiter(tris, dtype=np.uint64,
+                                             count=len(tris))[moved])
+                new_tris = self.mb.create_elements(types.MBTRI,
+                                                   kept[idx[moved]])
+                self.mb.remove_entities(fs, old_tris)
+                self.mb.delete_entities(old_tris)
+                self.mb.add_entities(fs, new_tris)
+                self.mb.add_entities(fs, Range(kept[np.unique(idx[moved])]))
+                self.mb.remove_entities(fs, Range(handles[dup]))
+            self.mb.delete_entities(Range(handles[dup]))
+        self.welded = True
+
+    def __add_isovol(self, i, fs):
+        """Add the file set of an isovolume and its value bounds to the
+        meshset info.
 
-    def separate_isovols(self):
+        Input:
+        ------
+            i: int, index of the isovolume
+            fs: EntityHandle, file set of the isovolume
+        """
+        # initiate dictionary
+        iv_info = (i, fs)
+        self.isovol_meshsets[iv_info] = {}
+
+        # add value min/max info (min, max)
+        if i == 0:
+            self.isovol_meshsets[iv_info]['bounds'] =\
+                (None, self.levels[i])
+        elif i == len(self.levels):
+            self.isovol_meshsets[iv_info]['bounds'] =\
+                (self.levels[i - 1], None)
+        else:
+            self.isovol_meshsets[iv_info]['bounds'] =\
+                (self.levels[i - 1], self.levels[i])
+
+    def separate_isovols(self, tol=0.):
         """Split isosurfaces into different surfaces for exterior vs
         interior surfaces. Exterior surfaces are those in which full
         triangles are on the planes defining the bounding box of the
         geometry. For each isovolume in the database, separate any disjoint
         surfaces into unique single surfaces.
+
+        Input:
+        ------
+            tol: (optional), float, distance from a plane of the bounding
+                box within which the centroid of a triangle is on the
+                exterior. Default=0. (exactly on the plane)
         """
+        surf_type_tag = \
+            self.mb.tag_get_handle('SURF_TYPE', size=32,
+                                   tag_type=types.MB_TYPE_OPAQUE,
+                                   storage_type=types.MB_TAG_SPARSE,
+                                   create_if_missing=True)
+        all_ext = []
+        all_int = []
+        verts_deleted = set()
         for iv_info in self.isovol_meshsets.keys():
             # extract isovolume information
             iso_id = iv_info[0]
@@ -145,19 +273,10 @@ class IsGm(IsoGeomGen):
 
             print("separating isovolume {}".format(iso_id))
 
-            # get all triangles and check if the centroid is on an
-            # exterior surface.
-            all_tris = self.mb.get_entities_by_type(fs, types.MBTRI)
-            tris_exterior = []
-            tris_interior = []
-            for tri in all_tris:
-                tri_verts = self.mb.get_connectivity(Range(tri))
-                coords = self.mb.get_coords(tri_verts)
-                centroid = self.__calc_centroid(coords)
-                if self.__check_exterior(centroid):
-                    tris_exterior.append(tri)
-                else:
-                    tris_interior.append(tri)
+            # sort all triangles by whether their centroid is on an
+            # exterior surface
+            tris_interior, tris_exterior, tris_symmetry = \
+                self.__classify_tris(fs, tol)
 
             # get all interior and exterior vertices
             verts_interior = self.mb.get_adjacencies(
@@ -165,6 +284,19 @@ class IsGm(IsoGeomGen):
             verts_exterior = self.mb.get_adjacencies(
                 tris_exterior, 0, op_type=1)
 
+            # triangles on a symmetry plane are inside of the mirrored
+            # geometry, delete them and the vertices only they use
+            if len(tris_symmetry) > 0:
+                verts_symmetry = \
+                    set(self.mb.get_adjacencies(tris_symmetry, 0,
+                                                op_type=1)) - \
+                    set(verts_interior) - set(verts_exterior)
+                verts_symmetry = list(verts_symmetry)
+                self.mb.remove_entities(fs, tris_symmetry)
+                self.mb.remove_entities(fs, verts_symmetry)
+                self.mb.delete_entities(tris_symmetry)
+                verts_deleted.update(verts_symmetry)
+
             # create interior and exterior surface meshsets
             surf_exterior = self.mb.create_meshset()
             self.mb.add_entities(surf_exterior, tris_exterior)
@@ -179,22 +311,31 @@ class IsGm(IsoGeomGen):
             ext_surfs = self.__separate(surf_exterior)
             int_surfs = self.__separate(surf_interior)
 
-            # tag the surfaces with whether they are interior or exterior
-            surf_type_tag = \
-                self.mb.tag_get_handle('SURF_TYPE', size=32,
-                                       tag_type=types.MB_TYPE_OPAQUE,
-                                       storage_type=types.MB_TAG_SPARSE,
-                                       create_if_missing=True)
-            for s in ext_surfs:
-                self.mb.tag_set_data(surf_type_tag, s, 'exterior')
-            for s in int_surfs:
-                self.mb.tag_set_data(surf_type_tag, s, 'interior')
+            all_ext.extend(ext_surfs)
+            all_int.extend(int_surfs)
 
             # store separate surface entity handles
             self.isovol_meshsets[iv_info]['surfs_EH'] = []
             self.isovol_meshsets[iv_info]['surfs_EH'].extend(ext_surfs)
             self.isovol_meshsets[iv_info]['surfs_EH'].extend(int_surfs)
 
+        # delete the vertices only used by symmetry plane triangles, a
+        # welded vertex can still be used by another isovolume
+        if self.welded:
+            for iv_info in self.isovol_meshsets.keys():
+                tris = self.mb.get_entities_by_type(iv_info[1], types.MBTRI)
+                verts_deleted.difference_update(
+                    self.mb.get_connectivity(tris))
+        if len(verts_deleted) > 0:
+            self.mb.delete_entities(list(verts_deleted))
+
+        # tag all surfaces with whether they are interior or exterior
+        if len(all_ext) + len(all_int) > 0:
+            self.mb.tag_set_data(surf_type_tag, all_ext + all_int,
+                                 ['exterior'] * len(all_ext) +
+                                 ['interior'] * len(all_int))
+        self.__interior_surfs.update(all_int)
+
     def imprint_merge(self, norm):
         """Uses PyMOAB to check if surfaces are coincident. Creates a
         single surface where surfaces are coincident values are tagged
@@ -214,29 +355,47 @@ class IsGm(IsoGeomGen):
 
         # if a surface doesn't have a value tagged after merging
         # give it a value of 0 and tag forward sense
+        untagged = []
+        senses = []
         for isovol in all_vols:
+            vol_tris = None
             for surf in self.isovol_meshsets[isovol]['surfs_EH']:
-
-                # tag val=0
-                try:
-                    val = self.mb.tag_get_data(self.val_tag, surf)
-                except:
-                    val = 0.0
-                    self.mb.tag_set_data(self.val_tag, surf, val)
-                    verts = \
-                        self.mb.get_entities_by_type(surf,
-                                                     types.MBVERTEX)
-                    tris = self.__get_surf_triangles(verts)
-                    self.mb.add_entities(surf, tris)
-
-                # tag fwd sense
-                try:
-                    sense = self.mb.tag_get_data(self.sense_tag, surf)
-                except:
-                    fwd = isovol[1]
-                    bwd = np.uint64(0)
-                    self.mb.tag_set_data(self.sense_tag,
-                                         surf, [fwd, bwd])
+                if surf in self.__tagged_surfs:
+                    continue
+                untagged.append(surf)
+                senses.append([isovol[1], 0])
+                verts = \
+                    self.mb.get_entities_by_type(surf, types.MBVERTEX)
+                tris = self.__get_surf_triangles(verts)
+                if self.welded:
+                    # welded vertices are also used by the triangles
+                    # of the neighboring isovolumes
+                    if vol_tris is None:
+                        vol_tris = set(self.mb.get_entities_by_type(
+                            isovol[1], types.MBTRI))
+                    tris = [t for t in tris if t in vol_tris]
+                self.mb.add_entities(surf, tris)
+        self.__tag_surfs(untagged, np.zeros(len(untagged)), senses)
+
+    def reflect(self):
+        """Mirror the geometry across each of its symmetry planes, the
+        lower extents of the geometry along the symmetry axes. A surface
+        that touches a plane gets its mirrored triangles, which share its
+        vertices on the plane, so the surfaces cut by the plane are
+        welded back together. Any other surface gets a mirrored copy
+        with the same value, senses, and type. The extents are updated
+        to those of the full geometry.
+        """
+        if self.symmetry is None:
+            return
+        for axis in self.symmetry:
+            if axis not in voxel.AXES:
+                raise RuntimeError("Symmetry axis {} not "
+                                   "recognized.".format(axis))
+            if getattr(self, axis + 'min') is None:
+                raise RuntimeError("Reflecting the geometry requires the "
+                                   "extents of the mesh.")
+            self.__reflect(axis)
 
     def make_family(self):
         """Makes the correct parent-child relationships with volumes
@@ -260,49 +419,63 @@ class IsGm(IsoGeomGen):
                                    storage_type=types.MB_TAG_SPARSE,
                                    create_if_missing=True)
 
-        vol_id = 0
-        surf_id = 0
-        completed_surf_list = []
+        vol_list = []
+        surf_list = []
+        completed_surfs = set()
         for v in self.isovol_meshsets.keys():
             vol_eh = v[1]
-
-            # tag volume
-            self.mb.tag_set_data(geom_dim, vol_eh, 3)
-            self.mb.tag_set_data(category, vol_eh, 'Volume')
-            vol_id += 1
-            self.mb.tag_set_data(global_id, vol_eh, vol_id)
+            vol_list.append(vol_eh)
 
             for surf_eh in self.isovol_meshsets[v]['surfs_EH']:
                 # create relationship
                 self.mb.add_parent_child(vol_eh, surf_eh)
 
-                # tag surfaces (if not already done)
-                if surf_eh not in completed_surf_list:
-                    self.mb.tag_set_data(geom_dim, surf_eh, 2)
-                    self.mb.tag_set_data(category, surf_eh, 'Surface')
-                    surf_id += 1
-                    self.mb.tag_set_data(global_id, surf_eh, surf_id)
-                    completed_surf_list.append(surf_eh)
+                # surfaces are numbered in order of first appearance
+                if surf_eh not in completed_surfs:
+                    surf_list.append(surf_eh)
+                    completed_surfs.add(surf_eh)
+
+        # tag all volumes and surfaces at once
+        nvols = len(vol_list)
+        nsurfs = len(surf_list)
+        if nvols + nsurfs == 0:
+            return
+        ents = vol_list + surf_list
+        self.mb.tag_set_data(geom_dim, ents,
+                             np.repeat(np.array([3, 2], dtype=np.int32),
+                                       [nvols, nsurfs]))
+        self.mb.tag_set_data(category, ents,
+                             ['Volume'] * nvols + ['Surface'] * nsurfs)
+        self.mb.tag_set_data(global_id, ents,
+                             np.concatenate([np.arange(1, nvols + 1),
+                                             np.arange(1, nsurfs + 1)]
+                                            ).astype(np.int32))
 
     def tag_for_viz(self):
         """Tags all triangles on all surfaces with the data value for
         that surface. This is for vizualization purposes.
         """
+        surfs = []
         for isovol in self.isovol_meshsets.keys():
-            for surf in self.isovol_meshsets[isovol]['surfs_EH']:
-                # get the tagged data
-                val = self.mb.tag_get_data(self.val_tag, surf)
-
-                # get the triangles
-                tris = self.mb.get_entities_by_type(surf,
-                                                    types.MBTRI)
-
-                # create data array
-                num = len(tris)
-                data = np.full((num), val)
-
-                # tag the data
-                self.mb.tag_set_data(self.val_tag, tris, data)
+            surfs.extend(self.isovol_meshsets[isovol]['surfs_EH'])
+        surfs = sorted(set(surfs))
+        if len(surfs) == 0:
+            return
+
+        # get the tagged data of all surfaces
+        vals = self.mb.tag_get_data(self.val_tag, surfs, flat=True)
+
+        # get the triangles
+        tris = [self.mb.get_entities_by_type(surf, types.MBTRI)
+                for surf in surfs]
+        sizes = [len(t) for t in tris]
+        if sum(sizes) == 0:
+            return
+        tris = np.concatenate([np.fromiter(t, dtype=np.uint64, count=len(t))
+                               for t in tris])
+
+        # tag the data
+        self.mb.tag_set_data(self.val_tag, tris, np.repeat(vals, sizes))
 
     def set_tags(self, tags):
         """Set provided tag values on the root set.
@@ -366,9 +539,120 @@ class IsGm(IsoGeomGen):
         self.mb.write_file(save_location, all_meshsets)
         print("Geometry file written to {}.".format(save_location))
 
+    def __reflect(self, axis):
+        """Mirror all surfaces of the geometry across the symmetry plane
+        normal to an axis.
+
+        Input:
+        ------
+            axis: string, 'x', 'y', or 'z'
+        """
+        a = voxel.AXES.index(axis)
+        plane = getattr(self, axis + 'min')
+        surf_type_tag = \
+            self.mb.tag_get_handle('SURF_TYPE', size=32,
+                                   tag_type=types.MB_TYPE_OPAQUE,
+                                   storage_type=types.MB_TAG_SPARSE,
+                                   create_if_missing=True)
+
+        # unique surfaces, merged surfaces belong to two isovolumes
+        all_vols = sorted(self.isovol_meshsets.keys())
+        surfs = []
+        seen = set()
+        for isovol in all_vols:
+            for surf in self.isovol_meshsets[isovol]['surfs_EH']:
+                if surf not in seen:
+                    surfs.append(surf)
+                    seen.add(surf)
+
+        # mirror every vertex, vertices on the plane are their own image
+        tris = Range()
+        for surf in surfs:
+            tris = unite(tris, self.mb.get_entities_by_type(surf,
+                                                            types.MBTRI))
+        verts = self.mb.get_adjacencies(tris, 0, op_type=1)
+        handles = np.array(list(verts), dtype=np.uint64)
+        coords = self.mb.get_coords(verts).reshape(-1, 3)
+        order = np.argsort(handles)
+        handles = handles[order]
+        coords = coords[order]
+        on_plane = np.float32(coords[:, a]) == np.float32(plane)
+        images = handles.copy()
+        if not np.all(on_plane):
+            new_coords = coords[~on_plane]
+            new_coords[:, a] = 2. * plane - new_coords[:, a]
+            images[~on_plane] = np.array(
+                list(self.mb.create_vertices(new_coords.flatten())),
+                dtype=np.uint64)
+
+        # mirror the triangles of each surface, two vertices are swapped
+        # so that the mirrored triangles face the same volumes
+        new_surfs = {}
+        old_tris = []
+        new_tris = []
+        for surf in surfs:
+            surf_tris = self.mb.get_entities_by_type(surf, types.MBTRI)
+            if len(surf_tris) == 0:
+                continue
+            idx = np.searchsorted(handles,
+                                  self.mb.get_connectivity(surf_tris))
+            idx = idx.reshape(-1, 3)
+            mirrored = self.mb.create_elements(types.MBTRI,
+                                               images[idx][:, [0, 2, 1]])
+            old_tris.extend(list(surf_tris))
+            new_tris.extend(list(mirrored))
+
+            if np.any(on_plane[idx]):
+                # weld to the original surface
+                target = surf
+            else:
+                target = self.mb.create_meshset()
+                new_surfs[surf] = target
+            self.mb.add_entities(target, mirrored)
+            self.mb.add_entities(target, list(images[np.unique(idx)]))
+
+        # copy the value, senses, and type of each surface to its copy
+        if len(new_surfs) > 0:
+            sources = list(new_surfs.keys())
+            targets = [new_surfs[surf] for surf in sources]
+            for tag in [self.val_tag, self.sense_tag, surf_type_tag]:
+                self.mb.tag_set_data(tag, targets,
+                                     self.mb.tag_get_data(tag, sources))
+            for surf, target in new_surfs.items():
+                if surf in self.__interior_surfs:
+                    self.__interior_surfs.add(target)
+                if surf in self.__tagged_surfs:
+                    self.__tagged_surfs.add(target)
+
+        # add the mirrored entities and surfaces to the isovolumes
+        old_tris = np.array(old_tris, dtype=np.uint64)
+        new_tris = np.array(new_tris, dtype=np.uint64)
+        order = np.argsort(old_tris)
+        old_tris = old_tris[order]
+        new_tris = new_tris[order]
+        for isovol in all_vols:
+            fs = isovol[1]
+            for ents, old, new in [(types.MBTRI, old_tris, new_tris),
+                                   (types.MBVERTEX, handles, images)]:
+                members = np.array(list(self.mb.get_entities_by_type(fs,
+                                                                     ents)),
+                                   dtype=np.uint64)
+                if len(members) == 0 or len(old) == 0:
+                    continue
+                idx = np.minimum(np.searchsorted(old, members), len(old) - 1)
+                found = old[idx] == members
+                self.mb.add_entities(fs, list(new[idx[found]]))
+            surfs_eh = self.isovol_meshsets[isovol]['surfs_EH']
+            surfs_eh.extend([new_surfs[surf] for surf in surfs_eh
+                             if surf in new_surfs])
+
+        setattr(self, axis + 'min', 2. * plane - getattr(self, axis + 'max'))
+
     def __separate(self, ms):
         """For a given surface meshset, separate meshset into unique and
-        disjoint surfaces based on their connectedness.
+        disjoint surfaces based on their connectedness. The vertices are
+        labeled by connected component in one pass over the connectivity
+        of all triangles of the meshset (see graph.label_components()).
 
         Input:
         ------
@@ -377,62 +661,53 @@ class IsGm(IsoGeomGen):
         Returns:
         --------
             surf_list: list of entity handles for the set of unique and
-                disjoint surfaces in the meshset
+                disjoint surfaces in the meshset, ordered by their first
+                vertex
         """
         surf_list = []
 
-        # get set of all vertices for the isosurface
-        remaining_verts = self.mb.get_entities_by_type(ms, types.MBVERTEX)
-        all_tris = set(self.mb.get_entities_by_type(ms, types.MBTRI))
-
-        while len(remaining_verts) > 0:
-            # get full set of connected verts starting from a seed
-            region_verts = [remaining_verts[0]]
-            boundary_verts = [remaining_verts[0]]
-            expanded_region = set(region_verts[:])
-
-            # gather set of all vertices that are connected to the seed
-            while True:
-                # check adjancency and connectedness of new vertices
-                new_connected_verts = \
-                    self.mb.get_adjacencies(self.mb.get_adjacencies(
-                                            boundary_verts, 2, op_type=1),
-                                            0, op_type=1)
-
-                # add newly found verts to all list
-                # only store verts that are present in the full surface
-                expanded_region.update(
-                    set(new_connected_verts) & set(remaining_verts))
-
-                # check if different from already found verts
-                if len(expanded_region) == len(region_verts):
-                    # no more vertices are connected, so full surface
-                    # has been found
-                    break
-                else:
-                    # update vertices list to check only newly found
-                    # vertices
-                    boundary_verts = expanded_region.difference(region_verts)
-                    region_verts = list(expanded_region)
-
-            # get the connected set of triangles that make the single
-            # surface and store into a unique meshset
-            tris = self.__get_surf_triangles(region_verts)
-            # only include tris that already exist in the full meshset
-            tris = list(set(tris) & all_tris)
+        # get all triangles and vertices of the isosurface
+        all_tris = self.mb.get_entities_by_type(ms, types.MBTRI)
+        all_verts = self.mb.get_entities_by_type(ms, types.MBVERTEX)
+        if len(all_verts) == 0:
+            return surf_list
+        tris = np.fromiter(all_tris, dtype=np.uint64, count=len(all_tris))
+        verts = np.sort(np.fromiter(all_verts, dtype=np.uint64,
+                                    count=len(all_verts)))
+        conn = np.reshape(self.mb.get_connectivity(all_tris), (-1, 3))
+
+        # only keep the triangles with all vertices in the meshset
+        idx = np.minimum(np.searchsorted(verts, conn), len(verts) - 1)
+        inside = np.all(verts[idx] == conn, axis=1)
+        tris = tris[inside]
+        idx = idx[inside]
+
+        # label the vertices connected by the triangles, each surface is
+        # labeled with its first vertex
+        labels = graph.label_components(
+            len(verts), np.concatenate([idx[:, 0], idx[:, 0]]),
+            np.concatenate([idx[:, 1], idx[:, 2]]))
+        roots, vert_surf = np.unique(labels, return_inverse=True)
+        tri_surf = vert_surf[idx[:, 0]]
+
+        # group the triangles and vertices of each surface
+        vert_groups = np.split(verts[np.argsort(vert_surf, kind='stable')],
+                               np.cumsum(np.bincount(vert_surf))[:-1])
+        tri_groups = np.split(tris[np.argsort(tri_surf, kind='stable')],
+                              np.cumsum(np.bincount(tri_surf,
+                                                    minlength=len(roots)))
+                              [:-1])
+
+        # store each connected surface into a unique meshset
+        for surf_tris, surf_verts in zip(tri_groups, vert_groups):
             surf = self.mb.create_meshset()
-            self.mb.add_entities(surf, tris)
-            self.mb.add_entities(surf, region_verts)
-
-            # store surfaces in completed list
+            self.mb.add_entities(surf, Range(surf_tris))
+            self.mb.add_entities(surf, Range(surf_verts))
             surf_list.append(surf)
 
-            # remove surface from original meshset
-            self.mb.remove_entities(ms, tris)
-            self.mb.remove_entities(ms, region_verts)
-
-            # resassign vertices that remain
-            remaining_verts = self.mb.get_entities_by_type(ms, types.MBVERTEX)
+        # remove surfaces from original meshset
+        self.mb.remove_entities(ms, Range(tris))
+        self.mb.remove_entities(ms, all_verts)
 
         return surf_list
 
@@ -453,17 +728,18 @@ class IsGm(IsoGeomGen):
                 which all three vertices are in the verts list.
         """
         tris_all = self.mb.get_adjacencies(verts_good, 2, op_type=1)
-        verts_all = self.mb.get_connectivity(tris_all)
-        verts_bad = set(verts_all) - set(verts_good)
-
-        if verts_bad:
-            # not an empty set
-            tris_bad = self.mb.get_adjacencies(list(verts_bad), 2, op_type=1)
-            tris_good = set(tris_all) - set(tris_bad)
-            return list(tris_good)
-        else:
-            # empty set so all tris are good
+        conn = np.reshape(self.mb.get_connectivity(tris_all), (-1, 3))
+        good = np.all(np.isin(conn, np.fromiter(verts_good,
+                                                dtype=np.uint64)), axis=1)
+
+        if np.all(good):
+            # all tris are good
             return tris_all
+        else:
+            # only keep the tris without a vertex outside of the list
+            tris = np.fromiter(tris_all, dtype=np.uint64,
+                               count=len(tris_all))
+            return list(tris[good])
 
     def __list_coords(self, eh):
         """Gets list of all coords as a list of tuples for an entity
@@ -481,14 +757,102 @@ class IsGm(IsoGeomGen):
         """
         # list of all entity handles for all vertices
         all_verts_eh = self.mb.get_entities_by_type(eh, types.MBVERTEX)
+        if len(all_verts_eh) == 0:
+            return {}
+        all_coords = np.reshape(self.mb.get_coords(all_verts_eh), (-1, 3))
         coords = {}
-        for v in all_verts_eh:
-            coord = tuple(self.mb.get_coords(v))
-            coords[v] = coord
+        for v, coord in zip(all_verts_eh, all_coords):
+            coords[v] = tuple(coord)
         return coords
 
+    def __interior_verts(self, iv):
+        """Gets the vertices and their keys of all interior surfaces of an
+        isovolume. The key of a vertex is its handle if the vertices were
+        welded and its coordinates otherwise.
+
+        Input:
+        ------
+            iv: tuple, dictionary key of the isovolume in
+                self.isovol_meshsets
+
+        Returns:
+        --------
+            surfs: list of entity handles of the interior surfaces
+            verts: list of Ranges, vertices of each interior surface
+            keys: array of handles (V) or floats (V, 3), key of the
+                vertices of all interior surfaces in order
+            owner: array of ints (V), index in surfs of the surface of
+                each vertex
+        """
+        surfs = []
+        verts = []
+        for surf in self.isovol_meshsets[iv]['surfs_EH']:
+            if surf in self.__interior_surfs:
+                surfs.append(surf)
+                verts.append(self.mb.get_entities_by_type(surf,
+                                                          types.MBVERTEX))
+        sizes = [len(v) for v in verts]
+        owner = np.repeat(np.arange(len(surfs)), sizes)
+        keys = np.zeros(0, dtype=np.uint64)
+        if sum(sizes) > 0:
+            keys = np.concatenate([np.fromiter(v, dtype=np.uint64,
+                                               count=len(v))
+                                   for v in verts])
+        if not self.welded:
+            keys = np.reshape(self.mb.get_coords(keys), (-1, 3)) \
+                if len(keys) > 0 else np.zeros((0, 3))
+        return surfs, verts, keys, owner
+
+    def __coincident_pairs(self, keys1, owner1, keys2, owner2, nsurf2):
+        """Finds all pairs of surfaces that share at least one vertex
+        handle or coordinate. Every handle or coordinate is replaced by
+        an integer index with a single sort of the keys of both sets of
+        surfaces, and the surfaces of each index are joined with a sorted
+        lookup.
+
+        Input:
+        ------
+            keys1/2: array of handles (V1/2) or floats (V1/2, 3), vertex
+                handles or coordinates
+            owner1/2: array of ints (V1/2), surface index of each vertex
+            nsurf2: int, number of surfaces of the second set
+
+        Returns:
+        --------
+            pairs: array of ints (P, 2), surface indices (i1, i2) of each
+                coincident pair, sorted by i1 then i2
+        """
+        if len(keys1) == 0 or len(keys2) == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        all_keys = np.concatenate([keys1, keys2])
+        if all_keys.dtype.kind == 'f':
+            # adding 0. makes -0. and 0. the same coordinate
+            all_keys = all_keys + 0.
+        index = np.unique(all_keys, axis=0,
+                          return_inverse=True)[1].ravel().astype(np.int64)
+        index1 = index[:len(keys1)]
+        index2 = index[len(keys1):]
+
+        # unique (index, surface) entries of each set, sorted by index
+        nsurf1 = int(owner1.max()) + 1
+        k1, s1 = np.divmod(np.unique(index1 * nsurf1 + owner1), nsurf1)
+        k2, s2 = np.divmod(np.unique(index2 * nsurf2 + owner2), nsurf2)
+
+        # join every entry of set 1 with all entries of set 2 of its index
+        lo = np.searchsorted(k2, k1, side='left')
+        count = np.searchsorted(k2, k1, side='right') - lo
+        rows = np.repeat(np.arange(len(k1)), count)
+        cols = np.repeat(lo - np.cumsum(count) + count, count) + \
+            np.arange(count.sum())
+        pairs = np.unique(s1[rows] * nsurf2 + s2[cols])
+        return np.column_stack(np.divmod(pairs, nsurf2))
+
     def __compare_surfs(self, v1, v2, norm):
-        """finds coincident surfaces between two isovolumes.
+        """finds coincident surfaces between two isovolumes. Two interior
+        surfaces are coincident if they share a vertex (a vertex handle
+        if the vertices were welded, otherwise a vertex coordinate),
+        found for all surfaces at once from the vertices of the interior
+        surfaces of each isovolume.
 
         Input:
         ------
@@ -499,119 +863,175 @@ class IsGm(IsoGeomGen):
         print("comparing surfaces in isovolumes {} and {}.".format(
             v1[0], v2[0]))
 
-        # tag to indicate if interior or exterior surface
-        surf_type_tag = \
-            self.mb.tag_get_handle('SURF_TYPE', size=32,
-                                   tag_type=types.MB_TYPE_OPAQUE,
-                                   storage_type=types.MB_TAG_SPARSE,
-                                   create_if_missing=False)
+        # interior surfaces and their vertex keys
+        surfs1, verts1, keys1, owner1 = self.__interior_verts(v1)
+        surfs2, verts2, keys2, owner2 = self.__interior_verts(v2)
+        pairs = self.__coincident_pairs(keys1, owner1, keys2, owner2,
+                                        len(surfs2))
 
         # store dict of matched surfaces
         #   key: surf to remove in v2
         #   value: surf in v1 to replace it with
+        # each surface in v2 is matched to the first surface in v1
         surfs_to_remove = {}
-
-        # compare all interior surfaces in v1 (s1) to all
-        # interior surfaces in v2 (s2)
-        for s1 in self.isovol_meshsets[v1]['surfs_EH']:
-
-            # check if s1 is interior surf
-            surf_type = self.mb.tag_get_data(surf_type_tag, s1)
-            if surf_type != 'interior':
+        for i1, i2 in pairs:
+            s2 = surfs2[i2]
+            if s2 in surfs_to_remove:
                 continue
-
-            # get list of all coordinates in s1
-            verts1 = self.__list_coords(s1)
-
-            for s2 in self.isovol_meshsets[v2]['surfs_EH']:
-                # check surf type
-                surf_type = self.mb.tag_get_data(surf_type_tag, s2)
-                if surf_type != 'interior':
-                    continue
-
-                # get surface 2 vertices
-                verts2 = self.__list_coords(s2)
-
-                # check if any vertex matches between the two surfaces
-                match = False
-                for coord1 in verts1.values():
-                    if coord1 in verts2.values():
-                        # exact match, don't need to check anymore
-                        match = True
-                        break
-
-                if match:
-                    # match was found so s1 and s2 are coincident
-                    # delete s2 and remove tris/verts from surf and vol
-                    tris2 = self.mb.get_entities_by_type(s2, types.MBTRI)
-                    self.mb.remove_entities(s2, tris2)
-                    self.mb.remove_entities(v2[1], tris2)
-                    self.mb.remove_entities(s2, verts2.keys())
-                    self.mb.remove_entities(v2[1], verts2.keys())
-                    self.mb.delete_entities(tris2)
-                    surfs_to_remove[s2] = s1
+            # match was found so s1 and s2 are coincident
+            # delete s2 and remove tris/verts from surf and vol
+            tris2 = self.mb.get_entities_by_type(s2, types.MBTRI)
+            self.mb.remove_entities(s2, tris2)
+            self.mb.remove_entities(v2[1], tris2)
+            self.mb.remove_entities(s2, verts2[i2])
+            self.mb.remove_entities(v2[1], verts2[i2])
+            self.mb.delete_entities(tris2)
+            surfs_to_remove[s2] = surfs1[i1]
 
         # remove the matched surfaces from volume 2
-        # assign sense and value tags
+        surfs2 = self.isovol_meshsets[v2]['surfs_EH']
+        removed = set(surfs_to_remove.keys())
+        surfs2[:] = [s for s in surfs2 if s not in removed]
+        merged = []
         for s2, s1 in surfs_to_remove.items():
-            self.isovol_meshsets[v2]['surfs_EH'].remove(s2)
-            self.isovol_meshsets[v2]['surfs_EH'].append(s1)
+            surfs2.append(s1)
+            merged.append(s1)
             self.mb.delete_entity(s2)
+        if len(merged) == 0:
+            return
+
+        # the merged surfaces get the shared value of the two volumes
+        shared = \
+            list(set(self.isovol_meshsets[v1]['bounds']) &
+                 set(self.isovol_meshsets[v2]['bounds']))
+        if len(shared) != 1:
+            warnings.warn("No matching value for volumes " +
+                          "{} and {}".format(v1, v2))
+            val = 0.0
+        else:
+            val = shared[0] * norm
 
-            # assign sense tag to surface
-            # [forward=v1, backward=v2]
-            fwd = v1[1]
-            bwd = v2[1]
-            self.mb.tag_set_data(self.sense_tag, s1, [fwd, bwd])
-
-            # tag the new surface with the shared value
-            shared = \
-                list(set(self.isovol_meshsets[v1]['bounds']) &
-                     set(self.isovol_meshsets[v2]['bounds']))
-            if len(shared) != 1:
-                warnings.warn("No matching value for volumes " +
-                              "{} and {}".format(v1, v2))
-                val = 0.0
-            else:
-                val = shared[0] * norm
-            self.mb.tag_set_data(self.val_tag, s1, val)
+        # assign sense and value tags
+        # sense: [forward=v1, backward=v2]
+        self.__tag_surfs(merged, np.full(len(merged), val),
+                         [[v1[1], v2[1]]] * len(merged))
+
+    def __tag_surfs(self, surfs, vals, senses):
+        """Tag the value and senses of many surfaces with one call per
+        tag and mark them as tagged.
+
+        Input:
+        ------
+            surfs: list of entity handles of the surfaces
+            vals: array of floats, value of each surface
+            senses: list of [forward, backward] volume entity handles of
+                each surface
+        """
+        if len(surfs) == 0:
+            return
+        self.mb.tag_set_data(self.val_tag, surfs,
+                             np.asarray(vals, dtype=np.float64))
+        self.mb.tag_set_data(self.sense_tag, surfs,
+                             np.array(senses, dtype=np.uint64))
+        self.__tagged_surfs.update(surfs)
+
+    def __classify_tris(self, fs, tol=0.):
+        """Sort the triangles of a meshset into interior, exterior, and
+        symmetry plane triangles. The connectivity and coordinates of all
+        triangles are read at once and checked as arrays.
+
+        Inputs:
+        -------
+            fs: entity handle of the meshset
+            tol: (optional), float, distance from a plane of the bounding
+                box within which the centroid of a triangle is on the
+                exterior. Default=0.
+
+        Returns:
+        --------
+            tris_interior: Range of interior triangles
+            tris_exterior: Range of exterior triangles
+            tris_symmetry: Range of triangles on a symmetry plane
+        """
+        all_tris = self.mb.get_entities_by_type(fs, types.MBTRI)
+        tris = np.fromiter(all_tris, dtype=np.uint64, count=len(all_tris))
+        if len(tris) == 0:
+            return Range(), Range(), Range()
+        tri_verts = self.mb.get_connectivity(all_tris)
+        coords = np.reshape(self.mb.get_coords(tri_verts), (-1, 9))
+
+        symmetry = self.__check_symmetry(coords)
+        exterior = ~symmetry & \
+            self.__check_exterior(self.__calc_centroid(coords), tol)
+        interior = ~symmetry & ~exterior
+        return Range(tris[interior]), Range(tris[exterior]), \
+            Range(tris[symmetry])
 
     def __calc_centroid(self, coords):
-        """Calculate the centroid of a list of three coordinates.
+        """Calculate the centroid of triangles from the coordinates of
+        their three points.
 
         Inputs:
         -------
-            coords: list of floats, x, y, and z coordinates of three
-                points to calculate centroid. list should be ordered as:
+            coords: list of floats or array of floats (T, 9), x, y, and z
+                coordinates of the three points of each triangle. Each
+                triangle should be ordered as:
                 [x1, y1, z1, x2, y2, z2, x3, y3, z3]
 
         Returns:
         --------
-            centroid: list of floats, coordinates of the centroid [x, y, z]
+            centroid: array of floats (3) or (T, 3), coordinates of the
+                centroid [x, y, z] of each triangle
         """
-        if len(coords) != 9:
+        coords = np.asarray(coords, dtype=np.float64)
+        if coords.shape[-1] != 9:
             raise RuntimeError("Cannot calculate centroid. List of " +
                                "coordinates is incorrect size.")
         # reshape into list of 3 coordinates [[x2,y2,z2],[x2,y2,z2],[x3,y3,z3]]
-        # calculate average along columns (axis 0) to get average x, y, and z
-        return np.mean(np.resize(coords, (3, 3)), axis=0)
+        # calculate average over the points to get average x, y, and z
+        return np.mean(np.reshape(coords, coords.shape[:-1] + (3, 3)),
+                       axis=-2)
+
+    def __check_symmetry(self, coords):
+        """Check if triangles lie on a symmetry plane of the geometry.
 
-    def __check_exterior(self, coord):
-        """for a given position [x, y, z] check if it is on the exterior
+        Inputs:
+        -------
+            coords: list of floats or array of floats (T, 9), x, y, and z
+                coordinates of the three vertices of each triangle,
+                ordered as [x1, y1, z1, x2, y2, z2, x3, y3, z3]
+
+        Returns:
+        --------
+            on_plane: bool or array of bools (T), True if located on a
+                symmetry plane
+        """
+        coords = np.asarray(coords, dtype=np.float64)
+        coords = np.reshape(coords, coords.shape[:-1] + (3, 3))
+        on_plane = np.zeros(coords.shape[:-2], dtype=bool)
+        for axis in self.symmetry or []:
+            a = voxel.AXES.index(axis)
+            plane = np.float32(getattr(self, axis + 'min'))
+            on_plane |= np.all(np.float32(coords[..., a]) == plane, axis=-1)
+        return on_plane
+
+    def __check_exterior(self, coord, tol=0.):
+        """for given positions [x, y, z] check if they are on the exterior
         surfaces of the geometry.
 
         Inputs:
         -------
-            coord: list of floats, [x, y, z]
+            coord: list of floats [x, y, z] or array of floats (N, 3)
+            tol: (optional), float, distance from a plane of the bounding
+                box within which a position is on the plane. Default=0.
 
         Returns:
         --------
-            True: located on exterior surface
-            False: not located on exterior surface
+            on_exterior: bool or array of bools (N), True if located on
+                an exterior surface
         """
-        if (coord[0] == self.xmin) or (coord[0] == self.xmax) or \
-           (coord[1] == self.ymin) or (coord[1] == self.ymax) or \
-           (coord[2] == self.zmin) or (coord[2] == self.zmax):
-            return True
-        else:
-            return False
+        coord = np.asarray(coord, dtype=np.float64)
+        lower = np.array([self.xmin, self.ymin, self.zmin], dtype=np.float64)
+        upper = np.array([self.xmax, self.ymax, self.zmax], dtype=np.float64)
+        return np.any((np.abs(coord - lower) <= tol) |
+                      (np.abs(coord - upper) <= tol), axis=-1)
@@ -1,36 +1,48 @@
 import sys
 import os
 import shutil
+import hashlib
 import warnings
+import heapq
+import multiprocessing as mp
 import numpy as np
 import math as m
 import meshio
 
 from isg_gen import IsoGeomGen
-
-import visit as v
+from IsogeomGenerator import voxel, marching, tetmesh, vtkscan, \
+    visit_session, minmax
 
 
 class IvDb(IsoGeomGen):
     """Class containing necessary methods for generating isosurface
     volumes from a mesh file with data. This class uses the python
-    interface for VisIt.
+    interface for VisIt, or native NumPy engines for Cartesian hex or
+    unstructured tet meshes.
 
     Attributes:
     -----------
         levels: list of floats, values used for isosurface values
         data: string, name of data on mesh
         db: string, path to database folder with isovolume files
+        point_data: bool, True if data is point (nodal) data on the mesh
+        cell_type: string, type of mesh cells ('hexahedron' or 'tetra')
+        band_counts: list of ints, number of data values in each band
+        session: VisItSession object used by the visit backend (None to
+            use the session shared by the process)
+        cache: series.BlockCache object with the triangles of the
+            previous step of a series (None if not part of a series)
 
     Methods:
     --------
         generate_vols(): generate all isosurface volumes defined by the
-            levels
+            levels (optionally across several VisIt sessions)
         write_levels(): writes levels to a file (can be used by
             read_levels())
     """
 
-    def __init__(self, levels=None, data=None, db=None):
+    def __init__(self, levels=None, data=None, db=None, session=None,
+                 cache=None):
         """Create IvDb object
 
         Input:
@@ -42,12 +54,29 @@ class IvDb(IsoGeomGen):
             db: (optional), string, path to database folder with
                 isovolume files. If not provided, will be set to the
                 default: '/tmp' in the current directory.
+            session: (optional), visit_session.VisItSession object,
+                VisIt session to extract the isovolumes in. It is kept
+                open after generate_vols() so it can be reused. If not
+                provided, the session shared by the process is used.
+            cache: (optional), series.BlockCache object, triangles of the
+                blocks of the previous mesh of a series with the same grid.
+                Only the blocks whose bands changed are extracted and the
+                cache is updated for the next mesh (numpy backend with
+                tile only).
         """
         # initialize attributes
         super(IvDb, self).__init__(levels, data, db)
         self.completed = False
-
-    def generate_vols(self, filename):
+        self.point_data = False
+        self.cell_type = 'hexahedron'
+        self.band_counts = []
+        self.session = session
+        self.cache = cache
+        self.__mesh_key = None
+
+    def generate_vols(self, filename, workers=1, backend='visit',
+                      incremental=False, tile=None, engine_procs=None,
+                      labeled=False):
         """Generates the isosurface volumes between the level values.
         Data files are exported as STLs and saved in the folder db.
         Files will be named based on their index corresponding to their
@@ -56,21 +85,60 @@ class IvDb(IsoGeomGen):
         Input:
         ------
             filename: string, path to vtk file with the mesh
+            workers: (optional), int, number of independent VisIt
+                sessions to split the level bands across. Bands are
+                scheduled largest first. Default=1 (serial).
+            backend: (optional), string, engine used to extract the
+                isovolumes. Options are 'visit' (default) or 'numpy'.
+                visit: use VisIt's Isovolume operator for each band
+                numpy: extract all band boundaries in a single pass
+                    (VisIt is not required). Cell data gives the hex or
+                    tet faces between bands, point data on a Cartesian
+                    hex mesh gives marching tetrahedra isosurfaces.
+            incremental: (optional), bool, if True, reuse the database
+                folder and only extract the bands that are not already
+                in its cache. Bands are cached by a hash of the mesh
+                file, data name, backend, and the band bounds.
+                Default=False.
+            tile: (optional), int, number of cells along each edge of
+                the blocks used to extract the isovolumes out of core
+                with the numpy backend. The cell data of a Cartesian
+                mesh is classified into a memory-mapped grid and each
+                block is extracted separately, so meshes larger than
+                memory can be used. Default=None (whole mesh in memory)
+            engine_procs: (optional), int, number of MPI ranks of a
+                local parallel VisIt compute engine used to extract each
+                band (visit backend only, combined with workers each
+                session starts its own engine). Default=None (serial
+                engine)
+            labeled: (optional), bool, if True, export the boundaries of
+                all bands in a single pass to one VTK polydata file
+                (vols/isovols.vtk) with the band index of every triangle
+                as cell data, instead of one STL file per band (numpy
+                backend only, not with tile or incremental).
+                Default=False
         """
-        # create folder for database
-        self.__make_db_dir()
+        if backend not in ['visit', 'numpy']:
+            raise RuntimeError("Backend {} not recognized.".format(backend))
+        if labeled and (backend != 'numpy' or tile is not None or
+                        incremental):
+            raise RuntimeError("Labeled output requires the numpy backend "
+                               "without tile or incremental.")
+        if self.cache is not None and (backend != 'numpy' or tile is None):
+            raise RuntimeError("A series block cache requires the numpy "
+                               "backend with tile.")
+        if backend == 'visit' and visit_session.v is None:
+            raise RuntimeError("VisIt python module could not be " +
+                               "imported. Use backend='numpy' instead.")
 
-        # launch VisIt
-        try:
-            v.LaunchNowin()
-        except:
-            pass
-
-        # open file
-        v.OpenDatabase(filename)
+        # create folder for database
+        self.__make_db_dir(incremental)
+        self.__mesh_key = None
+        if incremental:
+            self.__mesh_key = _mesh_key(filename, self.data, backend)
 
-        # read data using meshio to get min and max and make sure levels are
-        # within data bounds:
+        # scan data to get min and max and make sure levels are within
+        # data bounds:
         arbmin, arbmax, mins, maxs = self.__check_data(filename)
         self.xmin = mins[0]
         self.ymin = mins[1]
@@ -80,33 +148,26 @@ class IvDb(IsoGeomGen):
         self.zmax = maxs[2]
         self.levels.append(arbmax)
 
-        # plot the pseudocolor data in order to get volumes
-        v.AddPlot("Pseudocolor", self.data)
-        v.DrawPlots()
-
-        # iterate over all isovolume levels
-        for i, l in enumerate(self.levels):
-            res = 0
-            while res == 0:
-
-                # lower bound
-                if i == 0:
-                    lbound = arbmin
-                else:
-                    lbound = self.levels[i - 1]
-
-                # upper bound
-                ubound = self.levels[i]
-
-                # get volume
-                # res = 0 if no level found (should update to next level)
-                res, ubound = self.__get_isovol(lbound, ubound, i)
-
-        # delete plots
-        v.DeleteAllPlots()
-
-        # close visit
-        v.CloseComputeEngine()
+        # cell data bands with no values would export nothing, so merge
+        # them into the next band before any extraction starts
+        if not self.point_data:
+            self.__merge_empty_bands(arbmin,
+                                     [c == 0 for c in self.band_counts])
+            self.write_levels()
+        self.__print_bands(arbmin)
+
+        if backend == 'numpy' and tile is not None:
+            self.__generate_vols_tiled(filename, arbmin, tile)
+        elif backend == 'numpy':
+            self.__generate_vols_numpy(filename, arbmin, labeled)
+        elif workers > 1:
+            self.__generate_vols_parallel(filename, arbmin, workers,
+                                          engine_procs)
+        else:
+            self.__generate_vols_serial(filename, arbmin, engine_procs)
+
+        if incremental:
+            self.__store_bands(arbmin)
 
     def write_levels(self):
         """Write the final level values used to a file that can be used by
@@ -123,7 +184,16 @@ class IvDb(IsoGeomGen):
         with open(filepath, "w") as f:
             f.write(level_str)
 
-    def __make_db_dir(self):
+    def __make_db_dir(self, incremental=False):
+        # reuse an existing database in incremental mode, the isovolume
+        # files are restored from its cache. Scratch folders left by a
+        # run that did not finish are removed.
+        if incremental and os.path.isdir(self.db):
+            for d in ["/vols/", "/tiles/", "/bands/"]:
+                shutil.rmtree(self.db + d, ignore_errors=True)
+            os.makedirs(self.db + "/vols/")
+            return
+
         # create folder to store data if it does not already exist
         i = 0
         while os.path.isdir(self.db):
@@ -136,8 +206,10 @@ class IvDb(IsoGeomGen):
         os.makedirs(self.db + "/vols/")
 
     def __check_data(self, filename):
-        """Read data using meshio to get min and max and make sure
-        levels are within data bounds.
+        """Get the min and max data values and the mesh extents and make
+        sure levels are within data bounds. Legacy VTK files are scanned
+        in a single streaming pass, other formats are read with meshio.
+        The number of values in each band is also stored.
 
         Input:
         ------
@@ -152,31 +224,409 @@ class IvDb(IsoGeomGen):
             maxs: list of floats, maximum x, y, z values of the
                 geometry [xmax, ymax, zmax]
         """
-        # read in Cartesian mesh file
-        mf = meshio.read(filename)
+        if vtkscan.is_legacy_vtk(filename):
+            info = vtkscan.scan(filename, self.data, levels=self.levels)
+            self.point_data = info['point_data']
+            mindata = info['min']
+            maxdata = info['max']
+            counts = [int(c) for c in info['counts']]
+            mins = info['mins']
+            maxs = info['maxs']
+        else:
+            mf = meshio.read(filename)
+            values = self.__get_values(mf)
+            mindata = values.min()
+            maxdata = values.max()
+            bands = voxel.classify(values, self.levels)
+            counts = [int(c) for c in
+                      np.bincount(bands, minlength=len(self.levels) + 1)]
+            mins = mf.points.min(axis=0)
+            maxs = mf.points.max(axis=0)
 
-        # get min and max data values
-        mindata = min(mf.cell_data['hexahedron'][self.data])
-        maxdata = max(mf.cell_data['hexahedron'][self.data])
         arbmin = mindata - 10  # lower than lowest data
         arbmax = maxdata + 10  # higher than highest data
+        self.band_counts = counts
         all_levels = list(self.levels)
         for level in all_levels:
             if (level <= mindata) or (level >= maxdata):
                 warnings.warn("Level {} is out of data bounds.".format(level))
-                self.levels.remove(level)
+                self.__remove_level(level)
         if len(self.levels) == 0:
             raise RuntimeError("No data exists within provided levels.")
 
-        # get extents of the geometric space (min/max x, y, z values)
-        mins = mf.points.min(axis=0)
-        maxs = mf.points.max(axis=0)
-
         return arbmin, arbmax, mins, maxs
 
+    def __get_values(self, mf):
+        """Get the data values from a mesh read by meshio. Cell data on
+        the hexahedra or tetrahedra is used if it exists, otherwise point
+        data.
+
+        Input:
+        ------
+            mf: meshio mesh object
+
+        Returns:
+        --------
+            values: array of floats, data values on the mesh
+        """
+        for cell_type in ['hexahedron', 'tetra']:
+            cell_data = mf.cell_data.get(cell_type, {})
+            if self.data in cell_data:
+                self.cell_type = cell_type
+                self.point_data = False
+                return np.asarray(cell_data[self.data]).ravel()
+        if self.data in mf.point_data:
+            if 'hexahedron' not in mf.cells and 'tetra' in mf.cells:
+                self.cell_type = 'tetra'
+            else:
+                self.cell_type = 'hexahedron'
+            self.point_data = True
+            return np.asarray(mf.point_data[self.data]).ravel()
+        raise RuntimeError("Data {} not found on mesh.".format(self.data))
+
+    def __generate_vols_serial(self, filename, arbmin, engine_procs=None):
+        """Export the isovolumes one band at a time in a single VisIt
+        session.
+
+        Input:
+        ------
+            filename: string, path to vtk file with the mesh
+            arbmin: float, value that is lower than minimum data
+            engine_procs: (optional), int, number of ranks of a local
+                parallel compute engine (None for the serial engine)
+        """
+        if self.__fetch_bands(arbmin):
+            return
+
+        # open file in the warm session, the engine and the pipeline are
+        # kept alive for the next run
+        if self.session is None:
+            self.session = visit_session.shared()
+        self.session.open(filename, self.data, engine_procs)
+
+        # iterate over all isovolume levels
+        for i, l in enumerate(self.levels):
+            res = 0
+            while res == 0:
+
+                # lower bound
+                if i == 0:
+                    lbound = arbmin
+                else:
+                    lbound = self.levels[i - 1]
+
+                # upper bound
+                ubound = self.levels[i]
+
+                # get volume
+                # res = 0 if no level found (should update to next level)
+                res, ubound = self.__get_isovol(lbound, ubound, i)
+
+    def __generate_vols_numpy(self, filename, arbmin, labeled=False):
+        """Export the isovolumes using the native NumPy engines. Cell data
+        is classified against the levels at once and the boundary faces
+        of every band are extracted in a single pass over the Cartesian
+        grid or tet connectivity. Point data on Cartesian hex meshes uses
+        a marching tetrahedra sweep that finds the isosurfaces of all
+        levels at once.
+
+        Input:
+        ------
+            filename: string, path to vtk file with the mesh
+            arbmin: float, value that is lower than minimum data
+            labeled: (optional), bool, if True, write all bands to one
+                VTK file labeled by band instead of one STL per band
+        """
+        if self.__fetch_bands(arbmin):
+            return
+
+        mf = meshio.read(filename)
+        values = self.__get_values(mf)
+        if self.cell_type == 'tetra' and self.point_data:
+            raise RuntimeError("Point data is only supported on " +
+                               "hexahedral meshes.")
+        if self.point_data:
+            coords, grid = marching.nodal_grid(mf.points, values)
+            occupied = marching.occupied(grid, self.levels)
+            self.__merge_empty_bands(arbmin, ~occupied)
+        elif self.cell_type == 'hexahedron':
+            coords, grid = voxel.cartesian_grid(mf.points,
+                                                mf.cells['hexahedron'],
+                                                values)
+
+        # extract and export all bands
+        if self.cell_type == 'tetra':
+            tris = tetmesh.extract(mf.points, mf.cells['tetra'], values,
+                                   self.levels)
+        elif self.point_data:
+            tris = marching.extract(grid, coords, self.levels)
+        else:
+            tris = voxel.extract(grid, coords, self.levels)
+        if labeled:
+            voxel.write_labeled_vtk(self.db + "/vols/" + voxel.LABELED_FILE,
+                                    tris)
+            return
+        for i, band_tris in enumerate(tris):
+            voxel.write_stl(self.db + "/vols/{}.stl".format(i), band_tris)
+
+    def __generate_vols_tiled(self, filename, arbmin, tile):
+        """Export the isovolumes of a Cartesian mesh with cell data one
+        block of cells at a time. The cell data is streamed from the file
+        into a memory-mapped grid of band indices in the database, then
+        the faces of each block are appended to the isovolume files.
+        Only the blocks that can hold a band boundary are visited, as
+        found from a min/max index of the blocks that is stored in the
+        database and reused by later incremental runs. With a series
+        cache, only the blocks that changed since the previous mesh are
+        extracted.
+
+        Input:
+        ------
+            filename: string, path to vtk file with the mesh
+            arbmin: float, value that is lower than minimum data
+            tile: int, number of cells along each edge of a block
+        """
+        if self.point_data or not vtkscan.is_legacy_vtk(filename):
+            raise RuntimeError("Tiled extraction requires cell data on " +
+                               "a Cartesian mesh in a legacy VTK file.")
+        if self.__fetch_bands(arbmin):
+            return
+
+        scratch = self.db + "/tiles/"
+        os.makedirs(scratch)
+        index = self.db + "/" + minmax.INDEX_FILE
+        tree = minmax.load(index)
+        if tree is not None and self.__mesh_key is not None and \
+                tree.key == self.__mesh_key and tree.tile == tile:
+            coords, bands = vtkscan.band_grid(filename, self.data,
+                                              self.levels, scratch)
+        else:
+            coords, bands, mins, maxs = \
+                vtkscan.band_grid_extrema(filename, self.data, self.levels,
+                                          scratch, tile)
+            tree = minmax.MinMaxTree(mins, maxs, bands.shape, tile,
+                                     self.__mesh_key)
+            tree.save(index)
+        filenames = [self.db + "/vols/{}.stl".format(i)
+                     for i in range(len(self.levels))]
+        if self.cache is not None:
+            self.cache.extract(bands, coords, self.levels, filenames, tile,
+                               active=tree.blocks(self.levels))
+        else:
+            voxel.extract_tiled(bands, coords, len(self.levels), filenames,
+                                tile, active=tree.blocks(self.levels))
+        del bands
+        shutil.rmtree(scratch)
+
+    def __band_path(self, lbound, ubound):
+        """Path of the cached file for a band, None if the database is
+        not incremental.
+        """
+        if self.__mesh_key is None:
+            return None
+        key = hashlib.sha1((self.__mesh_key + repr(float(lbound)) +
+                            repr(float(ubound))).encode()).hexdigest()
+        return self.db + "/cache/" + key + ".stl"
+
+    def __fetch_band(self, lbound, ubound, path):
+        """Copy a band from the cache if it exists.
+
+        Input:
+        ------
+            lbound: float, lower boundary value for the isovolume
+            ubound: float, upper boundary value for the isovolume
+            path: string, path to copy the cached file to
+
+        Returns:
+        --------
+            found: bool, True if the band was in the cache
+        """
+        cached = self.__band_path(lbound, ubound)
+        if cached is None or not os.path.isfile(cached):
+            return False
+        shutil.copyfile(cached, path)
+        return True
+
+    def __fetch_bands(self, arbmin):
+        """Copy all bands from the cache into the database if every band
+        is cached.
+
+        Input:
+        ------
+            arbmin: float, value that is lower than minimum data
+
+        Returns:
+        --------
+            found: bool, True if all bands were in the cache
+        """
+        bounds = [arbmin] + self.levels
+        for i in range(len(self.levels)):
+            cached = self.__band_path(bounds[i], bounds[i + 1])
+            if cached is None or not os.path.isfile(cached):
+                return False
+        for i in range(len(self.levels)):
+            self.__fetch_band(bounds[i], bounds[i + 1],
+                              self.db + "/vols/{}.stl".format(i))
+        return True
+
+    def __store_bands(self, arbmin):
+        """Add the isovolume files of the database to its cache.
+
+        Input:
+        ------
+            arbmin: float, value that is lower than minimum data
+        """
+        if not os.path.isdir(self.db + "/cache/"):
+            os.makedirs(self.db + "/cache/")
+        bounds = [arbmin] + self.levels
+        for i in range(len(self.levels)):
+            cached = self.__band_path(bounds[i], bounds[i + 1])
+            if not os.path.isfile(cached):
+                shutil.copyfile(self.db + "/vols/{}.stl".format(i), cached)
+
+    def __merge_empty_bands(self, arbmin, empty):
+        """Remove the upper level of every empty band so that the band is
+        merged into the next band, the same as when VisIt fails to export
+        an empty band.
+
+        Input:
+        ------
+            arbmin: float, value that is lower than minimum data
+            empty: list of bools, True for each band that has no data
+        """
+        lbound = arbmin
+        for level, is_empty in zip(list(self.levels), empty):
+            if is_empty:
+                self.__warn_empty(lbound, level)
+                self.__remove_level(level)
+            else:
+                lbound = level
+
+    def __warn_empty(self, lbound, ubound):
+        """Warn that a band has no data and is merged into the next band.
+
+        Input:
+        ------
+            lbound: float, lower boundary value of the empty band
+            ubound: float, upper boundary value of the empty band
+        """
+        warn_message = "Warning: no data to export between " \
+            + "{} and {}.\n".format(lbound, ubound) \
+            + "Increasing upper bound to next selected level."
+        warnings.warn(warn_message)
+
+    def __print_bands(self, arbmin):
+        """Print the bounds and the number of data values of each band,
+        which are also used to schedule the bands across workers.
+
+        Input:
+        ------
+            arbmin: float, value that is lower than minimum data
+        """
+        unit = "points" if self.point_data else "cells"
+        bounds = [arbmin] + self.levels
+        for i, count in enumerate(self.band_counts):
+            print("band {} ({} to {}): {} {}".format(
+                i, bounds[i], bounds[i + 1], count, unit))
+
+    def __remove_level(self, level):
+        """Remove a level value and add the count of the band below it to
+        the next band.
+
+        Input:
+        ------
+            level: float, level value to remove
+        """
+        j = self.levels.index(level)
+        if j < len(self.band_counts):
+            if j + 1 < len(self.band_counts):
+                self.band_counts[j + 1] += self.band_counts[j]
+            del self.band_counts[j]
+        self.levels.remove(level)
+
+    def __generate_vols_parallel(self, filename, arbmin, workers,
+                                 engine_procs=None):
+        """Export the isovolumes by splitting the level bands across
+        several independent VisIt sessions. Bands are first exported to
+        a staging folder named by the indices of their bounds so that
+        empty bands can be merged into the next band (as in the serial
+        case) before the files are renumbered into the database.
+
+        Input:
+        ------
+            filename: string, path to vtk file with the mesh
+            arbmin: float, value that is lower than minimum data
+            workers: int, number of VisIt sessions to run
+            engine_procs: (optional), int, number of ranks of the local
+                parallel compute engine of each session (None for serial
+                engines)
+        """
+        # all bounding values, index 0 is the arbitrary minimum
+        bounds = [arbmin] + self.levels
+        sizes = np.array(self.band_counts)
+        stage = self.db + "/bands/"
+        os.makedirs(stage)
+
+        # indices into bounds that are still used as level values
+        edges = list(range(len(bounds)))
+        done = {}
+        while True:
+            bands = list(zip(edges[:-1], edges[1:]))
+            todo = []
+            for lo, hi in bands:
+                if (lo, hi) in done:
+                    continue
+                if self.__fetch_band(bounds[lo], bounds[hi],
+                                     stage + "{}_{}.stl".format(lo, hi)):
+                    done[(lo, hi)] = 1
+                else:
+                    todo.append((lo, hi))
+            todo_sizes = [sizes[lo:hi].sum() for lo, hi in todo]
+
+            # distribute bands across sessions, largest first
+            jobs = []
+            for chunk in _schedule_bands(todo_sizes, workers):
+                job_bands = []
+                for j in chunk:
+                    lo, hi = todo[j]
+                    job_bands.append(("{}_{}".format(lo, hi),
+                                      bounds[lo], bounds[hi]))
+                jobs.append((filename, self.data, stage, job_bands,
+                             engine_procs))
+
+            job_results = []
+            if len(jobs) > 0:
+                pool = _worker_pool(len(jobs), self.session)
+                try:
+                    job_results = pool.map(_extract_bands, jobs)
+                finally:
+                    pool.close()
+                    pool.join()
+            for results in job_results:
+                for key, res in results:
+                    lo, hi = [int(k) for k in key.split("_")]
+                    done[(lo, hi)] = res
+
+            # merge any empty bands into the next band and try again
+            empty = [b for b in bands if done[b] == 0]
+            if len(empty) == 0:
+                break
+            for lo, hi in empty:
+                self.__warn_empty(bounds[lo], bounds[hi])
+                edges.remove(hi)
+
+        # move the exported bands into the database in level order
+        for i, (lo, hi) in enumerate(zip(edges[:-1], edges[1:])):
+            os.rename(stage + "{}_{}.stl".format(lo, hi),
+                      self.db + "/vols/{}.stl".format(i))
+        shutil.rmtree(stage)
+        self.levels = [bounds[e] for e in edges[1:]]
+        self.band_counts = [int(sizes[lo:hi].sum())
+                            for lo, hi in zip(edges[:-1], edges[1:])]
+
     def __get_isovol(self, lbound, ubound, i):
         """Gets the volume selection for isovolume and export just the
-        outer surface of the volume as STL.
+        outer surface of the volume as STL from the open VisIt session.
 
         Input:
         ------
@@ -184,46 +634,130 @@ class IvDb(IsoGeomGen):
             ubound: float, upper boundary value for the isovolume
             i: int, surface number
         """
-        # generate isovolume
-        v.AddOperator("Isovolume")
-        att = v.IsovolumeAttributes()
-        att.lbound = lbound
-        att.ubound = ubound
-        v.SetOperatorOptions(att)
-
-        # set operator setting to only get surfaces meshes
-        v.AddOperator("ExternalSurface")
-
-        # draw plot
-        v.DrawPlots()
+        # reuse the band if it is cached
+        if self.__fetch_band(lbound, ubound,
+                             self.db + "/vols/{}.stl".format(i)):
+            return 1, ubound
 
         # export current volume to folder
-        e = v.ExportDBAttributes()
-        e.dirname = self.db + "/vols/"
-        e.db_type = "STL"
-        e.filename = str(i)
-        e.variables = self.data
-        export_res = v.ExportDatabase(e)
+        export_res = self.session.export(lbound, ubound,
+                                         self.db + "/vols/", str(i))
 
         # check if exporting was successful or not and adjust values
         if export_res == 0:
             # export not successful because there was no data
             # get new upper bound
-            warn_message = "Warning: no data to export between " \
-                + "{} and {}.\n".format(lbound, ubound) \
-                + "Increasing upper bound to next selected level."
-            warnings.warn(warn_message)
+            self.__warn_empty(lbound, ubound)
             if ubound == max(self.levels):
                 # already at max so do not need to export more levels
-                self.levels.remove(ubound)
+                self.__remove_level(ubound)
                 export_res = 1
             else:
                 # update to next level to try again
                 index = self.levels.index(ubound)
                 ubound_old = ubound
                 ubound = self.levels[index + 1]
-                self.levels.remove(ubound_old)
-        # delete the operators
-        v.RemoveAllOperators()
+                self.__remove_level(ubound_old)
 
         return export_res, ubound
+
+
+def _mesh_key(filename, data, backend):
+    """Hash the contents of the mesh file together with the data name
+    and backend used to extract the isovolumes.
+
+    Input:
+    ------
+        filename: string, path to vtk file with the mesh
+        data: string, name of data on mesh
+        backend: string, engine used to extract the isovolumes
+
+    Returns:
+    --------
+        key: string, hex digest of the hash
+    """
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        chunk = f.read(2**22)
+        while chunk:
+            sha.update(chunk)
+            chunk = f.read(2**22)
+    sha.update(("\n" + data + "\n" + backend).encode())
+    return sha.hexdigest()
+
+
+def _worker_pool(processes, session=None):
+    """Create the pool of worker processes for parallel generation. A
+    worker must not inherit the VisIt viewer of this process, so workers
+    are started as new processes where possible. Otherwise (Python 2)
+    the VisIt sessions of this process are closed before forking.
+
+    Input:
+    ------
+        processes: int, number of worker processes
+        session: (optional), VisItSession object, session of this
+            process to close before forking
+
+    Returns:
+    --------
+        pool: multiprocessing Pool object
+    """
+    if hasattr(mp, 'get_context'):
+        ctx = mp.get_context('spawn')
+    else:
+        visit_session.release(session)
+        ctx = mp
+    return ctx.Pool(processes=processes, maxtasksperchild=1)
+
+
+def _extract_bands(job):
+    """Export a set of isovolumes in a separate VisIt session. Used as
+    the worker for parallel generation.
+
+    Input:
+    ------
+        job: tuple, (filename, data, dirname, bands, engine_procs) where
+            bands is a list of (name, lbound, ubound) for each isovolume
+            to export and engine_procs is the number of ranks of the
+            compute engine (None for the serial engine)
+
+    Returns:
+    --------
+        results: list of tuples, (name, export_res) for each band
+    """
+    filename, data, dirname, bands, engine_procs = job
+
+    results = []
+    with visit_session.VisItSession() as session:
+        session.open(filename, data, engine_procs)
+        for name, lbound, ubound in bands:
+            export_res = session.export(lbound, ubound, dirname, name)
+            results.append((name, export_res))
+
+    return results
+
+
+def _schedule_bands(sizes, workers):
+    """Split bands across workers so that the total size of each
+    worker's set is balanced (longest processing time first).
+
+    Input:
+    ------
+        sizes: list of ints, size (number of cells) of each band
+        workers: int, maximum number of workers
+
+    Returns:
+    --------
+        chunks: list of lists of ints, indices of the bands assigned to
+            each worker, largest band first. Workers without any bands
+            are not included.
+    """
+    order = sorted(range(len(sizes)), key=lambda j: sizes[j], reverse=True)
+    nworkers = max(1, min(workers, len(sizes)))
+    heap = [(0, w) for w in range(nworkers)]
+    chunks = [[] for w in range(nworkers)]
+    for j in order:
+        load, w = heapq.heappop(heap)
+        chunks[w].append(j)
+        heapq.heappush(heap, (load + sizes[j], w))
+    return [c for c in chunks if len(c) > 0]
@@ -0,0 +1,372 @@
+"""Native NumPy isovolume extraction for point (nodal) data on Cartesian
+hexahedral meshes. Each hex is split into six tetrahedra and the
+isosurface of every level is found with a vectorized marching tetrahedra
+sweep over the grid. The surface of each isovolume is made from the
+isosurfaces of its two bounding levels and the exterior faces of the mesh
+clipped to the band.
+"""
+
+from itertools import permutations
+import numpy as np
+
+
+# hex corners are indexed by 4*di + 2*dj + dk
+_CORNERS = np.array([[i, j, k] for i in (0, 1) for j in (0, 1)
+                     for k in (0, 1)])
+
+# Kuhn decomposition of a hex into six tets. Every tet walks from corner
+# 0 to corner 7 adding one axis at a time, so neighboring hexes split
+# their shared faces along the same diagonal.
+_TETS = np.array([[0, [4, 2, 1][p[0]], [4, 2, 1][p[0]] + [4, 2, 1][p[1]], 7]
+                  for p in permutations(range(3))])
+
+# local vertex pairs for each tet edge
+_TET_EDGES = np.array([[0, 1], [0, 2], [0, 3], [1, 2], [1, 3], [2, 3]])
+
+
+def _build_cases():
+    """Marching tetrahedra case table. For each of the 16 combinations of
+    vertices above the level, up to two triangles given as tet edges
+    (-1 if the triangle is not used).
+    """
+    edge_id = {}
+    for e, (a, b) in enumerate(_TET_EDGES):
+        edge_id[(a, b)] = edge_id[(b, a)] = e
+
+    cases = np.full((16, 2, 3), -1, dtype=np.int64)
+    for case in range(16):
+        above = [v for v in range(4) if (case >> v) & 1]
+        below = [v for v in range(4) if not (case >> v) & 1]
+        if len(above) in [1, 3]:
+            # one vertex is cut off from the other three
+            if len(above) == 1:
+                iso, others = above[0], below
+            else:
+                iso, others = below[0], above
+            cases[case, 0] = [edge_id[(iso, o)] for o in others]
+        elif len(above) == 2:
+            # quad between the two pairs, split into two triangles
+            a0, a1 = above
+            b0, b1 = below
+            quad = [edge_id[(a0, b0)], edge_id[(a0, b1)],
+                    edge_id[(a1, b1)], edge_id[(a1, b0)]]
+            cases[case, 0] = [quad[0], quad[1], quad[2]]
+            cases[case, 1] = [quad[0], quad[2], quad[3]]
+    return cases
+
+
+_CASES = _build_cases()
+
+
+def nodal_grid(points, values):
+    """Arrange the point values of a Cartesian mesh on a structured grid.
+
+    Input:
+    ------
+        points: array of floats (N, 3), coordinates of the mesh nodes
+        values: array of floats (N), point data for each node
+
+    Returns:
+    --------
+        coords: list of three arrays of floats, sorted x, y, and z node
+            positions of the grid
+        grid: 3D array of floats, node values indexed by [i, j, k]
+    """
+    points = np.asarray(points, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64).ravel()
+    coords = [np.unique(points[:, a]) for a in range(3)]
+    shape = tuple(len(c) for c in coords)
+    if len(values) != len(points) or len(points) != np.prod(shape):
+        raise RuntimeError("Mesh is not a complete Cartesian grid.")
+
+    idx = [np.searchsorted(coords[a], points[:, a]) for a in range(3)]
+    flat = np.ravel_multi_index(idx, shape)
+    if np.bincount(flat, minlength=len(flat)).max() != 1:
+        raise RuntimeError("Mesh is not a complete Cartesian grid.")
+
+    grid = np.empty(shape, dtype=np.float64)
+    grid.flat[flat] = values
+    return coords, grid
+
+
+def occupied(grid, levels):
+    """Check which bands cover some volume of the mesh. Band i contains
+    values in [levels[i - 1], levels[i]].
+
+    Input:
+    ------
+        grid: 3D array of floats, node values
+        levels: sorted list of floats, upper bound of each band
+
+    Returns:
+    --------
+        occ: array of bools, True if the band is not empty
+    """
+    levels = np.asarray(levels, dtype=np.float64)
+    cmin, cmax = _cell_range(grid)
+    cmin = cmin.ravel()
+    cmax = cmax.ravel()
+
+    # a band is occupied if any cell range overlaps the open band range
+    order = np.argsort(cmin)
+    sorted_min = cmin[order]
+    running_max = np.maximum.accumulate(cmax[order])
+    lower = np.concatenate([[-np.inf], levels[:-1]])
+    k = np.searchsorted(sorted_min, levels, side='left')
+    occ = np.zeros(len(levels), dtype=bool)
+    has = k > 0
+    occ[has] = running_max[k[has] - 1] > lower[has]
+    return occ
+
+
+def extract(grid, coords, levels, chunk=32):
+    """Generate the outward facing surface triangles of every band in a
+    single sweep over the grid. Band i contains values in
+    [levels[i - 1], levels[i]].
+
+    Input:
+    ------
+        grid: 3D array of floats, node values
+        coords: list of three arrays of floats, x, y, and z node
+            positions of the grid
+        levels: sorted list of floats, upper bound of each band
+        chunk: (optional), int, number of cell layers along x processed
+            at once (limits memory use)
+
+    Returns:
+    --------
+        tris: list of arrays of floats (T, 3, 3), triangles for each band
+    """
+    levels = np.asarray(levels, dtype=np.float64)
+    ids = np.arange(grid.size).reshape(grid.shape)
+
+    # isosurface of every level, normals point to higher values
+    iso = [[] for level in levels]
+    for i0 in range(0, grid.shape[0] - 1, chunk):
+        i1 = min(i0 + chunk, grid.shape[0] - 1) + 1
+        sub_coords = [coords[0][i0:i1], coords[1], coords[2]]
+        sub_grid = grid[i0:i1]
+        sub_ids = ids[i0:i1]
+        cmin, cmax = _cell_range(sub_grid)
+        for n, level in enumerate(levels):
+            cells = np.nonzero((cmin <= level) & (cmax > level))
+            if len(cells[0]) == 0:
+                continue
+            vals, pos, vids = _cell_tets(sub_grid, sub_coords, sub_ids,
+                                         cells)
+            iso[n].append(_isosurface(vals, pos, vids, level))
+    iso = [_stack(t) for t in iso]
+
+    # exterior faces of the grid, oriented outward
+    vals, pos, vids = _exterior_tris(grid, coords, ids)
+    tmin = vals.min(axis=1)
+    tmax = vals.max(axis=1)
+
+    tris = []
+    for n, hi in enumerate(levels):
+        if n == 0:
+            lo = -np.inf
+        else:
+            lo = levels[n - 1]
+        band = [iso[n]]
+        if n > 0:
+            # lower isosurface faces down, out of the band
+            band.append(iso[n - 1][:, ::-1])
+        sel = (tmin <= hi) & (tmax >= lo)
+        band.append(_clip_band(vals[sel], pos[sel], vids[sel], lo, hi))
+        tris.append(_stack(band))
+    return tris
+
+
+def _stack(tris):
+    """concatenate a list of triangle arrays"""
+    tris = [t for t in tris if len(t) > 0]
+    if len(tris) == 0:
+        return np.empty((0, 3, 3), dtype=np.float64)
+    return np.concatenate(tris)
+
+
+def _cell_range(grid):
+    """min and max value of the corners of every cell"""
+    cmin = None
+    cmax = None
+    for di, dj, dk in _CORNERS:
+        corner = grid[di:grid.shape[0] - 1 + di,
+                      dj:grid.shape[1] - 1 + dj,
+                      dk:grid.shape[2] - 1 + dk]
+        if cmin is None:
+            cmin = corner.copy()
+            cmax = corner.copy()
+        else:
+            np.minimum(cmin, corner, out=cmin)
+            np.maximum(cmax, corner, out=cmax)
+    return cmin, cmax
+
+
+def _cell_tets(grid, coords, ids, cells):
+    """values, positions, and node ids of the six tets of each cell
+
+    Returns:
+    --------
+        vals: array of floats (6 * C, 4)
+        pos: array of floats (6 * C, 4, 3)
+        vids: array of ints (6 * C, 4)
+    """
+    ci, cj, ck = cells
+    ni = ci[:, np.newaxis] + _CORNERS[:, 0]
+    nj = cj[:, np.newaxis] + _CORNERS[:, 1]
+    nk = ck[:, np.newaxis] + _CORNERS[:, 2]
+    corner_vals = grid[ni, nj, nk]
+    corner_ids = ids[ni, nj, nk]
+    corner_pos = np.stack([coords[0][ni], coords[1][nj], coords[2][nk]],
+                          axis=-1)
+
+    vals = corner_vals[:, _TETS].reshape(-1, 4)
+    vids = corner_ids[:, _TETS].reshape(-1, 4)
+    pos = corner_pos[:, _TETS].reshape(-1, 4, 3)
+    return vals, pos, vids
+
+
+def _interp(pos, vals, ids, rows, a, b, level):
+    """Point where the level crosses the edge a-b of each row. Edges are
+    always interpolated from the node with the lower id so that the same
+    edge gives the same point no matter which element it comes from.
+    """
+    swap = ids[rows, a] > ids[rows, b]
+    u = np.where(swap, b, a)
+    w = np.where(swap, a, b)
+    fu = vals[rows, u]
+    fw = vals[rows, w]
+    xu = pos[rows, u]
+    xw = pos[rows, w]
+    t = (level - fu) / (fw - fu)
+    return xu + t[..., np.newaxis] * (xw - xu)
+
+
+def _isosurface(vals, pos, ids, level):
+    """Marching tetrahedra for a single level. Triangle normals point
+    toward the values above the level.
+    """
+    above = vals > level
+    case = np.dot(above, [1, 2, 4, 8])
+
+    # direction of increasing value in each cut tet
+    cut = (case > 0) & (case < 15)
+    na = above[cut].sum(axis=1)[:, np.newaxis]
+    wa = above[cut][..., np.newaxis]
+    grad = np.zeros((len(vals), 3))
+    grad[cut] = (pos[cut] * wa).sum(axis=1) / na - \
+        (pos[cut] * ~wa).sum(axis=1) / (4 - na)
+
+    tris = []
+    for t in range(2):
+        edges = _CASES[case, t]
+        rows = np.nonzero(edges[:, 0] >= 0)[0]
+        if len(rows) == 0:
+            continue
+        ends = _TET_EDGES[edges[rows]]
+        r = rows[:, np.newaxis]
+        p = _interp(pos, vals, ids, r, ends[..., 0], ends[..., 1], level)
+
+        # orient and drop triangles that collapsed to a point or line
+        n = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+        flip = np.sum(n * grad[rows], axis=1) < 0
+        p[flip] = p[flip][:, ::-1]
+        tris.append(p[np.any(n != 0, axis=1)])
+    return _stack(tris)
+
+
+def _exterior_tris(grid, coords, ids):
+    """Triangles on the six exterior faces of the grid, oriented outward.
+    Faces are split along the same diagonal as the tets.
+
+    Returns:
+    --------
+        vals: array of floats (T, 3)
+        pos: array of floats (T, 3, 3)
+        vids: array of ints (T, 3)
+    """
+    all_vals = []
+    all_pos = []
+    all_ids = []
+    for a in range(3):
+        b = (a + 1) % 3
+        c = (a + 2) % 3
+        nb = grid.shape[b] - 1
+        nc = grid.shape[c] - 1
+        jb, jc = np.meshgrid(np.arange(nb), np.arange(nc), indexing='ij')
+        jb = jb.ravel()
+        jc = jc.ravel()
+        for side in [0, grid.shape[a] - 1]:
+            # quad corners in the (b, c) plane: 00, 10, 11, 01
+            qb = np.stack([jb, jb + 1, jb + 1, jb], axis=1)
+            qc = np.stack([jc, jc, jc + 1, jc + 1], axis=1)
+            if side == 0:
+                # b x c points into the grid, reverse the quad
+                qb = qb[:, [0, 3, 2, 1]]
+                qc = qc[:, [0, 3, 2, 1]]
+            # split along the 00-11 diagonal
+            tb = qb[:, [[0, 1, 2], [0, 2, 3]]].reshape(-1, 3)
+            tc = qc[:, [[0, 1, 2], [0, 2, 3]]].reshape(-1, 3)
+            idx = [None] * 3
+            idx[a] = np.full(tb.shape, side)
+            idx[b] = tb
+            idx[c] = tc
+            all_vals.append(grid[idx[0], idx[1], idx[2]])
+            all_ids.append(ids[idx[0], idx[1], idx[2]])
+            all_pos.append(np.stack([coords[0][idx[0]], coords[1][idx[1]],
+                                     coords[2][idx[2]]], axis=-1))
+    return np.concatenate(all_vals), np.concatenate(all_pos), \
+        np.concatenate(all_ids)
+
+
+def _clip_band(vals, pos, ids, lo, hi):
+    """Clip triangles to the part where lo <= value <= hi. Each clipped
+    polygon is built from the original vertices in the band and the band
+    crossings along each edge (in order), then split into a fan of
+    triangles.
+    """
+    n = len(vals)
+    slots = []
+    valid = []
+    for k in range(3):
+        a = k
+        b = (k + 1) % 3
+        fa = vals[:, a]
+        fb = vals[:, b]
+
+        # vertex a if it is in the band
+        slots.append(pos[:, a])
+        valid.append((fa >= lo) & (fa <= hi))
+
+        # crossings along a -> b, nearest to a first
+        rising = fa < fb
+        for first in [True, False]:
+            level = np.where(rising == first, lo, hi)
+            cross = (np.minimum(fa, fb) < level) & \
+                (level < np.maximum(fa, fb))
+            rows = np.nonzero(cross)[0]
+            p = np.zeros((n, 3), dtype=np.float64)
+            if len(rows) > 0:
+                ea = np.full(len(rows), a)
+                eb = np.full(len(rows), b)
+                p[rows] = _interp(pos, vals, ids, rows, ea, eb, level[rows])
+            slots.append(p)
+            valid.append(cross)
+
+    slots = np.stack(slots, axis=1)
+    valid = np.stack(valid, axis=1)
+
+    # move the used slots to the front, keeping their order
+    order = np.argsort(~valid, axis=1, kind='mergesort')
+    poly = slots[np.arange(n)[:, np.newaxis], order]
+    count = valid.sum(axis=1)
+
+    tris = []
+    for j in range(1, slots.shape[1] - 1):
+        rows = np.nonzero(count > j + 1)[0]
+        if len(rows) == 0:
+            break
+        tris.append(np.stack([poly[rows, 0], poly[rows, j],
+                              poly[rows, j + 1]], axis=1))
+    return _stack(tris)
@@ -0,0 +1,188 @@
+"""Hierarchical min/max index over the blocks of a Cartesian grid of cell
+values. The finest level holds the minimum and maximum value of every
+block of cells and each coarser level merges 2x2x2 nodes of the level
+below it. For a set of level values, only the blocks that can hold a
+band boundary are visited: a node is skipped, with everything below it,
+if its values and those of its six neighbors all fall in the same band
+and it does not touch the exterior of the grid.
+"""
+
+import numpy as np
+
+from IsogeomGenerator import voxel
+
+
+# name of the index file stored in the database folder
+INDEX_FILE = "minmax.npz"
+
+# offsets of the six face neighbors of a node
+_NEIGHBORS = np.array([[-1, 0, 0], [1, 0, 0], [0, -1, 0], [0, 1, 0],
+                       [0, 0, -1], [0, 0, 1]])
+
+# offsets of the eight children of a node
+_CHILDREN = np.array([[i, j, k] for i in range(2) for j in range(2)
+                      for k in range(2)])
+
+
+class MinMaxTree(object):
+    """Min/max block index of a grid of cell values.
+
+    Attributes:
+    -----------
+        shape: tuple of three ints, number of cells along each axis
+        tile: int, number of cells along each edge of a finest block
+        key: string, identifies the mesh and data the index was built
+            for (None if unknown)
+        mins: list of 3D arrays of floats, minimum value of each node,
+            finest level first
+        maxs: list of 3D arrays of floats, maximum value of each node,
+            finest level first
+
+    Methods:
+    --------
+        blocks(): list the finest blocks that can hold a band boundary
+        save(): write the index to a file (can be read by load())
+    """
+
+    def __init__(self, mins, maxs, shape, tile, key=None):
+        """Create the index from the finest level of block extrema.
+
+        Input:
+        ------
+            mins: 3D array of floats, minimum value of each block
+            maxs: 3D array of floats, maximum value of each block
+            shape: tuple of three ints, number of cells along each axis
+            tile: int, number of cells along each edge of a block
+            key: (optional), string, identifies the mesh and data
+        """
+        self.shape = tuple(int(n) for n in shape)
+        self.tile = int(tile)
+        self.key = key
+        self.mins = [np.asarray(mins, dtype=np.float64)]
+        self.maxs = [np.asarray(maxs, dtype=np.float64)]
+        while max(self.mins[-1].shape) > 1:
+            self.mins.append(_reduce(self.mins[-1], np.min, np.inf))
+            self.maxs.append(_reduce(self.maxs[-1], np.max, -np.inf))
+
+    def blocks(self, levels):
+        """Find the finest blocks that can hold a band boundary for the
+        level values, descending from the coarsest level through the
+        nodes that are not skipped.
+
+        Input:
+        ------
+            levels: sorted list of floats, upper bound of each band
+
+        Returns:
+        --------
+            blocks: list of (start, stop) cell index tuples of each block
+                to visit, in the same order as voxel.blocks()
+        """
+        idx = np.zeros((1, 3), dtype=np.int64)
+        for depth in range(len(self.mins) - 1, -1, -1):
+            idx = idx[self.__keep(depth, idx, levels)]
+            if depth > 0:
+                # children of the kept nodes on the next finer level
+                dims = np.array(self.mins[depth - 1].shape)
+                children = (idx[:, np.newaxis, :] * 2 +
+                            _CHILDREN[np.newaxis]).reshape(-1, 3)
+                idx = children[np.all(children < dims, axis=1)]
+
+        order = np.lexsort(idx.T[::-1])
+        blocks = []
+        for i, j, k in idx[order]:
+            start = (int(i) * self.tile, int(j) * self.tile,
+                     int(k) * self.tile)
+            stop = tuple(min(n + self.tile, self.shape[d])
+                         for d, n in enumerate(start))
+            blocks.append((start, stop))
+        return blocks
+
+    def __keep(self, depth, idx, levels):
+        """Mark the nodes that cannot be skipped at one level of the
+        index.
+        """
+        mins = self.mins[depth]
+        maxs = self.maxs[depth]
+        dims = np.array(mins.shape)
+
+        def band_range(ids):
+            t = tuple(ids.T)
+            return voxel.classify(mins[t], levels), \
+                voxel.classify(maxs[t], levels)
+
+        lo, hi = band_range(idx)
+        keep = (lo != hi) | np.any(idx == 0, axis=1) | \
+            np.any(idx == dims - 1, axis=1)
+        for offset in _NEIGHBORS:
+            nbr = idx + offset
+            inside = np.all((nbr >= 0) & (nbr < dims), axis=1)
+            nlo, nhi = band_range(np.where(inside[:, np.newaxis], nbr, idx))
+            keep |= inside & ((nlo != lo) | (nhi != hi))
+        return keep
+
+    def save(self, filename):
+        """Write the finest level of the index to a numpy file.
+
+        Input:
+        ------
+            filename: string, path of the file to write
+        """
+        with open(filename, 'wb') as f:
+            np.savez(f, mins=self.mins[0], maxs=self.maxs[0],
+                     shape=np.array(self.shape), tile=self.tile,
+                     key=np.array("" if self.key is None else self.key))
+
+
+def _reduce(a, func, fill):
+    """Merge 2x2x2 nodes of a level of the index."""
+    pad = [(0, n % 2) for n in a.shape]
+    a = np.pad(a, pad, mode='constant', constant_values=fill)
+    nx, ny, nz = [n // 2 for n in a.shape]
+    return func(a.reshape(nx, 2, ny, 2, nz, 2), axis=(1, 3, 5))
+
+
+def build(grid, tile, key=None):
+    """Build the index of a grid of cell values one block at a time.
+
+    Input:
+    ------
+        grid: 3D array of floats, cell values (may be memory mapped)
+        tile: int, number of cells along each edge of a block
+        key: (optional), string, identifies the mesh and data
+
+    Returns:
+    --------
+        tree: MinMaxTree object
+    """
+    nblocks = tuple(-(-n // tile) for n in grid.shape)
+    mins = np.empty(nblocks)
+    maxs = np.empty(nblocks)
+    for start, stop in voxel.blocks(grid.shape, tile):
+        block = np.asarray(grid[tuple(slice(i, j)
+                                      for i, j in zip(start, stop))])
+        b = tuple(i // tile for i in start)
+        mins[b] = block.min()
+        maxs[b] = block.max()
+    return MinMaxTree(mins, maxs, grid.shape, tile, key)
+
+
+def load(filename):
+    """Read an index written by MinMaxTree.save().
+
+    Input:
+    ------
+        filename: string, path of the file to read
+
+    Returns:
+    --------
+        tree: MinMaxTree object (None if the file does not exist)
+    """
+    try:
+        f = np.load(filename)
+    except IOError:
+        return None
+    with f:
+        key = str(f['key'])
+        return MinMaxTree(f['mins'], f['maxs'], tuple(f['shape']),
+                          int(f['tile']), key if key else None)
@@ -0,0 +1,256 @@
+"""Dry-run planner for an isosurface geometry. The mesh is classified
+into bands against the level values and the faces where the band changes
+are counted on the grid, without VisIt or MOAB. The face counts give the
+number of triangles and surfaces of each isovolume, from which the peak
+MOAB memory and the run time of each stage are estimated with a simple
+per-item cost model.
+"""
+
+import json
+import shutil
+import sys
+import tempfile
+import warnings
+import numpy as np
+import meshio
+
+from IsogeomGenerator import voxel, vtkscan
+
+
+# rough per-item costs of each stage (seconds) and memory use (bytes).
+# Override any of them with the costs argument of estimate().
+COSTS = {
+    # VisIt: session and export overhead per band, isovolume operator
+    # pass over every cell for each band
+    'visit_band': 2.0,
+    'visit_cell': 2e-7,
+    # numpy backend: classification and face search per cell
+    'numpy_cell': 1e-7,
+    # writing one triangle to an STL file
+    'stl_tri': 1e-6,
+    # separate_isovols: per triangle bulk centroid check and component
+    # labeling, meshset updates per vertex of a surface
+    'separate_tri': 2e-6,
+    'separate_vert': 1e-6,
+    # imprint_merge: reading and sorting one vertex coordinate of the
+    # interior surfaces of two neighboring isovolumes
+    'merge_vert': 2e-6,
+    # write_geometry: per triangle and vertex
+    'write_entity': 2e-6,
+    # MOAB memory per vertex (coordinates, handle, adjacencies) and per
+    # triangle (connectivity and set membership)
+    'moab_vert_bytes': 80,
+    'moab_tri_bytes': 48,
+    # vertex coordinates, keys, and sort buffers of imprint_merge
+    'coords_bytes': 64,
+}
+
+
+def _band_grid(filename, data, levels, dirname):
+    """Read the data range and band grid of a Cartesian mesh with cell
+    data, streaming legacy VTK files and reading others with meshio.
+    Levels outside of the data range are removed with a warning.
+    """
+    if vtkscan.is_legacy_vtk(filename):
+        info = vtkscan.scan(filename, data)
+        if info['point_data']:
+            raise RuntimeError("Planning requires cell data, {} is point "
+                               "data.".format(data))
+        mindata = info['min']
+        maxdata = info['max']
+        levels = _check_levels(levels, mindata, maxdata)
+        coords, bands = vtkscan.band_grid(filename, data, levels, dirname)
+    else:
+        mf = meshio.read(filename)
+        cell_data = mf.cell_data.get('hexahedron', {})
+        if data not in cell_data:
+            raise RuntimeError("Planning requires cell data {} on a "
+                               "hexahedral mesh.".format(data))
+        coords, grid = voxel.cartesian_grid(mf.points,
+                                            mf.cells['hexahedron'],
+                                            cell_data[data])
+        mindata = grid.min()
+        maxdata = grid.max()
+        levels = _check_levels(levels, mindata, maxdata)
+        bands = voxel.classify(grid, levels)
+    return coords, bands, levels, mindata, maxdata
+
+
+def _check_levels(levels, mindata, maxdata):
+    """Remove the levels that are outside of the data range."""
+    kept = []
+    for level in levels:
+        if (level <= mindata) or (level >= maxdata):
+            warnings.warn("Level {} is out of data bounds.".format(level))
+        else:
+            kept.append(level)
+    if len(kept) == 0:
+        raise RuntimeError("No data exists within provided levels.")
+    return kept
+
+
+def _schedule(times, workers):
+    """Longest processing time first schedule of independent jobs,
+    returns the time until the last worker finishes.
+    """
+    loads = np.zeros(max(int(workers), 1))
+    for t in sorted(times, reverse=True):
+        loads[np.argmin(loads)] += t
+    return float(loads.max())
+
+
+def estimate(filename, data, levels, backend='visit', workers=1, tile=64,
+             engine_procs=None, costs=None):
+    """Estimate the size of the isosurface geometry and the resources
+    needed to generate it.
+
+    Input:
+    ------
+        filename: string, path to the Cartesian mesh file with cell data
+        data: string, name of the cell data on the mesh
+        levels: list of floats or string, level values or the path to a
+            file with one level value per line
+        backend: (optional), string, 'visit' (default) or 'numpy', the
+            backend used to generate the isovolumes
+        workers: (optional), int, number of VisIt sessions used to
+            generate the isovolumes. Default=1
+        tile: (optional), int, number of cells along each edge of the
+            blocks the grid is processed in. Default=64
+        engine_procs: (optional), int, number of ranks of the parallel
+            VisIt compute engine of each session. Default=None (serial)
+        costs: (optional), dict, overrides for the per-item costs in
+            COSTS
+
+    Returns:
+    --------
+        report: dict, JSON serializable report with the keys:
+            mesh: file, data name, grid shape, cells, and data range
+            levels: list of floats, level values within the data range
+            bands: list of dicts, bounds, cells, and estimated triangles,
+                vertices and surfaces of each isovolume
+            totals: dict, isovolumes, triangles, vertices, and surfaces
+                before (separated) and after merging
+            memory: dict, estimated peak MOAB memory in bytes
+            stages: dict, estimated seconds for generate_vols,
+                separate_isovols, imprint_merge, and write_geometry
+            total_seconds: float, sum of the stage estimates
+    """
+    c = dict(COSTS)
+    if costs is not None:
+        c.update(costs)
+    if isinstance(levels, str):
+        levels = np.loadtxt(levels, ndmin=1)
+    levels = sorted(float(level) for level in levels)
+
+    dirname = tempfile.mkdtemp()
+    try:
+        coords, bands, levels, mindata, maxdata = \
+            _band_grid(filename, data, levels, dirname)
+        nbands = len(levels) + 1
+        cells = np.zeros(nbands, dtype=np.int64)
+        for start, stop in voxel.blocks(bands.shape, tile):
+            sl = tuple(slice(i, j) for i, j in zip(start, stop))
+            cells += np.bincount(np.asarray(bands[sl]).ravel(),
+                                 minlength=nbands)
+        pairs, exterior = voxel.transition_counts(bands, nbands, tile=tile)
+        shape = bands.shape
+        del bands
+    finally:
+        shutil.rmtree(dirname, ignore_errors=True)
+
+    # every boundary face is split into two triangles, a quad surface
+    # has about as many vertices as faces
+    tris = 2 * (pairs.sum(axis=1) + exterior)
+    verts = tris // 2
+    # one interior surface per neighboring band and one exterior surface
+    # (disjoint pieces of a surface are not counted separately)
+    neighbors = [np.nonzero(pairs[b])[0] for b in range(nbands)]
+    surfs = np.array([len(n) + int(exterior[b] > 0)
+                      for b, n in enumerate(neighbors)])
+    merged = int(np.count_nonzero(np.triu(pairs)) +
+                 np.count_nonzero(exterior))
+
+    bounds = [mindata - 10] + list(levels) + [maxdata + 10]
+    band_info = []
+    for b in range(nbands):
+        band_info.append({'lower': float(bounds[b]),
+                          'upper': float(bounds[b + 1]),
+                          'cells': int(cells[b]),
+                          'triangles': int(tris[b]),
+                          'exterior_triangles': int(2 * exterior[b]),
+                          'vertices': int(verts[b]),
+                          'surfaces': int(surfs[b])})
+    occupied = cells > 0
+    ncells = int(np.prod(shape))
+
+    # generate_vols
+    if backend == 'numpy':
+        t_vols = c['numpy_cell'] * ncells + c['stl_tri'] * tris.sum()
+    else:
+        procs = max(engine_procs or 1, 1)
+        band_times = c['visit_band'] + c['visit_cell'] * ncells / procs + \
+            c['stl_tri'] * tris[occupied]
+        t_vols = _schedule(band_times, workers)
+
+    # separate_isovols: the connected surfaces are labeled in one pass
+    # over the triangles and vertices
+    t_sep = c['separate_tri'] * tris.sum() + c['separate_vert'] * verts.sum()
+
+    # imprint_merge: the vertex coordinates of the interior surfaces of
+    # each pair of neighboring isovolumes are sorted together once
+    interior = pairs.sum(axis=1)
+    t_merge = 0.
+    peak_coords = 0
+    for b in range(nbands - 1):
+        v = interior[b] + interior[b + 1]
+        t_merge += c['merge_vert'] * v
+        peak_coords = max(peak_coords, v)
+
+    t_write = c['write_entity'] * (tris.sum() + verts.sum())
+
+    moab = c['moab_vert_bytes'] * verts.sum() + \
+        c['moab_tri_bytes'] * tris.sum()
+    stages = {'generate_vols': float(t_vols),
+              'separate_isovols': float(t_sep),
+              'imprint_merge': float(t_merge),
+              'write_geometry': float(t_write)}
+
+    report = {
+        'mesh': {'file': filename,
+                 'data': data,
+                 'shape': [int(n) for n in shape],
+                 'cells': ncells,
+                 'min': float(mindata),
+                 'max': float(maxdata)},
+        'levels': [float(level) for level in levels],
+        'backend': backend,
+        'workers': int(workers),
+        'bands': band_info,
+        'totals': {'isovolumes': int(np.count_nonzero(occupied)),
+                   'triangles': int(tris.sum()),
+                   'vertices': int(verts.sum()),
+                   'surfaces_separated': int(surfs.sum()),
+                   'surfaces': merged},
+        'memory': {'moab_bytes': int(moab),
+                   'peak_bytes': int(moab + c['coords_bytes'] *
+                                     peak_coords)},
+        'stages': stages,
+        'total_seconds': float(sum(stages.values()))}
+    return report
+
+
+def write_report(report, filename=None):
+    """Write the report as JSON.
+
+    Input:
+    ------
+        report: dict, report from estimate()
+        filename: (optional), string, path of the file to write. If not
+            provided, the report is written to stdout.
+    """
+    if filename is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(filename, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
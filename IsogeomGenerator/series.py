@@ -0,0 +1,195 @@
+"""Reuse of the isovolume extraction across a series of Cartesian meshes
+with the same grid and slowly changing cell data, such as the iterations
+of a weight window process. The band grid of each step is compared to the
+band grid of the previous step one block of cells at a time. Only the
+blocks where the band of a cell changed, in the block or in the layer of
+cells below one of its lower faces, are extracted again and the triangles
+of all other blocks are reused. The band grid and the triangles of each
+block of the previous step are stored in files, so only one block is held
+in memory at a time.
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from IsogeomGenerator import voxel
+
+
+class BlockCache(object):
+    """Triangles of every block of the previous step of a series.
+
+    Attributes:
+    -----------
+        dirname: string, folder with the band grid (bands.npy) and the
+            triangles of each block (blocks/<i>_<j>_<k>.npz, named by the
+            first cell index of the block) of the previous step
+        levels: list of floats, level values of the previous step (None
+            before the first step)
+        tile: int, number of cells along each edge of a block
+        coords: list of three arrays of floats, node positions of the
+            grid of the previous step
+        blocks: set of tuples, first cell index of each block of the
+            previous step whose triangles are stored
+        extracted: int, number of blocks extracted in the last step
+        reused: int, number of blocks reused in the last step
+
+    Methods:
+    --------
+        extract(): write the isovolume files of a step, only extracting
+            the blocks that changed since the previous step
+        close(): delete the stored band grid and triangles of the
+            previous step
+    """
+
+    def __init__(self, dirname=None):
+        """Create an empty cache.
+
+        Input:
+        ------
+            dirname: (optional), string, folder to store the band grid and
+                the block triangles of the previous step in. Default: a
+                new temporary folder
+        """
+        self.dirname = dirname
+        self.__temporary = dirname is None
+        self.levels = None
+        self.tile = None
+        self.coords = None
+        self.blocks = set()
+        self.extracted = 0
+        self.reused = 0
+        self.__bands = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def extract(self, bands, coords, levels, filenames, tile=64,
+                active=None):
+        """Generate the outward facing surface triangles of every band
+        one block of cells at a time and write them to binary STL files
+        (the same files as voxel.extract_tiled()). The triangles of a
+        block are reused from the previous step if the grid, levels, and
+        tile are the same and no band in the block or its halo changed.
+
+        Input:
+        ------
+            bands: 3D array of ints, band index per cell (may be memory
+                mapped)
+            coords: list of three arrays of floats, x, y, and z node
+                positions of the grid
+            levels: list of floats, upper bound of each band
+            filenames: list of strings, path of the STL file for each band
+            tile: (optional), int, number of cells along each edge of a
+                block. Default=64
+            active: (optional), list of (start, stop) tuples, the only
+                blocks of the tiling that can hold a band boundary (see
+                minmax.MinMaxTree.blocks()). Default=None (all blocks)
+        """
+        same = self.__bands is not None and \
+            self.levels == list(levels) and self.tile == tile and \
+            self.__bands.shape == bands.shape and \
+            all(np.array_equal(c, p) for c, p in zip(coords, self.coords))
+        if active is None:
+            active = voxel.blocks(bands.shape, tile)
+        if self.dirname is None:
+            self.dirname = tempfile.mkdtemp()
+        if not os.path.isdir(self.dirname + "/blocks"):
+            os.makedirs(self.dirname + "/blocks")
+
+        self.extracted = 0
+        self.reused = 0
+        blocks = set()
+        writers = [voxel.StlWriter(f) for f in filenames]
+        for start, stop in active:
+            if same and start in self.blocks and \
+                    not self.__changed(bands, start, stop):
+                block_tris = self.__load(start)
+                self.reused += 1
+            else:
+                quads, lower, upper = voxel.block_faces(bands, coords,
+                                                        start, stop)
+                block_tris = [t.astype(np.float32) for t in
+                              voxel.band_triangles(quads, lower, upper,
+                                                   len(levels))]
+                self.__save(start, block_tris)
+                self.extracted += 1
+            blocks.add(start)
+            for writer, band_tris in zip(writers, block_tris):
+                writer.write(band_tris)
+        for writer in writers:
+            writer.close()
+
+        # remove the triangles of blocks that are no longer visited
+        for start in self.blocks - blocks:
+            os.remove(self.__block_path(start))
+        self.blocks = blocks
+        self.levels = list(levels)
+        self.tile = tile
+        self.coords = [np.array(c) for c in coords]
+        self.__store(bands, tile)
+
+    def close(self):
+        """Delete the stored band grid and triangles of the previous
+        step.
+        """
+        self.__bands = None
+        self.blocks = set()
+        self.levels = None
+        if self.dirname is None:
+            return
+        if self.__temporary:
+            shutil.rmtree(self.dirname, ignore_errors=True)
+            self.dirname = None
+            return
+        shutil.rmtree(self.dirname + "/blocks", ignore_errors=True)
+        if os.path.isfile(self.dirname + "/bands.npy"):
+            os.remove(self.dirname + "/bands.npy")
+
+    def __block_path(self, start):
+        """Path of the file with the triangles of a block."""
+        return self.dirname + "/blocks/{}_{}_{}.npz".format(*start)
+
+    def __save(self, start, block_tris):
+        """Write the triangles of each band of a block to its file."""
+        with open(self.__block_path(start), 'wb') as f:
+            np.savez(f, *block_tris)
+
+    def __load(self, start):
+        """Read the triangles of each band of a block from its file."""
+        with np.load(self.__block_path(start)) as f:
+            return [f['arr_{}'.format(b)] for b in range(len(f.files))]
+
+    def __changed(self, bands, start, stop):
+        """Check if any band in a block or in the layer of cells below
+        each of its lower faces differs from the previous step.
+        """
+        sl = [slice(i, j) for i, j in zip(start, stop)]
+        slabs = [tuple(sl)]
+        for d in range(3):
+            if start[d] > 0:
+                halo = list(sl)
+                halo[d] = slice(start[d] - 1, start[d])
+                slabs.append(tuple(halo))
+        return any(not np.array_equal(np.asarray(bands[h]),
+                                      np.asarray(self.__bands[h]))
+                   for h in slabs)
+
+    def __store(self, bands, tile):
+        """Copy the band grid one block at a time to a memory-mapped file
+        for the comparison in the next step.
+        """
+        if self.__bands is None or self.__bands.shape != bands.shape or \
+                self.__bands.dtype != bands.dtype:
+            self.__bands = None
+            self.__bands = np.lib.format.open_memmap(
+                self.dirname + "/bands.npy", mode='w+', dtype=bands.dtype,
+                shape=bands.shape)
+        for start, stop in voxel.blocks(bands.shape, tile):
+            sl = tuple(slice(i, j) for i, j in zip(start, stop))
+            self.__bands[sl] = bands[sl]
+        self.__bands.flush()
@@ -0,0 +1,124 @@
+"""Native NumPy isovolume extraction for unstructured tetrahedral meshes
+with cell data. Every tet is assigned a band index against the level
+values. The faces of all tets are matched by their sorted node triples
+and the surface of each isovolume is the set of faces where the band
+changes, plus the faces of the band on the mesh exterior.
+"""
+
+import numpy as np
+
+from IsogeomGenerator import voxel
+
+
+# faces of a positively oriented tet (a, b, c, d), normals point outward
+_TET_FACES = np.array([[1, 2, 3], [0, 3, 2], [0, 1, 3], [0, 2, 1]])
+
+
+def orient(points, tets):
+    """Reorder the nodes of each tet so that all tets have a positive
+    volume.
+
+    Input:
+    ------
+        points: array of floats (N, 3), coordinates of the mesh nodes
+        tets: array of ints (M, 4), node indices for each tet
+
+    Returns:
+    --------
+        tets: array of ints (M, 4), positively oriented tets
+    """
+    tets = np.array(tets)
+    p0 = points[tets[:, 0]]
+    vol = np.einsum('ij,ij->i', points[tets[:, 1]] - p0,
+                    np.cross(points[tets[:, 2]] - p0,
+                             points[tets[:, 3]] - p0))
+    neg = vol < 0
+    tets[neg] = tets[neg][:, [0, 1, 3, 2]]
+    return tets
+
+
+def face_keys(faces, num_nodes):
+    """Hash each face to a single integer from its sorted node triple.
+    If the triple cannot be packed into 64 bits, the faces are ranked
+    by their sorted triples instead.
+
+    Input:
+    ------
+        faces: array of ints (F, 3), node indices for each face
+        num_nodes: int, total number of nodes in the mesh
+
+    Returns:
+    --------
+        keys: array of ints (F), equal for faces with the same nodes
+    """
+    s = np.sort(faces, axis=1).astype(np.int64)
+    if float(num_nodes) ** 3 < 2. ** 63:
+        return (s[:, 0] * num_nodes + s[:, 1]) * num_nodes + s[:, 2]
+
+    # rank the unique triples
+    order = np.lexsort((s[:, 2], s[:, 1], s[:, 0]))
+    sorted_faces = s[order]
+    new = np.ones(len(s), dtype=bool)
+    new[1:] = np.any(sorted_faces[1:] != sorted_faces[:-1], axis=1)
+    keys = np.empty(len(s), dtype=np.int64)
+    keys[order] = np.cumsum(new) - 1
+    return keys
+
+
+def boundary_faces(points, tets, bands):
+    """Find every tet face where the band changes, including the faces
+    on the exterior of the mesh.
+
+    Input:
+    ------
+        points: array of floats (N, 3), coordinates of the mesh nodes
+        tets: array of ints (M, 4), positively oriented tets
+        bands: array of ints (M), band index per tet
+
+    Returns:
+    --------
+        faces: array of ints (F, 3), node indices of each face oriented
+            outward from its band
+        labels: array of ints (F), band each face belongs to
+    """
+    faces = tets[:, _TET_FACES].reshape(-1, 3)
+    labels = np.repeat(bands, 4)
+    keys = face_keys(faces, len(points))
+
+    # interior faces appear twice, once from each tet
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    pair = np.nonzero(sorted_keys[1:] == sorted_keys[:-1])[0]
+    partner = np.full(len(faces), -1, dtype=labels.dtype)
+    partner[order[pair]] = labels[order[pair + 1]]
+    partner[order[pair + 1]] = labels[order[pair]]
+
+    keep = partner != labels
+    return faces[keep], labels[keep]
+
+
+def extract(points, tets, values, levels):
+    """Generate the outward facing surface triangles of every band.
+
+    Input:
+    ------
+        points: array of floats (N, 3), coordinates of the mesh nodes
+        tets: array of ints (M, 4), node indices for each tet
+        values: array of floats (M), cell data for each tet
+        levels: sorted list of floats, upper bound of each band
+
+    Returns:
+    --------
+        tris: list of arrays of floats (T, 3, 3), triangles for each band
+    """
+    points = np.asarray(points, dtype=np.float64)
+    tets = orient(points, tets)
+    values = np.asarray(values, dtype=np.float64).ravel()
+    bands = voxel.classify(values, levels)
+    faces, labels = boundary_faces(points, tets, bands)
+
+    order = np.argsort(labels, kind='mergesort')
+    faces = faces[order]
+    counts = np.bincount(labels, minlength=len(levels))
+    splits = np.cumsum(counts)[:-1]
+    return [points[f] for f in np.split(faces, splits)]
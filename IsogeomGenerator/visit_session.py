@@ -0,0 +1,195 @@
+"""Persistent VisIt session for isovolume extraction. The compute engine,
+the Pseudocolor plot, and its Isovolume and ExternalSurface operators are
+created once and kept alive, so exporting another band only updates the
+Isovolume bounds. The same session can be reused for several meshes and
+datasets in one process. The engine can also be a local parallel compute
+engine started with an MPI launcher.
+"""
+
+import atexit
+
+try:
+    import visit as v
+except ImportError:
+    v = None
+
+_shared = None
+
+
+class VisItSession(object):
+    """Warm VisIt session with a reusable Isovolume pipeline. VisIt keeps
+    a single set of plots per process, so only one session should be
+    open in a process at a time (normally the one from shared()).
+
+    Attributes:
+    -----------
+        launched: bool, True if the compute engine has been launched
+        engine_procs: int, number of ranks of the parallel compute engine
+            (None for the serial engine)
+        launcher: string, MPI launcher used to start a parallel engine
+        filename: string, path to the mesh file that is open (None if no
+            file is open)
+        data: string, name of the data that is plotted
+
+    Methods:
+    --------
+        open(): make the pipeline for a mesh file and data current
+        export(): export the outer surface of one isovolume as STL
+        close(): delete the pipeline and close the compute engine
+    """
+
+    def __init__(self, launcher='mpirun'):
+        """Create a session. VisIt is not launched until a mesh file is
+        opened.
+
+        Input:
+        ------
+            launcher: (optional), string, MPI launcher used to start a
+                parallel compute engine on the local machine.
+                Default='mpirun'
+        """
+        self.launched = False
+        self.engine_procs = None
+        self.launcher = launcher
+        self.filename = None
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self, filename, data, engine_procs=None):
+        """Make the Isovolume pipeline for the data on a mesh file current.
+        The compute engine is only launched once (or again if the number
+        of ranks changes), the file is only opened (and the pipeline
+        built) if it is not already open, and only the plotted variable
+        is changed for new data on the same file.
+
+        Input:
+        ------
+            filename: string, path to vtk file with the mesh
+            data: string, name of data on the mesh
+            engine_procs: (optional), int, number of ranks of a local
+                parallel compute engine. Default=None (serial engine)
+        """
+        if v is None:
+            raise RuntimeError("VisIt python module could not be " +
+                               "imported.")
+        if engine_procs is not None and engine_procs <= 1:
+            engine_procs = None
+        if self.launched and engine_procs != self.engine_procs:
+            self.close()
+        if not self.launched:
+            try:
+                v.LaunchNowin()
+            except:
+                pass
+            if engine_procs is not None:
+                args = ("-np", str(engine_procs), "-l", self.launcher)
+                if not v.OpenComputeEngine("localhost", args):
+                    raise RuntimeError("Could not open a parallel compute "
+                                       "engine with {} ranks using "
+                                       "{}.".format(engine_procs,
+                                                    self.launcher))
+            self.engine_procs = engine_procs
+            self.launched = True
+
+        if filename != self.filename:
+            if self.filename is not None:
+                v.DeleteAllPlots()
+                v.CloseDatabase(self.filename)
+            v.OpenDatabase(filename)
+
+            # plot the pseudocolor data with the operators to get the
+            # outer surface of each isovolume
+            v.AddPlot("Pseudocolor", data)
+            v.AddOperator("Isovolume")
+            v.AddOperator("ExternalSurface")
+            self.filename = filename
+            self.data = data
+        elif data != self.data:
+            v.ChangeActivePlotsVar(data)
+            self.data = data
+
+    def export(self, lbound, ubound, dirname, filename):
+        """Set the bounds of the Isovolume operator and export just the
+        outer surface of the volume as STL.
+
+        Input:
+        ------
+            lbound: float, lower boundary value for the isovolume
+            ubound: float, upper boundary value for the isovolume
+            dirname: string, folder to export the file to
+            filename: string, name of the exported file (no extension)
+
+        Returns:
+        --------
+            export_res: int, 0 if there was no data to export, else 1
+        """
+        if self.filename is None:
+            raise RuntimeError("No mesh file is open in the VisIt session.")
+
+        # update the isovolume bounds
+        att = v.IsovolumeAttributes()
+        att.lbound = lbound
+        att.ubound = ubound
+        v.SetOperatorOptions(att)
+        v.DrawPlots()
+
+        # export current volume to folder
+        e = v.ExportDBAttributes()
+        e.dirname = dirname
+        e.db_type = "STL"
+        e.filename = filename
+        e.variables = self.data
+        return v.ExportDatabase(e)
+
+    def close(self):
+        """Delete the pipeline and close the compute engine."""
+        if self.filename is not None:
+            v.DeleteAllPlots()
+            v.CloseDatabase(self.filename)
+            self.filename = None
+            self.data = None
+        if self.launched:
+            v.CloseComputeEngine()
+            self.launched = False
+            self.engine_procs = None
+
+
+def shared():
+    """Get the session shared by everything in this process. It is
+    created on first use and closed when the process exits.
+
+    Returns:
+    --------
+        session: VisItSession object
+    """
+    global _shared
+    if _shared is None:
+        _shared = VisItSession()
+        atexit.register(_shared.close)
+    return _shared
+
+
+def release(session=None):
+    """Close a session, the shared session, and the VisIt viewer of this
+    process, so that a process forked from it launches its own viewer
+    instead of driving this one. The sessions launch VisIt again when
+    they are next opened.
+
+    Input:
+    ------
+        session: (optional), VisItSession object, another session to
+            close in addition to the shared session
+    """
+    for s in [session, _shared]:
+        if s is not None:
+            s.close()
+    if v is not None:
+        try:
+            v.Close()
+        except:
+            pass
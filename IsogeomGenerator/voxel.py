@@ -0,0 +1,479 @@
+"""Native NumPy isovolume extraction for Cartesian hexahedral meshes with
+cell data. Every cell is assigned a band index against the level values.
+The surface of each isovolume is then the set of hex faces where the band
+index changes, plus the faces of the band that lie on the mesh exterior.
+Grids that do not fit in memory can be processed one block at a time.
+"""
+
+import numpy as np
+
+
+# names of the grid axes
+AXES = ['x', 'y', 'z']
+
+# binary STL record: normal, three vertices, attribute byte count
+_STL_DTYPE = np.dtype([('normal', '<f4', (3,)),
+                       ('verts', '<f4', (3, 3)),
+                       ('attr', '<u2')])
+
+
+def cartesian_grid(points, hexes, values):
+    """Arrange the cell values of a Cartesian hexahedral mesh on a
+    structured grid.
+
+    Input:
+    ------
+        points: array of floats (N, 3), coordinates of the mesh nodes
+        hexes: array of ints (M, 8), node indices for each hexahedron
+            (VTK ordering)
+        values: array of floats (M), cell data for each hexahedron
+
+    Returns:
+    --------
+        coords: list of three arrays of floats, sorted x, y, and z node
+            positions of the grid
+        grid: 3D array of floats, cell values indexed by [i, j, k]
+    """
+    points = np.asarray(points, dtype=np.float64)
+    hexes = np.asarray(hexes)
+    values = np.asarray(values, dtype=np.float64).ravel()
+    coords = [np.unique(points[:, a]) for a in range(3)]
+    shape = tuple(len(c) - 1 for c in coords)
+    if len(values) != len(hexes) or len(hexes) != np.prod(shape):
+        raise RuntimeError("Mesh is not a complete Cartesian grid.")
+
+    # nodes 0 and 6 are opposite corners of a VTK hexahedron
+    lower = np.minimum(points[hexes[:, 0]], points[hexes[:, 6]])
+    idx = [np.searchsorted(coords[a], lower[:, a]) for a in range(3)]
+    flat = np.ravel_multi_index(idx, shape)
+    if np.bincount(flat, minlength=len(flat)).max() != 1:
+        raise RuntimeError("Mesh is not a complete Cartesian grid.")
+
+    grid = np.empty(shape, dtype=np.float64)
+    grid.flat[flat] = values
+    return coords, grid
+
+
+def classify(grid, levels):
+    """Assign each cell the index of the band it belongs to. Band i
+    contains values in (levels[i - 1], levels[i]].
+
+    Input:
+    ------
+        grid: array of floats, cell values
+        levels: sorted list of floats, upper bound of each band (the
+            last value must be greater than all data)
+
+    Returns:
+    --------
+        bands: array of ints (same shape as grid), band index per cell
+    """
+    bands = np.searchsorted(levels, grid, side='left')
+    return bands.astype(np.int32)
+
+
+def boundary_faces(bands, coords):
+    """Find every face of the grid where the band index changes,
+    including the faces on the exterior of the grid.
+
+    Input:
+    ------
+        bands: 3D array of ints, band index per cell
+        coords: list of three arrays of floats, x, y, and z node
+            positions of the grid
+
+    Returns:
+    --------
+        quads: array of floats (F, 4, 3), corners of each face ordered
+            so that the face normal points along the positive axis
+        lower: array of ints (F), band of the cell on the negative side
+            of the face (-1 if on the exterior)
+        upper: array of ints (F), band of the cell on the positive side
+            of the face (-1 if on the exterior)
+    """
+    return block_faces(bands, coords, (0, 0, 0), bands.shape)
+
+
+def block_faces(bands, coords, start, stop):
+    """Find the faces where the band index changes that are owned by a
+    block of cells. A block owns the faces on its lower side along each
+    axis and the faces inside it, plus the exterior faces on its upper
+    side if it is the last block along that axis. Only the block and a
+    one cell halo on its lower sides are read from bands, so blocks that
+    tile the grid give every face exactly once.
+
+    Input:
+    ------
+        bands: 3D array of ints, band index per cell (may be memory
+            mapped)
+        coords: list of three arrays of floats, x, y, and z node
+            positions of the grid
+        start: tuple of three ints, first cell index of the block
+        stop: tuple of three ints, cell index after the end of the block
+
+    Returns:
+    --------
+        quads: array of floats (F, 4, 3), corners of each face ordered
+            so that the face normal points along the positive axis
+        lower: array of ints (F), band of the cell on the negative side
+            of the face (-1 if on the exterior)
+        upper: array of ints (F), band of the cell on the positive side
+            of the face (-1 if on the exterior)
+    """
+    quads = []
+    lower = []
+    upper = []
+    for a, lo, hi in block_neighbors(bands, start, stop):
+        # axes b and c are cyclic with a so that b x c points along a
+        b = (a + 1) % 3
+        c = (a + 2) % 3
+        mask = lo != hi
+        idx = [i + start[d] for d, i in enumerate(np.nonzero(mask))]
+
+        quad = np.empty((len(idx[0]), 4, 3), dtype=np.float64)
+        quad[:, :, a] = coords[a][idx[a]][:, np.newaxis]
+        b0 = coords[b][idx[b]]
+        b1 = coords[b][idx[b] + 1]
+        c0 = coords[c][idx[c]]
+        c1 = coords[c][idx[c] + 1]
+        quad[:, 0, b] = b0
+        quad[:, 0, c] = c0
+        quad[:, 1, b] = b1
+        quad[:, 1, c] = c0
+        quad[:, 2, b] = b1
+        quad[:, 2, c] = c1
+        quad[:, 3, b] = b0
+        quad[:, 3, c] = c1
+
+        quads.append(quad)
+        lower.append(lo[mask])
+        upper.append(hi[mask])
+
+    return np.concatenate(quads), np.concatenate(lower), \
+        np.concatenate(upper)
+
+
+def block_neighbors(bands, start, stop):
+    """Pair the band of each cell in a block with the band of the next
+    cell along each axis, covering the faces owned by the block (see
+    block_faces()).
+
+    Input:
+    ------
+        bands: 3D array of ints, band index per cell (may be memory
+            mapped)
+        start: tuple of three ints, first cell index of the block
+        stop: tuple of three ints, cell index after the end of the block
+
+    Returns:
+    --------
+        generator of (a, lo, hi) for each axis a, where lo and hi are 3D
+            arrays of ints with the bands on the negative and positive
+            side of each face normal to a (-1 if on the exterior). The
+            face at [i, j, k] lies on the lower side of cell start +
+            [i, j, k].
+    """
+    shape = bands.shape
+    for a in range(3):
+        # read the block with the halo cell below it along axis a
+        sl = [slice(start[d], stop[d]) for d in range(3)]
+        sl[a] = slice(max(start[a] - 1, 0), stop[a])
+        block = np.asarray(bands[tuple(sl)])
+
+        # pad with an exterior band on the sides of the grid
+        pad = [(0, 0)] * 3
+        pad[a] = (int(start[a] == 0), int(stop[a] == shape[a]))
+        padded = np.pad(block, pad, mode='constant', constant_values=-1)
+        yield a, np.delete(padded, -1, axis=a), np.delete(padded, 0, axis=a)
+
+
+def blocks(shape, tile):
+    """Split a grid into blocks of cells.
+
+    Input:
+    ------
+        shape: tuple of three ints, number of cells along each axis
+        tile: int, number of cells along each edge of a block
+
+    Returns:
+    --------
+        generator of (start, stop) cell index tuples of each block
+    """
+    for i in range(0, shape[0], tile):
+        for j in range(0, shape[1], tile):
+            for k in range(0, shape[2], tile):
+                start = (i, j, k)
+                stop = tuple(min(n + tile, shape[d])
+                             for d, n in enumerate(start))
+                yield start, stop
+
+
+def transition_counts(bands, nbands, tile=64):
+    """Count the faces between each pair of different bands and the
+    faces of each band on the exterior of the grid, one block of cells
+    at a time. The number of boundary faces of band b is then
+    pairs[b].sum() + exterior[b].
+
+    Input:
+    ------
+        bands: 3D array of ints, band index per cell (may be memory
+            mapped)
+        nbands: int, total number of bands
+        tile: (optional), int, number of cells along each edge of a
+            block. Default=64
+
+    Returns:
+    --------
+        pairs: 2D array of ints (nbands, nbands), symmetric number of
+            faces shared by each pair of bands (zero diagonal)
+        exterior: array of ints (nbands), number of exterior faces of
+            each band
+    """
+    pairs = np.zeros(nbands * nbands, dtype=np.int64)
+    exterior = np.zeros(nbands, dtype=np.int64)
+    for start, stop in blocks(bands.shape, tile):
+        for a, lo, hi in block_neighbors(bands, start, stop):
+            mask = lo != hi
+            lo = lo[mask].astype(np.int64)
+            hi = hi[mask].astype(np.int64)
+            outside = (lo < 0) | (hi < 0)
+            exterior += np.bincount(np.maximum(lo, hi)[outside],
+                                    minlength=nbands)
+            inside = ~outside
+            pairs += np.bincount(lo[inside] * nbands + hi[inside],
+                                 minlength=nbands * nbands)
+    pairs = pairs.reshape(nbands, nbands)
+    return pairs + pairs.T, exterior
+
+
+def band_triangles(quads, lower, upper, nbands):
+    """Split the boundary faces into the outward facing triangles of
+    each band.
+
+    Input:
+    ------
+        quads: array of floats (F, 4, 3), faces from boundary_faces()
+        lower: array of ints (F), band on the negative side of each face
+        upper: array of ints (F), band on the positive side of each face
+        nbands: int, total number of bands
+
+    Returns:
+    --------
+        tris: list of arrays of floats (T, 3, 3), triangles for each band
+    """
+    # the negative side sees the face as is, the positive side sees it
+    # reversed (same diagonal so coincident triangles are identical)
+    faces = np.concatenate([quads, quads[:, [0, 3, 2, 1]]])
+    labels = np.concatenate([lower, upper])
+    keep = labels >= 0
+    faces = faces[keep]
+    labels = labels[keep]
+
+    order = np.argsort(labels, kind='mergesort')
+    faces = faces[order]
+    counts = np.bincount(labels, minlength=nbands)
+    splits = np.cumsum(counts)[:-1]
+
+    tris = []
+    for band_faces in np.split(faces, splits):
+        tris.append(band_faces[:, [[0, 1, 2], [0, 2, 3]]].reshape(-1, 3, 3))
+    return tris
+
+
+def extract(grid, coords, levels):
+    """Generate the outward facing surface triangles of every band in a
+    single pass over the grid.
+
+    Input:
+    ------
+        grid: 3D array of floats, cell values
+        coords: list of three arrays of floats, x, y, and z node
+            positions of the grid
+        levels: sorted list of floats, upper bound of each band
+
+    Returns:
+    --------
+        tris: list of arrays of floats (T, 3, 3), triangles for each band
+    """
+    bands = classify(grid, levels)
+    quads, lower, upper = boundary_faces(bands, coords)
+    return band_triangles(quads, lower, upper, len(levels))
+
+
+def extract_tiled(bands, coords, nbands, filenames, tile=64, active=None):
+    """Generate the outward facing surface triangles of every band one
+    block of cells at a time and append them to binary STL files, so
+    that memory use is bounded by the block size.
+
+    Input:
+    ------
+        bands: 3D array of ints, band index per cell (may be memory
+            mapped)
+        coords: list of three arrays of floats, x, y, and z node
+            positions of the grid
+        nbands: int, total number of bands
+        filenames: list of strings, path of the STL file for each band
+        tile: (optional), int, number of cells along each edge of a
+            block. Default=64
+        active: (optional), list of (start, stop) tuples, the only
+            blocks of the tiling that can hold a band boundary (see
+            minmax.MinMaxTree.blocks()). Default=None (all blocks)
+    """
+    if active is None:
+        active = blocks(bands.shape, tile)
+    writers = [StlWriter(f) for f in filenames]
+    for start, stop in active:
+        quads, lower, upper = block_faces(bands, coords, start, stop)
+        tris = band_triangles(quads, lower, upper, nbands)
+        for writer, band_tris in zip(writers, tris):
+            writer.write(band_tris)
+    for writer in writers:
+        writer.close()
+
+
+class StlWriter(object):
+    """Binary STL file that triangles can be appended to. The number of
+    triangles in the header is written when the file is closed.
+    """
+
+    def __init__(self, filename):
+        """Open the file and write the header.
+
+        Input:
+        ------
+            filename: string, path of the file to write
+        """
+        self.count = 0
+        self.f = open(filename, 'wb')
+        header = "IsogeomGenerator numpy STL".ljust(80)
+        self.f.write(header.encode('ascii'))
+        self.f.write(np.array([0], dtype='<u4').tobytes())
+
+    def write(self, tris):
+        """Append triangles to the file.
+
+        Input:
+        ------
+            tris: array of floats (T, 3, 3), vertices of each triangle
+        """
+        tris = np.asarray(tris, dtype=np.float32).reshape(-1, 3, 3)
+        normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+        lengths = np.linalg.norm(normals, axis=1)
+        lengths[lengths == 0] = 1.
+        records = np.zeros(len(tris), dtype=_STL_DTYPE)
+        records['normal'] = normals / lengths[:, np.newaxis]
+        records['verts'] = tris
+        self.f.write(records.tobytes())
+        self.count += len(tris)
+
+    def close(self):
+        """Write the number of triangles and close the file."""
+        self.f.seek(80)
+        self.f.write(np.array([self.count], dtype='<u4').tobytes())
+        self.f.close()
+
+
+def write_stl(filename, tris):
+    """Write triangles to a binary STL file.
+
+    Input:
+    ------
+        filename: string, path of the file to write
+        tris: array of floats (T, 3, 3), vertices of each triangle
+    """
+    writer = StlWriter(filename)
+    writer.write(tris)
+    writer.close()
+
+
+# name of the single isovolume file with a band label on every triangle
+LABELED_FILE = "isovols.vtk"
+
+
+def write_labeled_vtk(filename, tris):
+    """Write the triangles of every band to one binary legacy VTK
+    polydata file with the band index of each triangle as the cell data
+    'band'. Coincident vertices are merged within each band, but not
+    between bands.
+
+    Input:
+    ------
+        filename: string, path of the file to write
+        tris: list of arrays of floats (T, 3, 3), triangles for each band
+    """
+    points = []
+    conn = []
+    labels = []
+    offset = 0
+    for i, band_tris in enumerate(tris):
+        verts = np.asarray(band_tris, dtype=np.float32).reshape(-1, 3)
+        if len(verts) == 0:
+            continue
+        unique, inverse = np.unique(verts, axis=0, return_inverse=True)
+        points.append(unique)
+        conn.append(inverse.reshape(-1, 3) + offset)
+        labels.append(np.full(len(verts) // 3, i, dtype=np.int32))
+        offset += len(unique)
+    if len(points) == 0:
+        points = [np.zeros((0, 3), dtype=np.float32)]
+        conn = [np.zeros((0, 3), dtype=np.int64)]
+        labels = [np.zeros(0, dtype=np.int32)]
+    points = np.concatenate(points)
+    conn = np.concatenate(conn)
+    labels = np.concatenate(labels)
+
+    polys = np.empty((len(conn), 4), dtype='>i4')
+    polys[:, 0] = 3
+    polys[:, 1:] = conn
+    with open(filename, 'wb') as f:
+        f.write("# vtk DataFile Version 3.0\n"
+                "IsogeomGenerator labeled isovolumes\n"
+                "BINARY\n"
+                "DATASET POLYDATA\n".encode('ascii'))
+        f.write("POINTS {} float\n".format(len(points)).encode('ascii'))
+        f.write(points.astype('>f4').tobytes())
+        f.write("\nPOLYGONS {} {}\n".format(len(conn),
+                                            polys.size).encode('ascii'))
+        f.write(polys.tobytes())
+        f.write("\nCELL_DATA {}\n"
+                "SCALARS band int 1\n"
+                "LOOKUP_TABLE default\n".format(len(conn)).encode('ascii'))
+        f.write(labels.astype('>i4').tobytes())
+        f.write("\n".encode('ascii'))
+
+
+def read_labeled_vtk(filename):
+    """Read a file written by write_labeled_vtk().
+
+    Input:
+    ------
+        filename: string, path of the file to read
+
+    Returns:
+    --------
+        points: array of floats (N, 3), vertex coordinates
+        conn: array of ints (T, 3), vertex indices of each triangle
+        labels: array of ints (T), band index of each triangle
+    """
+    with open(filename, 'rb') as f:
+        header = [f.readline().strip() for i in range(4)]
+        if header[2] != b"BINARY" or header[3] != b"DATASET POLYDATA":
+            raise RuntimeError("{} is not a binary VTK polydata "
+                               "file.".format(filename))
+        npoints = int(f.readline().split()[1])
+        points = np.frombuffer(f.read(12 * npoints), dtype='>f4')
+        f.readline()
+        line = f.readline().split()
+        ntris = int(line[1])
+        polys = np.frombuffer(f.read(4 * int(line[2])), dtype='>i4')
+        f.readline()
+        f.readline()
+        f.readline()
+        f.readline()
+        labels = np.frombuffer(f.read(4 * ntris), dtype='>i4')
+    polys = polys.reshape(ntris, 4)
+    if np.any(polys[:, 0] != 3):
+        raise RuntimeError("{} contains polygons that are not "
+                           "triangles.".format(filename))
+    return points.reshape(-1, 3).astype(np.float64), \
+        polys[:, 1:].astype(np.int64), labels.astype(np.int64)
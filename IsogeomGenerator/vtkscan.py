@@ -0,0 +1,701 @@
+"""Streaming scanner for legacy VTK files (ASCII or binary). The file is
+read once in fixed size chunks to find the range of a data array and the
+extents of the mesh without ever holding the full mesh in memory.
+Sections that are not needed are skipped (binary sections are seeked
+over).
+"""
+
+import numpy as np
+
+from IsogeomGenerator import voxel
+
+
+# legacy VTK type names and their numpy types (binary data is big endian)
+_DTYPES = {'unsigned_char': 'u1', 'char': 'i1',
+           'unsigned_short': 'u2', 'short': 'i2',
+           'unsigned_int': 'u4', 'int': 'i4',
+           'unsigned_long': 'u8', 'long': 'i8',
+           'float': 'f4', 'double': 'f8',
+           'vtkidtype': 'i4',
+           'vtktypeint8': 'i1', 'vtktypeuint8': 'u1',
+           'vtktypeint16': 'i2', 'vtktypeuint16': 'u2',
+           'vtktypeint32': 'i4', 'vtktypeuint32': 'u4',
+           'vtktypeint64': 'i8', 'vtktypeuint64': 'u8',
+           'vtktypefloat32': 'f4', 'vtktypefloat64': 'f8'}
+
+# number of values per point or cell for attributes that are skipped
+_ATTR_WIDTHS = {'VECTORS': 3, 'NORMALS': 3, 'TENSORS': 9, 'TENSORS6': 6}
+
+# cell connectivity sections
+_CELL_SECTIONS = ['CELLS', 'POLYGONS', 'LINES', 'VERTICES',
+                  'TRIANGLE_STRIPS']
+
+_WHITESPACE = [b' ', b'\n', b'\t', b'\r']
+_IS_SPACE = np.zeros(256, dtype=bool)
+_IS_SPACE[[ord(w) for w in _WHITESPACE]] = True
+
+
+class _Stream(object):
+    """Buffered reader that returns keyword lines and chunks of ASCII or
+    binary values from a legacy VTK file.
+    """
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.binary = False
+        self.buf = b''
+        self.pos = 0
+        self.eof = False
+
+    def __fill(self):
+        """Read the next chunk of the file into the buffer."""
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def raw_line(self):
+        """Return the next line (may be empty), None at end of file."""
+        end = self.buf.find(b'\n', self.pos)
+        while end < 0 and self.__fill():
+            end = self.buf.find(b'\n', self.pos)
+        if end < 0:
+            if self.pos >= len(self.buf):
+                return None
+            end = len(self.buf)
+        line = self.buf[self.pos:end]
+        self.pos = end + 1
+        return line.decode('latin-1').strip()
+
+    def line(self):
+        """Return the next non-empty line, None at end of file."""
+        line = self.raw_line()
+        while line is not None and line == '':
+            line = self.raw_line()
+        return line
+
+    def startswith(self, word):
+        """Check if the next line starts with word without consuming it.
+        Leading whitespace is only skipped for ASCII files.
+        """
+        word = word.encode('latin-1')
+        while True:
+            if not self.binary:
+                rest = self.buf[self.pos:].lstrip()
+            else:
+                rest = self.buf[self.pos:]
+            if len(rest) >= len(word) or self.eof:
+                return rest[:len(word)] == word
+            self.__fill()
+
+    def values(self, n, dtype, width=1):
+        """Generate chunks of values. Each chunk is an array of floats
+        with shape (-1, width).
+
+        Input:
+        ------
+            n: int, total number of values to read
+            dtype: string, VTK type name of the values
+            width: (optional), int, number of values per row
+        """
+        carry = np.empty(0)
+        for chunk in self.__chunks(n, dtype):
+            chunk = np.concatenate([carry, chunk.astype(np.float64)])
+            rows = len(chunk) // width
+            carry = chunk[rows * width:]
+            if rows > 0:
+                yield chunk[:rows * width].reshape(rows, width)
+
+    def skip(self, n, dtype):
+        """Skip over n values.
+
+        Input:
+        ------
+            n: int, total number of values to skip
+            dtype: string, VTK type name of the values
+        """
+        if not self.binary:
+            self.__ascii_skip(n)
+            return
+        nbytes = n * self.__binary_dtype(dtype).itemsize
+        avail = len(self.buf) - self.pos
+        if nbytes <= avail:
+            self.pos += nbytes
+        else:
+            self.f.seek(nbytes - avail, 1)
+            self.buf = b''
+            self.pos = 0
+
+    def __chunks(self, n, dtype):
+        if not self.binary:
+            for tokens in self.__ascii_tokens(n):
+                yield np.array(tokens, dtype=np.float64)
+            return
+        dt = self.__binary_dtype(dtype)
+        per_chunk = max(1, self.chunk_size // dt.itemsize)
+        remaining = n
+        while remaining > 0:
+            count = min(per_chunk, remaining)
+            data = self.__take(count * dt.itemsize)
+            yield np.frombuffer(data, dtype=dt)
+            remaining -= count
+
+    def __binary_dtype(self, dtype):
+        dtype = dtype.lower()
+        if dtype not in _DTYPES:
+            raise RuntimeError(
+                "VTK data type {} is not supported.".format(dtype))
+        return np.dtype('>' + _DTYPES[dtype])
+
+    def __take(self, nbytes):
+        """Return exactly nbytes from the buffer and file."""
+        part = self.buf[self.pos:self.pos + nbytes]
+        self.pos += len(part)
+        if len(part) < nbytes:
+            part += self.f.read(nbytes - len(part))
+            self.buf = b''
+            self.pos = 0
+        if len(part) < nbytes:
+            raise RuntimeError("Unexpected end of VTK file.")
+        return part
+
+    def __ascii_segment(self):
+        """Return the rest of the buffer up to its last whitespace so
+        that no token is split, reading more of the file if needed.
+        """
+        while True:
+            end = max(self.buf.rfind(w, self.pos) for w in _WHITESPACE)
+            if self.eof:
+                end = len(self.buf)
+            if (end > self.pos and
+                    self.buf[self.pos:end].strip()) or self.eof:
+                return self.buf[self.pos:end], end
+            self.__fill()
+
+    def __ascii_tokens(self, n):
+        """Generate lists of up to one chunk of ASCII tokens until n
+        tokens have been read.
+        """
+        need = n
+        while need > 0:
+            seg, end = self.__ascii_segment()
+            tokens = seg.split(None, need)
+            if len(tokens) == 0:
+                raise RuntimeError("Unexpected end of VTK file.")
+            if len(tokens) > need:
+                # stop right before the first unused token
+                rest = tokens.pop()
+                self.pos += len(seg) - len(rest)
+            else:
+                self.pos = end
+            need -= len(tokens)
+            yield tokens
+
+    def __ascii_skip(self, n):
+        """Skip n ASCII tokens by counting the starts of tokens."""
+        need = n
+        while need > 0:
+            seg, end = self.__ascii_segment()
+            chars = np.frombuffer(seg, dtype=np.uint8)
+            space = _IS_SPACE[chars]
+            starts = np.flatnonzero(~space[1:] & space[:-1]) + 1
+            if len(chars) > 0 and not space[0]:
+                starts = np.concatenate([[0], starts])
+            if len(starts) == 0:
+                raise RuntimeError("Unexpected end of VTK file.")
+            if len(starts) > need:
+                self.pos += int(starts[need])
+                need = 0
+            else:
+                self.pos = end
+                need -= len(starts)
+
+
+def is_legacy_vtk(filename):
+    """Check if a file is a legacy VTK file.
+
+    Input:
+    ------
+        filename: string, path to the file
+
+    Returns:
+    --------
+        legacy: bool, True if the file has a legacy VTK header
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(64)
+    return header.lstrip().startswith(b'# vtk DataFile')
+
+
+class _Visitor(object):
+    """Receives the sections of a legacy VTK file from _walk(). Every
+    method must consume the values of its section, by default they are
+    skipped. Set done to stop reading the file early.
+    """
+
+    def __init__(self):
+        self.dataset = None
+        self.dims = None
+        self.origin = np.zeros(3)
+        self.spacing = np.ones(3)
+        self.done = False
+
+    def points(self, s, n, dtype):
+        s.skip(3 * n, dtype)
+
+    def cells(self, s, words, version):
+        if version >= 5.:
+            # offsets and connectivity arrays
+            for size in [int(words[1]), int(words[2])]:
+                s.skip(size, s.line().split()[1])
+        else:
+            s.skip(int(words[2]), 'int')
+
+    def coordinates(self, s, axis, n, dtype):
+        s.skip(n, dtype)
+
+    def array(self, s, name, location, num, ncomp, dtype):
+        s.skip(num * ncomp, dtype)
+
+
+def _walk(filename, visitor, chunk_size):
+    """Read a legacy VTK file section by section and pass each section
+    to the visitor.
+
+    Input:
+    ------
+        filename: string, path to the legacy VTK file
+        visitor: _Visitor object that consumes the sections
+        chunk_size: int, number of bytes to read at a time
+    """
+    with open(filename, 'rb') as f:
+        s = _Stream(f, chunk_size)
+        header = s.raw_line()
+        if header is None or not header.startswith('# vtk DataFile'):
+            raise RuntimeError(
+                "{} is not a legacy VTK file.".format(filename))
+        version = float(header.split()[-1])
+        s.raw_line()  # title
+        s.binary = s.line().upper() == 'BINARY'
+
+        location = None
+        num = 0
+        while not visitor.done:
+            line = s.line()
+            if line is None:
+                break
+            words = line.split()
+            key = words[0].upper()
+
+            if key == 'DATASET':
+                visitor.dataset = words[1].upper()
+            elif key == 'POINTS':
+                visitor.points(s, int(words[1]), words[2])
+            elif key in _CELL_SECTIONS:
+                visitor.cells(s, words, version)
+            elif key == 'CELL_TYPES':
+                s.skip(int(words[1]), 'int')
+            elif key == 'DIMENSIONS':
+                visitor.dims = np.array([int(w) for w in words[1:4]])
+            elif key == 'ORIGIN':
+                visitor.origin = np.array([float(w) for w in words[1:4]])
+            elif key in ['SPACING', 'ASPECT_RATIO']:
+                visitor.spacing = np.array([float(w) for w in words[1:4]])
+            elif key in ['X_COORDINATES', 'Y_COORDINATES', 'Z_COORDINATES']:
+                a = ['X', 'Y', 'Z'].index(key[0])
+                visitor.coordinates(s, a, int(words[1]), words[2])
+            elif key in ['POINT_DATA', 'CELL_DATA']:
+                location = key
+                num = int(words[1])
+            elif key == 'SCALARS':
+                ncomp = int(words[3]) if len(words) > 3 else 1
+                if s.startswith('LOOKUP_TABLE'):
+                    s.line()
+                visitor.array(s, words[1], location, num, ncomp, words[2])
+            elif key == 'LOOKUP_TABLE':
+                s.skip(4 * int(words[2]), 'unsigned_char')
+            elif key == 'COLOR_SCALARS':
+                s.skip(num * int(words[2]), 'unsigned_char')
+            elif key in _ATTR_WIDTHS:
+                s.skip(num * _ATTR_WIDTHS[key], words[2])
+            elif key == 'TEXTURE_COORDINATES':
+                s.skip(num * int(words[2]), words[3])
+            elif key == 'FIELD':
+                for _ in range(int(words[2])):
+                    arr = s.line().split()
+                    if arr[0] == 'NULL_ARRAY':
+                        continue
+                    if location is None:
+                        # field data of the whole dataset
+                        s.skip(int(arr[1]) * int(arr[2]), arr[3])
+                    else:
+                        visitor.array(s, arr[0], location, int(arr[2]),
+                                      int(arr[1]), arr[3])
+                    if s.startswith('METADATA'):
+                        s.line()
+                        _skip_metadata(s)
+            elif key == 'METADATA':
+                _skip_metadata(s)
+            else:
+                raise RuntimeError(
+                    "VTK section {} is not recognized.".format(key))
+
+
+class _RangeVisitor(_Visitor):
+    """Finds the range and band counts of a data array and the extents
+    of the mesh.
+    """
+
+    def __init__(self, data, levels):
+        super(_RangeVisitor, self).__init__()
+        self.data = data
+        self.levels = levels
+        self.mins = np.full(3, np.inf)
+        self.maxs = np.full(3, -np.inf)
+        self.found = None
+        self.info = None
+
+    def points(self, s, n, dtype):
+        for chunk in s.values(3 * n, dtype, width=3):
+            self.mins = np.minimum(self.mins, chunk.min(axis=0))
+            self.maxs = np.maximum(self.maxs, chunk.max(axis=0))
+
+    def coordinates(self, s, axis, n, dtype):
+        for chunk in s.values(n, dtype):
+            self.mins[axis] = min(self.mins[axis], chunk.min())
+            self.maxs[axis] = max(self.maxs[axis], chunk.max())
+
+    def array(self, s, name, location, num, ncomp, dtype):
+        if name != self.data or self.found == 'CELL_DATA':
+            s.skip(num * ncomp, dtype)
+            return
+        if ncomp != 1:
+            raise RuntimeError(
+                "Data {} must have a single component.".format(name))
+        self.found = location
+        vmin = np.inf
+        vmax = -np.inf
+        counts = None
+        if self.levels is not None:
+            counts = np.zeros(len(self.levels) + 1, dtype=np.int64)
+        for chunk in s.values(num, dtype):
+            chunk = chunk.ravel()
+            vmin = min(vmin, chunk.min())
+            vmax = max(vmax, chunk.max())
+            if self.levels is not None:
+                counts += np.bincount(voxel.classify(chunk, self.levels),
+                                      minlength=len(self.levels) + 1)
+        self.info = {'min': float(vmin), 'max': float(vmax),
+                     'counts': counts}
+
+        # cell data is preferred so stop once it and the points are read
+        if location == 'CELL_DATA' and np.all(self.mins <= self.maxs):
+            self.done = True
+
+
+def scan(filename, data, levels=None, chunk_size=2**22):
+    """Find the range of a data array and the extents of the mesh in a
+    single streaming pass over a legacy VTK file. Cell data is used if
+    the data exists on both the cells and the points.
+
+    Input:
+    ------
+        filename: string, path to the legacy VTK file
+        data: string, name of the data array
+        levels: (optional), sorted list of floats, if provided the
+            number of values in each band (levels[i - 1], levels[i]] is
+            counted. The last band holds all values above the last level.
+        chunk_size: (optional), int, number of bytes to read at a time
+
+    Returns:
+    --------
+        info: dictionary with the keys:
+            min: float, minimum data value
+            max: float, maximum data value
+            mins: array of floats, minimum x, y, z values of the mesh
+            maxs: array of floats, maximum x, y, z values of the mesh
+            point_data: bool, True if the data is point (nodal) data
+            counts: array of ints (len(levels) + 1), number of values in
+                each band (None if levels is not provided)
+    """
+    visitor = _RangeVisitor(data, levels)
+    _walk(filename, visitor, chunk_size)
+    if visitor.found is None:
+        raise RuntimeError("Data {} not found on mesh.".format(data))
+
+    mins = visitor.mins
+    maxs = visitor.maxs
+    if visitor.dims is not None and np.any(mins > maxs):
+        # structured points are defined by the origin and spacing
+        mins = visitor.origin
+        maxs = visitor.origin + visitor.spacing * (visitor.dims - 1)
+
+    info = visitor.info
+    info['mins'] = mins
+    info['maxs'] = maxs
+    info['point_data'] = visitor.found == 'POINT_DATA'
+    return info
+
+
+class _GridVisitor(_Visitor):
+    """Classifies the cell data of a Cartesian mesh into a band grid
+    stored in memory-mapped files, or stores the values themselves if
+    levels is None. If tile is given, the minimum and maximum value of
+    every block of cells is also found.
+    """
+
+    def __init__(self, data, levels, dirname, tile=None):
+        super(_GridVisitor, self).__init__()
+        self.data = data
+        self.levels = levels
+        self.dirname = dirname
+        self.tile = tile
+        self.block_min = None
+        self.block_max = None
+        self.coords = [np.empty(0), np.empty(0), np.empty(0)]
+        self.points_mm = None
+        self.cells_mm = None
+        self.grid_mm = None
+        self.found = False
+
+    def points(self, s, n, dtype):
+        self.points_mm = np.memmap(self.dirname + "/points.dat",
+                                   dtype=np.float64, mode='w+',
+                                   shape=(n, 3))
+        start = 0
+        for chunk in s.values(3 * n, dtype, width=3):
+            self.points_mm[start:start + len(chunk)] = chunk
+            start += len(chunk)
+            for a in range(3):
+                self.coords[a] = np.union1d(self.coords[a],
+                                            np.unique(chunk[:, a]))
+
+    def cells(self, s, words, version):
+        if words[0].upper() != 'CELLS':
+            return super(_GridVisitor, self).cells(s, words, version)
+        if version >= 5.:
+            ncells = int(words[1]) - 1
+            if int(words[2]) != 8 * ncells:
+                raise RuntimeError("Mesh is not a complete Cartesian grid.")
+            s.skip(int(words[1]), s.line().split()[1])
+            chunks = s.values(int(words[2]), s.line().split()[1], width=8)
+        else:
+            ncells = int(words[1])
+            if int(words[2]) != 9 * ncells:
+                raise RuntimeError("Mesh is not a complete Cartesian grid.")
+            chunks = s.values(int(words[2]), 'int', width=9)
+
+        shape = self.__shape()
+        self.cells_mm = np.memmap(self.dirname + "/cells.dat",
+                                  dtype=np.int64, mode='w+',
+                                  shape=(ncells,))
+        start = 0
+        for chunk in chunks:
+            if chunk.shape[1] == 9 and np.any(chunk[:, 0] != 8):
+                raise RuntimeError("Mesh is not a complete Cartesian grid.")
+            chunk = chunk[:, -8:].astype(np.int64)
+            # nodes 0 and 6 are opposite corners of a VTK hexahedron
+            lower = np.minimum(self.points_mm[chunk[:, 0]],
+                               self.points_mm[chunk[:, 6]])
+            idx = [np.searchsorted(self.coords[a], lower[:, a])
+                   for a in range(3)]
+            self.cells_mm[start:start + len(chunk)] = \
+                np.ravel_multi_index(idx, shape)
+            start += len(chunk)
+
+    def coordinates(self, s, axis, n, dtype):
+        for chunk in s.values(n, dtype):
+            self.coords[axis] = np.concatenate([self.coords[axis],
+                                                chunk.ravel()])
+
+    def array(self, s, name, location, num, ncomp, dtype):
+        if name != self.data or location != 'CELL_DATA':
+            s.skip(num * ncomp, dtype)
+            return
+        if ncomp != 1:
+            raise RuntimeError(
+                "Data {} must have a single component.".format(name))
+        self.found = True
+        shape = self.__shape()
+        if num != np.prod(shape):
+            raise RuntimeError("Mesh is not a complete Cartesian grid.")
+
+        # bands are stored shifted by one so that 0 marks missing cells,
+        # values are stored with NaN marking missing cells
+        if self.levels is None:
+            path = self.dirname + "/values.dat"
+            grid_dtype = np.float64
+        else:
+            path = self.dirname + "/bands.dat"
+            grid_dtype = np.int16
+        if self.cells_mm is None:
+            # structured cells are ordered with x changing fastest
+            self.grid_mm = np.memmap(path, dtype=grid_dtype, mode='w+',
+                                     shape=shape[::-1])
+        else:
+            self.grid_mm = np.memmap(path, dtype=grid_dtype, mode='w+',
+                                     shape=shape)
+            if self.levels is None:
+                for i in range(shape[0]):
+                    self.grid_mm[i] = np.nan
+        flat = self.grid_mm.reshape(-1)
+        if self.tile is not None:
+            nblocks = tuple(-(-n // self.tile) for n in shape)
+            self.block_min = np.full(nblocks, np.inf)
+            self.block_max = np.full(nblocks, -np.inf)
+        start = 0
+        for chunk in s.values(num, dtype):
+            values = chunk.ravel()
+            if self.levels is None:
+                cells = values
+            else:
+                cells = voxel.classify(values, self.levels) + 1
+            stop = start + len(cells)
+            if self.cells_mm is None:
+                flat[start:stop] = cells
+            else:
+                flat[self.cells_mm[start:stop]] = cells
+            if self.tile is not None:
+                self.__add_extrema(values, start, stop, shape)
+            start = stop
+        self.done = True
+
+    def __add_extrema(self, values, start, stop, shape):
+        """Update the block extrema with the values of cells start to
+        stop in file order.
+        """
+        if self.cells_mm is None:
+            k, j, i = np.unravel_index(np.arange(start, stop), shape[::-1])
+        else:
+            i, j, k = np.unravel_index(self.cells_mm[start:stop], shape)
+        blocks = np.ravel_multi_index((i // self.tile, j // self.tile,
+                                       k // self.tile),
+                                      self.block_min.shape)
+        np.minimum.at(self.block_min.reshape(-1), blocks, values)
+        np.maximum.at(self.block_max.reshape(-1), blocks, values)
+
+    def __shape(self):
+        if self.dataset == 'STRUCTURED_POINTS':
+            self.coords = [self.origin[a] + self.spacing[a] *
+                           np.arange(self.dims[a]) for a in range(3)]
+        return tuple(len(c) - 1 for c in self.coords)
+
+
+def band_grid(filename, data, levels, dirname, chunk_size=2**22):
+    """Classify the cell data of a Cartesian hexahedral mesh, rectilinear
+    grid, or structured points file into a grid of band indices without
+    holding the mesh in memory. The points, cell locations, and band
+    grid are stored in memory-mapped files in dirname.
+
+    Input:
+    ------
+        filename: string, path to the legacy VTK file
+        data: string, name of the cell data array
+        levels: sorted list of floats, upper bound of each band
+        dirname: string, path to an existing folder for scratch files
+        chunk_size: (optional), int, number of bytes to read at a time
+
+    Returns:
+    --------
+        coords: list of three arrays of floats, sorted x, y, and z node
+            positions of the grid
+        bands: 3D memory-mapped array of ints, band index per cell
+            indexed by [i, j, k]
+    """
+    visitor = _grid(filename, data, levels, dirname, chunk_size)
+    return visitor.coords, visitor.grid_mm
+
+
+def band_grid_extrema(filename, data, levels, dirname, tile,
+                      chunk_size=2**22):
+    """Classify the cell data into a grid of band indices as in
+    band_grid() and find the minimum and maximum value of every block of
+    cells in the same pass (see minmax.MinMaxTree).
+
+    Input:
+    ------
+        filename: string, path to the legacy VTK file
+        data: string, name of the cell data array
+        levels: sorted list of floats, upper bound of each band
+        dirname: string, path to an existing folder for scratch files
+        tile: int, number of cells along each edge of a block
+        chunk_size: (optional), int, number of bytes to read at a time
+
+    Returns:
+    --------
+        coords: list of three arrays of floats, sorted x, y, and z node
+            positions of the grid
+        bands: 3D memory-mapped array of ints, band index per cell
+            indexed by [i, j, k]
+        mins: 3D array of floats, minimum value of each block
+        maxs: 3D array of floats, maximum value of each block
+    """
+    visitor = _grid(filename, data, levels, dirname, chunk_size, tile)
+    return visitor.coords, visitor.grid_mm, visitor.block_min, \
+        visitor.block_max
+
+
+def value_grid(filename, data, dirname, chunk_size=2**22):
+    """Arrange the cell data of a Cartesian hexahedral mesh, rectilinear
+    grid, or structured points file on a grid without holding the mesh
+    in memory. The points, cell locations, and values are stored in
+    memory-mapped files in dirname.
+
+    Input:
+    ------
+        filename: string, path to the legacy VTK file
+        data: string, name of the cell data array
+        dirname: string, path to an existing folder for scratch files
+        chunk_size: (optional), int, number of bytes to read at a time
+
+    Returns:
+    --------
+        coords: list of three arrays of floats, sorted x, y, and z node
+            positions of the grid
+        grid: 3D memory-mapped array of floats, value per cell indexed
+            by [i, j, k]
+    """
+    visitor = _grid(filename, data, None, dirname, chunk_size)
+    return visitor.coords, visitor.grid_mm
+
+
+def _grid(filename, data, levels, dirname, chunk_size, tile=None):
+    """Stream the file into a band grid (or value grid if levels is
+    None) and check that every cell was set, returns the visitor with
+    the grid in [i, j, k] order.
+    """
+    visitor = _GridVisitor(data, levels, dirname, tile)
+    _walk(filename, visitor, chunk_size)
+    if not visitor.found:
+        raise RuntimeError("Cell data {} not found on mesh.".format(data))
+
+    grid = visitor.grid_mm
+    if visitor.cells_mm is None:
+        grid = grid.transpose()
+
+    # check every cell was set and remove the shift, one slab at a time
+    for i in range(grid.shape[0]):
+        slab = np.asarray(grid[i])
+        if levels is None:
+            if np.any(np.isnan(slab)):
+                raise RuntimeError("Mesh is not a complete Cartesian grid.")
+            continue
+        if np.any(slab == 0):
+            raise RuntimeError("Mesh is not a complete Cartesian grid.")
+        grid[i] = slab - 1
+    grid.flush()
+    visitor.grid_mm = grid
+    return visitor
+
+
+def _skip_metadata(s):
+    """Skip the lines of a METADATA block up to the empty line that
+    ends it.
+    """
+    line = s.raw_line()
+    while line:
+        line = s.raw_line()
@@ -0,0 +1,76 @@
+"""tests for the work-balanced level selection"""
+from os import getcwd
+import pytest
+import numpy as np
+
+from IsogeomGenerator import balance
+
+test_dir = getcwd() + "/tests/test_files/"
+test_mesh = test_dir + "test_mesh.vtk"
+
+
+def test_candidate_levels():
+    """candidates are log spaced for positive minimums, else linear"""
+    r = np.full(2, False)
+    log = balance.candidate_levels(1., 1e4, nbins=4)
+    lin = balance.candidate_levels(0., 40., nbins=4)
+    if np.allclose(log, [1., 10., 1e2, 1e3, 1e4]):
+        r[0] = True
+    if np.allclose(lin, [0., 10., 20., 30., 40.]):
+        r[1] = True
+    assert(all(r))
+
+
+def test_balanced_levels():
+    """levels split the weight between the first and last candidate"""
+    edges = np.arange(7.)
+    # bins outside the candidates (first and last) are ignored
+    weights = np.array([50., 3., 0., 0., 3., 3., 3., 50.])
+    obs = balance.balanced_levels(3, edges, weights)
+    assert(obs == [0., 4., 6.])
+
+
+def test_balanced_levels_repeated():
+    """data in a single bin can not be split"""
+    edges = np.arange(5.)
+    weights = np.array([0., 0., 10., 0., 0., 0.])
+    obs = balance.balanced_levels(4, edges, weights)
+    assert(obs == [0., 2., 4.])
+
+
+def test_balanced_levels_nodata():
+    """error when there is no data between the candidates"""
+    with pytest.raises(RuntimeError) as error_info:
+        balance.balanced_levels(4, np.arange(5.), np.zeros(6))
+    assert 'No data' in str(error_info)
+
+
+def test_surface_levels():
+    """bands of a row of cells have the same number of boundary faces"""
+    # six cells in a row with one candidate bin each, bins 0 and 7 are
+    # outside of the candidates
+    pairs = np.zeros((8, 8), dtype=int)
+    for i in range(1, 6):
+        pairs[i, i + 1] = pairs[i + 1, i] = 1
+    exterior = np.array([0, 5, 4, 4, 4, 4, 5, 0])
+    obs = balance.surface_levels(3, np.arange(7.), pairs, exterior)
+    assert(obs == [0., 3., 6.])
+
+
+@pytest.mark.parametrize("mode", balance.MODES)
+def test_generate(mode):
+    """levels fall between the slabs of the test mesh in every mode"""
+    obs = balance.generate(5, 0., 40., test_mesh, 'dname', mode=mode)
+    assert(np.allclose(obs, [0., 10., 20., 30., 40.]))
+
+
+def test_generate_fewer():
+    """warn when fewer levels than requested can be placed"""
+    with pytest.warns(UserWarning) as warn_info:
+        obs = balance.generate(8, 0., 40., test_mesh, 'dname')
+    r = np.full(2, False)
+    if np.allclose(obs, [0., 10., 20., 30., 40.]):
+        r[0] = True
+    if 'Only 5 distinct levels' in str(warn_info[0].message):
+        r[1] = True
+    assert(all(r))
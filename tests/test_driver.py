@@ -1,17 +1,22 @@
 """tests for the driver script tool.py"""
 
-from IsogeomGenerator import driver
+from os import getcwd
+from os.path import isfile
+from IsogeomGenerator import driver, vtkscan
 import pytest
+import numpy as np
 
 
 # Generate Levels parametrized tests:
 # linear: (6, 5, 15, 'lin', [5., 7., 9., 11., 13., 15.]
 # log: (6, 1, 1e5, 'log', [1, 10, 1e2, 1e3, 1e4, 1e5])
+# linear, N from the command line (float): (3., 5, 15, 'lin', [5., 10., 15.])
 # ratio, max included: (5, 1, 625, 'ratio', [1., 5., 25., 125., 625.])
 # ratio, max not included: (5, 1, 700, 'ratio', [1., 5., 25., 125., 625.])
 @pytest.mark.parametrize("N,minN,maxN,mode,exp",
                          [(6, 5, 15, 'lin', [5., 7., 9., 11., 13., 15.]),
                           (6, 1, 1e5, 'log', [1, 10, 1e2, 1e3, 1e4, 1e5]),
+                          (3., 5, 15, 'lin', [5., 10., 15.]),
                           (5, 1, 625, 'ratio', [1., 5., 25., 125., 625.]),
                           (5, 1, 700, 'ratio', [1., 5., 25., 125., 625.])])
 def test_generate_levels(N, minN, maxN, mode, exp):
@@ -20,9 +25,102 @@ def test_generate_levels(N, minN, maxN, mode, exp):
     assert(obs == exp)
 
 
+@pytest.mark.parametrize("mode", ['quantile', 'volume', 'surface'])
+def test_generate_levels_balanced(mode):
+    """generate work-balanced levels from the mesh"""
+    meshfile = getcwd() + "/tests/test_files/test_mesh.vtk"
+    obs = driver.generate_levels(3, 0., 40., mode=mode, meshfile=meshfile,
+                                 data='dname')
+    assert(obs == [0., 20., 40.])
+
+
+def test_generate_levels_balanced_error():
+    """work-balanced levels require the mesh"""
+    with pytest.raises(RuntimeError) as error_info:
+        driver.generate_levels(3, 0., 40., mode='quantile')
+    assert 'requires the mesh file' in str(error_info)
+
+
 def test_generate_levels_error():
     """generate levels with invalid mode"""
     with pytest.raises(RuntimeError) as error_info:
         exp = driver.generate_levels(6, 5, 1e5, mode='nonsense')
     assert 'Level generation' in str(error_info)
 
+
+@pytest.mark.parametrize("method,exp", [('mean', [5., 25., 40.]),
+                                        ('max', [10., 30., 40.])])
+def test_preview_mesh(method, exp, tmpdir):
+    """cell data is block-aggregated into a coarse mesh file"""
+    r = np.full(3, False)
+    meshfile = getcwd() + "/tests/test_files/test_mesh.vtk"
+    preview = driver.preview_mesh(meshfile, 'dname', 2, method=method,
+                                  dirname=str(tmpdir))
+    coords, grid = vtkscan.value_grid(preview, 'dname', str(tmpdir))
+    if all(list(c) == [-10., -2., 6., 10.] for c in coords):
+        r[0] = True
+    # data is 0, 10, 20, 30, 40 along x
+    if np.array_equal(np.asarray(grid)[:, 0, 0], exp):
+        r[1] = True
+    if np.all(np.asarray(grid) == np.asarray(grid)[:, :1, :1]):
+        r[2] = True
+    del grid
+    assert(all(r))
+
+
+def test_crop_mesh(tmpdir):
+    """cells inside the bounds are written to a new mesh file"""
+    r = np.full(2, False)
+    meshfile = getcwd() + "/tests/test_files/test_mesh.vtk"
+    cropped = driver.crop_mesh(meshfile, 'dname',
+                               [[-5., -10., -10.], [5., 10., 10.]],
+                               dirname=str(tmpdir))
+    coords, grid = vtkscan.value_grid(cropped, 'dname', str(tmpdir))
+    if list(coords[0]) == [-6., -2., 2., 6.]:
+        r[0] = True
+    # data is 0, 10, 20, 30, 40 along x
+    if np.array_equal(np.asarray(grid)[:, 0, 0], [10., 20., 30.]):
+        r[1] = True
+    del grid
+    assert(all(r))
+
+
+def test_denoise_mesh(tmpdir):
+    """filtered data is written to a new mesh file with a region report"""
+    r = np.full(3, False)
+    meshfile = getcwd() + "/tests/test_files/test_mesh.vtk"
+    denoised, report = driver.denoise_mesh(meshfile, 'dname', [15., 25.],
+                                           dirname=str(tmpdir))
+    coords, grid = vtkscan.value_grid(denoised, 'dname', str(tmpdir))
+    # data is 0, 10, 20, 30, 40 along x and kept by a median filter
+    if np.array_equal(np.asarray(grid)[:, 0, 0], [0., 10., 20., 30., 40.]):
+        r[0] = True
+    if report['before'] == [1, 1, 1] and report['removed'] == 0:
+        r[1] = True
+    # the memory-mapped filtered grid is removed
+    if not isfile(str(tmpdir) + "/denoise.npy"):
+        r[2] = True
+    del grid
+    assert(all(r))
+
+
+def test_symmetric_mesh_error(tmpdir):
+    """the symmetry plane of the mesh must be on a cell face"""
+    meshfile = getcwd() + "/tests/test_files/test_mesh.vtk"
+    with pytest.raises(RuntimeError) as error_info:
+        driver.symmetric_mesh(meshfile, 'dname', ['x'], dirname=str(tmpdir))
+    assert "not symmetric" in str(error_info)
+
+
+def test_write_lods_error():
+    """levels of detail require an h5m file and factors of at least 1"""
+    r = np.full(2, False)
+    with pytest.raises(RuntimeError) as error_info:
+        driver.write_lods("geom.vtk", [1, 2])
+    if "h5m" in str(error_info):
+        r[0] = True
+    with pytest.raises(RuntimeError) as error_info:
+        driver.write_lods("geom.h5m", [0.5, 2])
+    if "at least 1" in str(error_info):
+        r[1] = True
+    assert(all(r))
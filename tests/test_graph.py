@@ -0,0 +1,16 @@
+"""tests for the graph utilities"""
+import numpy as np
+
+from IsogeomGenerator import graph
+
+
+def test_label_components():
+    """nodes are labeled with the smallest node of their component"""
+    r = np.full(2, False)
+    labels = graph.label_components(5, [0, 3, 1], [4, 4, 1])
+    if list(labels) == [0, 1, 2, 0, 0]:
+        r[0] = True
+    # nodes without edges are their own component
+    if list(graph.label_components(3, [], [])) == [0, 1, 2]:
+        r[1] = True
+    assert(all(r))
@@ -0,0 +1,157 @@
+"""tests for the grid transforms"""
+import pytest
+import numpy as np
+
+from IsogeomGenerator import gridops, voxel
+
+# 3x1x1 grid of unit cells with values 0, 10, 20 along x
+coords = [np.array([0., 1., 2., 3.]), np.array([0., 1.]),
+          np.array([0., 1.])]
+grid = np.array([0., 10., 20.]).reshape(3, 1, 1)
+
+
+@pytest.mark.parametrize("method", ['mean', 'max'])
+def test_aggregate(method):
+    """blocks of cells are merged into the mean or max value"""
+    r = np.full(3, False)
+    new_coords, new_grid = gridops.aggregate(grid, coords, 2, method=method)
+    if [list(c) for c in new_coords] == [[0., 2., 3.], [0., 1.], [0., 1.]]:
+        r[0] = True
+    exp = {'mean': [5., 20.], 'max': [10., 20.]}[method]
+    if list(new_grid.ravel()) == exp:
+        r[1] = True
+    # a factor of one keeps the grid
+    if np.array_equal(gridops.aggregate(grid, coords, 1, method)[1], grid):
+        r[2] = True
+    assert(all(r))
+
+
+def test_aggregate_weighted():
+    """the mean is weighted by the cell volumes"""
+    wide = [np.array([0., 1., 4.]), np.array([0., 1.]), np.array([0., 1.])]
+    values = np.array([0., 10.]).reshape(2, 1, 1)
+    new_grid = gridops.aggregate(values, wide, 2)[1]
+    assert(new_grid[0, 0, 0] == 7.5)
+
+
+def test_aggregate_error():
+    """unknown aggregation methods raise an error"""
+    with pytest.raises(RuntimeError) as error_info:
+        gridops.aggregate(grid, coords, 2, method='nonsense')
+    assert "not recognized" in str(error_info)
+
+
+def test_crop():
+    """cells with centers in the bounds are kept"""
+    r = np.full(3, False)
+    new_coords, new_grid = gridops.crop(grid, coords,
+                                        [[0.4, -1., -1.], [2.2, 1., 1.]])
+    if [list(c) for c in new_coords] == [[0., 1., 2.], [0., 1.], [0., 1.]]:
+        r[0] = True
+    if list(new_grid.ravel()) == [0., 10.]:
+        r[1] = True
+    # bounds around the whole grid keep it
+    whole = gridops.crop(grid, coords, [[-5., -5., -5.], [5., 5., 5.]])[1]
+    if np.array_equal(whole, grid):
+        r[2] = True
+    assert(all(r))
+
+
+def test_crop_error():
+    """bounds without any cells raise an error"""
+    with pytest.raises(RuntimeError) as error_info:
+        gridops.crop(grid, coords, [[5., 0., 0.], [6., 1., 1.]])
+    assert "No cells" in str(error_info)
+
+
+def test_symmetric_half():
+    """the upper half along each symmetry axis is kept"""
+    r = np.full(3, False)
+    sym_coords = [np.array([-2., -1., 0., 1., 2.]), np.array([0., 1.]),
+                  np.array([-1., 0., 1.])]
+    sym_grid = np.arange(8.).reshape(4, 1, 2)
+    new_coords, new_grid = gridops.symmetric_half(sym_grid, sym_coords,
+                                                  ['x', 'z'])
+    if [list(c) for c in new_coords] == [[0., 1., 2.], [0., 1.], [0., 1.]]:
+        r[0] = True
+    if list(new_grid.ravel()) == [5., 7.]:
+        r[1] = True
+    # no symmetry axes keep the grid
+    if np.array_equal(gridops.symmetric_half(sym_grid, sym_coords, [])[1],
+                      sym_grid):
+        r[2] = True
+    assert(all(r))
+
+
+def test_symmetric_half_error():
+    """the symmetry plane must be at the center on a cell face"""
+    with pytest.raises(RuntimeError) as error_info:
+        gridops.symmetric_half(grid, coords, ['x'])
+    assert "not symmetric" in str(error_info)
+
+
+def test_denoise():
+    """median filter removes a single cell spike, both filters keep a
+    linear field away from the edges"""
+    r = np.full(3, False)
+    spike = np.zeros((5, 5, 5))
+    spike[2, 2, 2] = 10.
+    if not gridops.denoise(spike, 'median', 3).any():
+        r[0] = True
+    line = np.arange(7.).reshape(7, 1, 1) * np.ones((7, 3, 3))
+    if np.allclose(gridops.denoise(line, 'median', 3), line):
+        r[1] = True
+    if np.allclose(gridops.denoise(line, 'gaussian', 5)[2:-2], line[2:-2]):
+        r[2] = True
+    assert(all(r))
+
+
+def test_denoise_out():
+    """filtered values are written to the provided array"""
+    r = np.full(2, False)
+    noisy = np.arange(60.).reshape(3, 4, 5) % 7
+    out = np.zeros(noisy.shape)
+    new_grid = gridops.denoise(noisy, 'gaussian', 3, out)
+    if new_grid is out:
+        r[0] = True
+    if np.allclose(out, gridops.denoise(noisy, 'gaussian', 3)):
+        r[1] = True
+    assert(all(r))
+
+
+def test_denoise_error():
+    """kernel size must be a positive odd number"""
+    with pytest.raises(RuntimeError) as error_info:
+        gridops.denoise(grid, 'median', 4)
+    assert "odd" in str(error_info)
+
+
+def test_count_components():
+    """face connected regions of each band are counted"""
+    r = np.full(1, False)
+    bands = np.zeros((4, 4, 1), dtype=np.int32)
+    # two regions of band 1 that only touch at an edge
+    bands[0, 0, 0] = 1
+    bands[1, 1, 0] = 1
+    bands[3, :, 0] = 2
+    if list(gridops.count_components(bands, 4)) == [1, 2, 1, 0]:
+        r[0] = True
+    assert(all(r))
+
+
+def test_count_components_slabs():
+    """regions that only join in a later slab are counted once"""
+    r = np.full(2, False)
+    # a U of band 1 open towards x=0 and a separate cell of band 1
+    values = np.zeros((3, 3, 1))
+    values[:, 0, 0] = 2.
+    values[:, 2, 0] = 2.
+    values[2, 1, 0] = 2.
+    values[0, 1, 0] = 2.
+    if list(gridops.count_components(values, 2, [1.])) == [1, 1]:
+        r[0] = True
+    values[0, 1, 0] = 0.
+    bands = voxel.classify(values, [1.])
+    if list(gridops.count_components(bands, 2)) == [1, 1]:
+        r[1] = True
+    assert(all(r))
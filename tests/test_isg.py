@@ -6,8 +6,9 @@ from pymoab import core, types
 import numpy as np
 import itertools
 import warnings
+import shutil
 
-from IsogeomGenerator import isg, ivdb
+from IsogeomGenerator import isg, ivdb, voxel, gridops
 
 # Set up test files and expected results
 test_dir = getcwd() + "/tests/test_files/"
@@ -185,6 +186,41 @@ def test_read_database():
     assert(all(res))
 
 
+def test_read_database_labeled():
+    """a labeled isovolume file is split into one meshset per band"""
+    # write the expected isovolumes to a single labeled file
+    db = test_dir + "/test-read-labeled"
+    if isdir(db):
+        shutil.rmtree(db)
+    mkdir(db)
+    mkdir(db + "/vols")
+    dt = np.dtype([('n', '<f4', (3,)), ('v', '<f4', (3, 3)), ('a', '<u2')])
+    tris = [np.fromfile(exp_vols_dir + "/{}.stl".format(i), dtype=dt,
+                        offset=84)['v'] for i in range(len(exp_levels))]
+    voxel.write_labeled_vtk(db + "/vols/" + voxel.LABELED_FILE, tris)
+    # create obj and read database
+    ig = isg.IsGm(levels=levels, data=data, db=db)
+    ig.read_database()
+    res = np.full(3, False)
+    bounds = [ig.isovol_meshsets[k]['bounds']
+              for k in sorted(ig.isovol_meshsets)]
+    if bounds == [(None, 5.0), (5.0, 15.0), (15.0, 25.0), (25.0, 35.0),
+                  (35.0, None)]:
+        res[0] = True
+    # same number of triangles in each file set as in each file
+    num_tris = [len(ig.mb.get_entities_by_type(fs, types.MBTRI))
+                for i, fs in sorted(ig.isovol_meshsets)]
+    if num_tris == [len(t) for t in tris]:
+        res[1] = True
+    # vertices are shared by the triangles of a band
+    num_verts = [len(ig.mb.get_entities_by_type(fs, types.MBVERTEX))
+                 for i, fs in sorted(ig.isovol_meshsets)]
+    if all(v < 3 * t for v, t in zip(num_verts, num_tris)):
+        res[2] = True
+    shutil.rmtree(db)
+    assert(all(res))
+
+
 def test_read_database_numfiles_error():
     """read_database throws error if num levels and files mismatch"""
     # create obj and read database
@@ -256,6 +292,60 @@ def test_separate_isovols_exterior():
     assert(all(r))
 
 
+def test_separate_isovols_tol():
+    """triangles within the tolerance of the extents are exterior"""
+    r = np.full(2, False)
+    ig = isg.IsGm()
+    fs = ig.mb.create_meshset()
+    ig.mb.load_file(test_dir + '/vol-files/separate-vols.stl', file_set=fs)
+    ig.isovol_meshsets[(0, fs)] = {}
+    # x planes of the volume file are 1e-3 inside of the extents
+    ig.xmin = -10.001
+    ig.xmax = 15.001
+    ig.ymin = ig.zmin = -15.
+    ig.ymax = ig.zmax = 15.
+    ig.separate_isovols(tol=1e-2)
+    surfs = ig.isovol_meshsets[(0, fs)]['surfs_EH']
+    if len(surfs) == 4:
+        r[0] = True
+    num_tris = sorted([len(ig.mb.get_entities_by_type(s, types.MBTRI))
+                       for s in surfs])
+    if num_tris == [2, 2, 10, 10]:
+        r[1] = True
+    assert(all(r))
+
+
+def test_separate_components():
+    """triangles are grouped by the vertices they share in the meshset"""
+    r = np.full(3, False)
+    ig = isg.IsGm()
+    coords = np.array([[0., 0., 0.], [1., 0., 0.], [0., 1., 0.],
+                       [1., 1., 0.], [5., 0., 0.], [6., 0., 0.],
+                       [5., 1., 0.]])
+    verts = np.array(list(ig.mb.create_vertices(coords.flatten())),
+                     dtype=np.uint64)
+    # two triangles sharing an edge and one disjoint triangle
+    tris = ig.mb.create_elements(types.MBTRI, verts[[[0, 1, 2], [1, 3, 2],
+                                                     [4, 5, 6]]])
+    # a triangle outside of the meshset that joins both pieces
+    ig.mb.create_elements(types.MBTRI, verts[[[3, 4, 1]]])
+    ms = ig.mb.create_meshset()
+    ig.mb.add_entities(ms, tris)
+    ig.mb.add_entities(ms, list(verts))
+    surfs = ig._IsGm__separate(ms)
+    if len(surfs) == 2:
+        r[0] = True
+    num_tris = [len(ig.mb.get_entities_by_type(s, types.MBTRI))
+                for s in surfs]
+    num_verts = [len(ig.mb.get_entities_by_type(s, types.MBVERTEX))
+                 for s in surfs]
+    if num_tris == [2, 1] and num_verts == [4, 3]:
+        r[1] = True
+    if len(ig.mb.get_entities_by_handle(ms)) == 0:
+        r[2] = True
+    assert(all(r))
+
+
 def test_separate_isovols_single_exterior():
     """test a single vol with an exterior surface is split in separation"""
     # load mesh that does not need separation
@@ -411,6 +501,115 @@ def test_imprint_merge():
     assert(all(r))
 
 
+def __sym_geom(grid, coords, symmetry, name, weld=False):
+    """generate, separate, merge, and reflect the geometry of a grid"""
+    db = test_dir + name
+    if isdir(db):
+        shutil.rmtree(db)
+    mkdir(db)
+    mkdir(db + "/vols")
+    sym_levels = [1.6, 3.1, 10.]
+    for i, tris in enumerate(voxel.extract(grid, coords, sym_levels)):
+        voxel.write_stl(db + "/vols/{}.stl".format(i), tris)
+    ext = [[c[0] for c in coords], [c[-1] for c in coords]]
+    ig = isg.IsGm(levels=sym_levels, data=data, db=db, extents=ext,
+                  symmetry=symmetry)
+    ig.read_database(weld=weld)
+    ig.separate_isovols()
+    ig.imprint_merge(1.)
+    ig.reflect()
+    shutil.rmtree(db)
+    # number of triangles and value of each surface of each volume
+    surfs = []
+    for iv in sorted(ig.isovol_meshsets.keys()):
+        surfs.append(sorted(
+            (len(ig.mb.get_entities_by_type(s, types.MBTRI)),
+             ig.mb.tag_get_data(ig.val_tag, s)[0][0])
+            for s in ig.isovol_meshsets[iv]['surfs_EH']))
+    return ig, surfs
+
+
+def test_reflect():
+    """reflected octant matches the geometry of the full grid"""
+    r = np.full(3, False)
+    # nested cubes centered on the origin
+    sym_coords = [np.arange(-4., 5.)] * 3
+    c = (sym_coords[0][:-1] + sym_coords[0][1:]) / 2.
+    x, y, z = np.meshgrid(c, c, c, indexing='ij')
+    sym_grid = np.maximum(np.maximum(np.abs(x), np.abs(y)), np.abs(z))
+    ig_full, surfs_full = __sym_geom(sym_grid, sym_coords, None,
+                                     "/test-reflect-full")
+    coords_half, grid_half = gridops.symmetric_half(sym_grid, sym_coords,
+                                                    ['x', 'y', 'z'])
+    ig, surfs = __sym_geom(grid_half, coords_half, ['x', 'y', 'z'],
+                           "/test-reflect-half")
+    if surfs == surfs_full:
+        r[0] = True
+    # merged surfaces are still shared by the volumes
+    num_surfs = [len(set(s for iv in g.isovol_meshsets.values()
+                         for s in iv['surfs_EH'])) for g in [ig_full, ig]]
+    if num_surfs[0] == num_surfs[1]:
+        r[1] = True
+    # extents of the full grid are restored
+    if [ig.xmin, ig.ymin, ig.zmin] == [-4., -4., -4.]:
+        r[2] = True
+    assert(all(r))
+
+
+def test_reflect_weld():
+    """reflected octant with welded vertices matches the full grid"""
+    sym_coords = [np.arange(-4., 5.)] * 3
+    c = (sym_coords[0][:-1] + sym_coords[0][1:]) / 2.
+    x, y, z = np.meshgrid(c, c, c, indexing='ij')
+    sym_grid = np.maximum(np.maximum(np.abs(x), np.abs(y)), np.abs(z))
+    surfs_full = __sym_geom(sym_grid, sym_coords, None,
+                            "/test-reflect-weld-full")[1]
+    coords_half, grid_half = gridops.symmetric_half(sym_grid, sym_coords,
+                                                    ['x', 'y', 'z'])
+    surfs = __sym_geom(grid_half, coords_half, ['x', 'y', 'z'],
+                       "/test-reflect-weld-half", weld=True)[1]
+    assert(surfs == surfs_full)
+
+
+def test_read_database_weld():
+    """coincident vertices of neighboring isovolumes are merged"""
+    r = np.full(3, False)
+    db = test_dir + "/test-weld"
+    if isdir(db):
+        shutil.rmtree(db)
+    mkdir(db)
+    mkdir(db + "/vols")
+    weld_coords = [np.arange(4.)] * 3
+    weld_grid = np.zeros((3, 3, 3))
+    weld_grid[1, 1, 1] = 10.
+    weld_levels = [5., 20.]
+    for i, tris in enumerate(voxel.extract(weld_grid, weld_coords,
+                                           weld_levels)):
+        voxel.write_stl(db + "/vols/{}.stl".format(i), tris)
+    igs = []
+    for weld in [False, True]:
+        ig = isg.IsGm(levels=weld_levels, data=data, db=db)
+        ig.read_database(weld=weld)
+        igs.append(ig)
+    shutil.rmtree(db)
+    rs = [g.mb.get_root_set() for g in igs]
+    num_verts = [len(g.mb.get_entities_by_type(rs_, types.MBVERTEX))
+                 for g, rs_ in zip(igs, rs)]
+    # the 8 corners of the center cell are shared
+    if num_verts[1] == num_verts[0] - 8:
+        r[0] = True
+    num_tris = [sorted(len(g.mb.get_entities_by_type(iv[1], types.MBTRI))
+                       for iv in g.isovol_meshsets) for g in igs]
+    if num_tris[0] == num_tris[1] and igs[1].welded:
+        r[1] = True
+    # every vertex of the center cell is used by both isovolumes
+    verts = [set(igs[1].mb.get_entities_by_type(iv[1], types.MBVERTEX))
+             for iv in sorted(igs[1].isovol_meshsets)]
+    if len(verts[0] & verts[1]) == 8:
+        r[2] = True
+    assert(all(r))
+
+
 def test_make_family():
     """test tags are added properly"""
     # get setup
@@ -656,6 +855,18 @@ def test_list_coords():
     assert(exp_coords_dict == coords_out)
 
 
+def test_coincident_pairs():
+    """surfaces sharing a vertex coordinate are paired"""
+    ig = isg.IsGm()
+    coords1 = np.array([[0., 0., 0.], [1., 0., 0.], [2., 0., 0.],
+                        [3., 0., 0.]])
+    owner1 = np.array([0, 1, 2, 2])
+    coords2 = np.array([[2., 0., 0.], [-0., 0., 0.], [5., 0., 0.]])
+    owner2 = np.array([0, 1, 1])
+    pairs = ig._IsGm__coincident_pairs(coords1, owner1, coords2, owner2, 2)
+    assert(pairs.tolist() == [[0, 1], [2, 0]])
+
+
 def test_compare_surfs():
     """test that new surf is correctly generated when comparing two"""
     # get setup
@@ -724,6 +935,29 @@ def test_compare_surfs_no_val():
     assert(all(r))
 
 
+def test_tag_surfs():
+    """value and sense tags are set on all surfaces at once"""
+    ig = __setup_geom()
+    iv = sorted(ig.isovol_meshsets.keys())
+    surfs = ig.isovol_meshsets[iv[0]]['surfs_EH']
+    fs1 = list(iv[0])[1]
+    fs2 = list(iv[1])[1]
+    ig._IsGm__tag_surfs(surfs, [1., 2.], [[fs1, fs2], [fs1, 0]])
+    r = np.full(3, False)
+    vals = ig.mb.tag_get_data(ig.val_tag, surfs, flat=True)
+    if list(vals) == [1., 2.]:
+        r[0] = True
+    senses = ig.mb.tag_get_data(ig.sense_tag, surfs)
+    if np.array_equal(senses, [[fs1, fs2], [fs1, 0]]):
+        r[1] = True
+    # the tagged exterior surface is not given a value of 0 when merging
+    ig.imprint_merge(1.5)
+    val = ig.mb.tag_get_data(ig.val_tag, surfs[0])[0][0]
+    if val == 1.:
+        r[2] = True
+    assert(all(r))
+
+
 def test_calc_centroid():
     """test centroid calculation"""
     ig = isg.IsGm()
@@ -762,6 +996,16 @@ def test_check_exterior_true(point):
     assert(result)
 
 
+def test_check_exterior_array():
+    """test that an array of points is checked at once with a tolerance"""
+    ig = isg.IsGm()
+    ig.xmin = ig.ymin = ig.zmin = -5.
+    ig.xmax = ig.ymax = ig.zmax = 5.
+    points = np.array([[-5., 0., 0.], [0., 0., 0.], [0., 4.99, 0.]])
+    result = ig._IsGm__check_exterior(points, tol=0.02)
+    assert(list(result) == [True, False, True])
+
+
 def test_check_exterior_false():
     """test that point is correctly identified as being on the interior"""
     ig = isg.IsGm()
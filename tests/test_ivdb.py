@@ -8,12 +8,14 @@ import warnings
 import pytest
 import numpy as np
 
-from IsogeomGenerator import ivdb
+from IsogeomGenerator import ivdb, visit_session, voxel, minmax
 
 
 # Set up test files and expected results
 test_dir = getcwd() + "/tests/test_files/"
 test_mesh = test_dir + "test_mesh.vtk"
+test_mesh_nodal = test_dir + "test_mesh_nodal.vtk"
+test_mesh_tet = test_dir + "test_mesh_tet.vtk"
 data = 'dname'
 levels = [15, 5, 25, 35]
 exp_db = test_dir + "/exp-test/"
@@ -60,6 +62,38 @@ def __check_warning(w, strings, num_warns):
     return r
 
 
+def __read_stl(fname):
+    """triangle vertices (T, 3, 3) of a binary STL file"""
+    dt = np.dtype([('n', '<f4', (3,)), ('v', '<f4', (3, 3)), ('a', '<u2')])
+    return np.fromfile(fname, dtype=dt, offset=84)['v']
+
+
+def __same_verts(gen, exp):
+    """same number of triangles and set of vertices"""
+    return len(gen) == len(exp) and \
+        set(map(tuple, gen.reshape(-1, 3))) == \
+        set(map(tuple, exp.reshape(-1, 3)))
+
+
+def __same_tris(gen, exp):
+    """same triangles with the same winding, in any order"""
+    tris = []
+    for verts in [gen, exp]:
+        # start each triangle at its smallest vertex, keeping the
+        # winding order
+        keys = [min(tuple(map(tuple, np.roll(t, -k, axis=0)))
+                    for k in range(3)) for t in verts]
+        tris.append(sorted(keys))
+    return tris[0] == tris[1]
+
+
+def __same_vols(dirname, same=__same_verts):
+    """every isovolume file in dirname matches the VisIt export"""
+    return all(same(__read_stl(dirname + "/" + f),
+                    __read_stl(exp_vols_dir + "/" + f))
+               for f in common_files)
+
+
 def test_init_none():
     r = np.full(4, False)
     iv = ivdb.IvDb()
@@ -123,6 +157,246 @@ def test_generate_vols():
     assert(all(r))
 
 
+def test_generate_vols_session():
+    """Generate isovolumes twice in one warm VisIt session."""
+    r = np.full(4, False)
+    db = test_dir + "/test-gen-vols-session"
+    session = visit_session.shared()
+    for j in range(2):
+        if isdir(db):
+            shutil.rmtree(db)
+        iv = ivdb.IvDb(levels=levels, data=data, db=db, session=session)
+        iv.generate_vols(test_mesh)
+        res = filecmp.cmpfiles(exp_vols_dir, db + "/vols", common_files)
+        if res[0] == common_files:
+            r[j] = True
+        shutil.rmtree(iv.db)
+    # the pipeline stays open until the session is closed
+    if session.filename == test_mesh:
+        r[2] = True
+    session.close()
+    if not session.launched:
+        r[3] = True
+    assert(all(r))
+
+
+def test_generate_vols_engine_procs():
+    """Generate isovolumes with a parallel VisIt compute engine."""
+    r = np.full(2, False)
+    db = test_dir + "/test-gen-vols-engine-procs"
+    if isdir(db):
+        shutil.rmtree(db)
+    iv = ivdb.IvDb(levels=levels, data=data, db=db)
+    try:
+        iv.generate_vols(test_mesh, engine_procs=2)
+        if sorted(listdir(db + "/vols")) == sorted(common_files):
+            r[0] = True
+        # same triangles as the serial export, in any order
+        if __same_vols(db + "/vols", __same_tris):
+            r[1] = True
+    finally:
+        # never leave the database in the test folder
+        if iv.session is not None:
+            iv.session.close()
+        shutil.rmtree(db, ignore_errors=True)
+    assert(all(r))
+
+
+def test_generate_vols_parallel():
+    """Generate all isovolume files across several VisIt sessions."""
+    # assert flags
+    r = np.full(3, False)
+    # test database path
+    db = test_dir + "/test-gen-vols-parallel"
+    if isdir(db):
+        shutil.rmtree(db)
+    # init ivdb obj
+    iv = ivdb.IvDb(levels=levels, data=data, db=db)
+    iv.generate_vols(test_mesh, workers=3)
+    # check that files produced are the same as the serial case
+    gen_vols_dir = db + "/vols"
+    res = filecmp.cmpfiles(exp_vols_dir, gen_vols_dir, common_files)
+    match_list = res[0]
+    non_match = res[1]
+    if sorted(match_list) == sorted(common_files):
+        r[0] = True
+    if non_match == []:
+        r[1] = True
+    if iv.levels == [5, 15, 25, 35, 50]:
+        r[2] = True
+    # remove files
+    shutil.rmtree(iv.db)
+    # check results
+    assert(all(r))
+
+
+@pytest.mark.filterwarnings("ignore:Warning")
+def test_generate_vols_serial_parallel():
+    """Parallel generation after a serial run in the same process."""
+    r = np.full(2, False)
+    db = test_dir + "/test-gen-vols-serial-parallel"
+    try:
+        for j, workers in enumerate([1, 3]):
+            if isdir(db):
+                shutil.rmtree(db)
+            iv = ivdb.IvDb(levels=levels, data=data, db=db)
+            iv.generate_vols(test_mesh, workers=workers)
+            res = filecmp.cmpfiles(exp_vols_dir, db + "/vols", common_files)
+            if sorted(res[0]) == sorted(common_files):
+                r[j] = True
+    finally:
+        shutil.rmtree(db, ignore_errors=True)
+    assert(all(r))
+
+
+def test_generate_vols_parallel_nodata():
+    """Empty bands are merged into the next band in parallel mode."""
+    r = np.full(2, False)
+    db = test_dir + "/test-gen-vols-parallel-nodata"
+    if isdir(db):
+        shutil.rmtree(db)
+    # 28 falls between data values of 20 and 30 so band 25-28 is empty
+    iv = ivdb.IvDb(levels=[5, 15, 25, 28, 35], data=data, db=db)
+    iv.generate_vols(test_mesh, workers=2)
+    if iv.levels == [5, 15, 25, 35, 50]:
+        r[0] = True
+    res = filecmp.cmpfiles(exp_vols_dir, db + "/vols", common_files)
+    if res[1] == [] and not isdir(db + "/bands"):
+        r[1] = True
+    shutil.rmtree(iv.db)
+    assert(all(r))
+
+
+@pytest.mark.parametrize("sizes,workers,exp",
+                         [([5, 1, 3], 1, [[0, 2, 1]]),
+                          ([5, 1, 3, 4], 2, [[0, 1], [3, 2]]),
+                          ([2, 7], 4, [[1], [0]])])
+def test_schedule_bands(sizes, workers, exp):
+    """bands are balanced across workers, largest first"""
+    assert(ivdb._schedule_bands(sizes, workers) == exp)
+
+
+def test_generate_vols_numpy():
+    """Generate all isovolume files with the numpy backend."""
+    r = np.full(3, False)
+    db = test_dir + "/test-gen-vols-numpy"
+    if isdir(db):
+        shutil.rmtree(db)
+    iv = ivdb.IvDb(levels=levels, data=data, db=db)
+    iv.generate_vols(test_mesh, backend='numpy')
+    if sorted(listdir(db + "/vols")) == sorted(common_files):
+        r[0] = True
+    if iv.levels == [5, 15, 25, 35, 50]:
+        r[1] = True
+    # same vertices and number of triangles as the VisIt export
+    if __same_vols(db + "/vols"):
+        r[2] = True
+    shutil.rmtree(iv.db)
+    assert(all(r))
+
+
+def test_generate_vols_numpy_nodal():
+    """Generate isovolume files from point data with the numpy backend."""
+    r = np.full(3, False)
+    db = test_dir + "/test-gen-vols-numpy-nodal"
+    if isdir(db):
+        shutil.rmtree(db)
+    iv = ivdb.IvDb(levels=levels, data=data, db=db)
+    iv.generate_vols(test_mesh_nodal, backend='numpy')
+    if iv.point_data:
+        r[0] = True
+    # point data ranges from -5 to 45, so arbmax is 55
+    if iv.levels == [5, 15, 25, 35, 55]:
+        r[1] = True
+    if sorted(listdir(db + "/vols")) == sorted(common_files):
+        r[2] = True
+    shutil.rmtree(iv.db)
+    assert(all(r))
+
+
+def test_generate_vols_numpy_tet():
+    """Generate isovolume files from a tet mesh with the numpy backend."""
+    r = np.full(3, False)
+    db = test_dir + "/test-gen-vols-numpy-tet"
+    if isdir(db):
+        shutil.rmtree(db)
+    iv = ivdb.IvDb(levels=levels, data=data, db=db)
+    iv.generate_vols(test_mesh_tet, backend='numpy')
+    if iv.cell_type == 'tetra':
+        r[0] = True
+    if iv.levels == [5, 15, 25, 35, 50]:
+        r[1] = True
+    # each hex of the test mesh is split into six tets so the surfaces
+    # have the same vertices and number of triangles as the VisIt export
+    if __same_vols(db + "/vols"):
+        r[2] = True
+    shutil.rmtree(iv.db)
+    assert(all(r))
+
+
+@pytest.mark.parametrize("tile", [2, 64])
+def test_generate_vols_tiled(tile):
+    """Generate isovolume files out of core in blocks of cells."""
+    r = np.full(4, False)
+    db = test_dir + "/test-gen-vols-tiled"
+    if isdir(db):
+        shutil.rmtree(db)
+    iv = ivdb.IvDb(levels=levels, data=data, db=db)
+    iv.generate_vols(test_mesh, backend='numpy', tile=tile)
+    if sorted(listdir(db + "/vols")) == sorted(common_files):
+        r[0] = True
+    # scratch files are removed and the block index is kept
+    if not isdir(db + "/tiles"):
+        r[1] = True
+    if isfile(db + "/" + minmax.INDEX_FILE):
+        r[3] = True
+    # same vertices and number of triangles as the VisIt export
+    if __same_vols(db + "/vols"):
+        r[2] = True
+    shutil.rmtree(iv.db)
+    assert(all(r))
+
+
+def test_generate_vols_labeled():
+    """Generate a single labeled isovolume file with the numpy backend."""
+    r = np.full(3, False)
+    db = test_dir + "/test-gen-vols-labeled"
+    if isdir(db):
+        shutil.rmtree(db)
+    iv = ivdb.IvDb(levels=levels, data=data, db=db)
+    iv.generate_vols(test_mesh, backend='numpy', labeled=True)
+    if listdir(db + "/vols") == [voxel.LABELED_FILE]:
+        r[0] = True
+    points, conn, labels = \
+        voxel.read_labeled_vtk(db + "/vols/" + voxel.LABELED_FILE)
+    if len(np.unique(labels)) == len(iv.levels):
+        r[1] = True
+    # same triangles in each band as the VisIt export
+    same = [__same_verts(points[conn[labels == i]].astype(np.float32),
+                         __read_stl(exp_vols_dir + "/{}.stl".format(i)))
+            for i in range(len(iv.levels))]
+    if all(same):
+        r[2] = True
+    shutil.rmtree(iv.db)
+    assert(all(r))
+
+
+def test_generate_vols_labeled_error():
+    """labeled output is only supported by the numpy backend"""
+    iv = ivdb.IvDb(levels=levels, data=data)
+    with pytest.raises(RuntimeError) as error_info:
+        iv.generate_vols(test_mesh, backend='visit', labeled=True)
+    assert "Labeled output" in str(error_info)
+
+
+def test_generate_vols_backend_error():
+    """unknown backends raise an error"""
+    iv = ivdb.IvDb(levels=levels, data=data)
+    with pytest.raises(RuntimeError) as error_info:
+        iv.generate_vols(test_mesh, backend='nonsense')
+    assert "Backend" in str(error_info)
+
+
 def test_generate_vols_single():
     """Generate all isovolume files with single volume"""
     # assert flags
@@ -188,9 +462,63 @@ def test_make_db_dir_exists():
     assert(all(r))
 
 
+def test_generate_vols_incremental():
+    """Only bands with changed bounds are regenerated in a reused
+    database."""
+    r = np.full(4, False)
+    db = test_dir + "/test-gen-vols-incremental"
+    if isdir(db):
+        shutil.rmtree(db)
+    iv = ivdb.IvDb(levels=levels, data=data, db=db)
+    iv.generate_vols(test_mesh, backend='numpy', incremental=True)
+    first = {f: open(db + "/vols/" + f, 'rb').read() for f in common_files}
+    if len(listdir(db + "/cache")) == 5:
+        r[0] = True
+    # moving level 25 to 22 changes bands 2 and 3 only
+    iv = ivdb.IvDb(levels=[5, 15, 22, 35], data=data, db=db)
+    iv.generate_vols(test_mesh, backend='numpy', incremental=True)
+    if iv.db == db:
+        r[1] = True
+    if len(listdir(db + "/cache")) == 7:
+        r[2] = True
+    same = [open(db + "/vols/" + f, 'rb').read() == first[f]
+            for f in ['0.stl', '1.stl', '4.stl']]
+    if all(same):
+        r[3] = True
+    shutil.rmtree(db)
+    assert(all(r))
+
+
+def test_make_db_dir_incremental():
+    """an existing database is reused in incremental mode"""
+    r = np.full(4, False)
+    db = test_dir + "/test-direxists-incremental/"
+    if isdir(db):
+        shutil.rmtree(db)
+    mkdir(db)
+    mkdir(db + "/vols")
+    open(db + "/vols/9.stl", 'w').close()
+    # scratch folders of a run that did not finish
+    mkdir(db + "/tiles")
+    mkdir(db + "/bands")
+    iv = ivdb.IvDb(levels=levels, data=data, db=db)
+    iv._IvDb__make_db_dir(incremental=True)
+    if iv.db == db:
+        r[0] = True
+    if isdir(db + "/vols"):
+        r[1] = True
+    # old isovolume files are removed
+    if listdir(db + "/vols") == []:
+        r[2] = True
+    if not isdir(db + "/tiles") and not isdir(db + "/bands"):
+        r[3] = True
+    shutil.rmtree(db)
+    assert(all(r))
+
+
 def test_check_data():
     """test check levels, all data good"""
-    r = np.full(5, False)
+    r = np.full(6, False)
     iv = ivdb.IvDb(levels=levels, data=data)
     arbmin, arbmax, minext, maxext = iv._IvDb__check_data(test_mesh)
     exp_min = -10
@@ -209,12 +537,15 @@ def test_check_data():
         r[3] = True
     if list(maxext) == exp_maxext:
         r[4] = True
+    # 25 cells in each band
+    if iv.band_counts == [25] * 5:
+        r[5] = True
     assert(all(r))
 
 
 def test_check_data_outofbounds():
     """test check levels, data out of bounds"""
-    r = np.full(4, False)
+    r = np.full(5, False)
     # level -5 and 45 are out of bounds, so two warnings expected
     iv = ivdb.IvDb(levels=[-5, 5, 15, 25, 35, 45], data=data)
     # data out of range should produce warning
@@ -227,9 +558,23 @@ def test_check_data_outofbounds():
         # arbmax has not yet been added to levels list so should match
         # init levels
         r[3] = True
+    # the empty bands below -5 and above 45 are merged
+    if iv.band_counts == [25] * 5:
+        r[4] = True
     assert(all(r))
 
 
+def test_print_bands(capsys):
+    """the bounds and size of each band are printed"""
+    iv = ivdb.IvDb(levels=[5, 15, 50], data=data)
+    iv.band_counts = [25, 50, 50]
+    iv._IvDb__print_bands(-10)
+    out = capsys.readouterr().out.splitlines()
+    assert(out == ["band 0 (-10 to 5.0): 25 cells",
+                   "band 1 (5.0 to 15.0): 50 cells",
+                   "band 2 (15.0 to 50.0): 50 cells"])
+
+
 @pytest.mark.filterwarnings("ignore:Level")
 def test_check_data_nodata():
     """check levels, no levels"""
@@ -245,6 +590,27 @@ def test_check_data_nodata():
     assert(all(r))
 
 
+def test_merge_empty_bands():
+    """empty bands are merged into the next band before extraction"""
+    r = np.full(5, False)
+    iv = ivdb.IvDb(levels=[5, 15, 25, 28, 35], data=data)
+    iv.levels.append(50.)
+    iv.band_counts = [25, 25, 25, 0, 25, 0]
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        iv._IvDb__merge_empty_bands(-10, [c == 0 for c in iv.band_counts])
+    r[0:3] = __check_warning(w,
+                             ["between 25.0 and 28.0",
+                              "between 35.0 and 50.0"],
+                             2)
+    # the empty top band is dropped
+    if iv.levels == [5, 15, 25, 35]:
+        r[3] = True
+    if iv.band_counts == [25] * 4:
+        r[4] = True
+    assert(all(r))
+
+
 def test_write_levels():
     r = np.full(2, False)
     db = test_dir + "/test-write-levels/"
@@ -274,21 +640,16 @@ def test_get_isovol():
         shutil.rmtree(db)
     mkdir(db)
     mkdir(db + '/vols/')
-    # launch VisIt
-    import visit
-    try:
-        visit.LaunchNowin()
-    except:
-        pass
-    visit.OpenDatabase(test_mesh)
-    visit.AddPlot('Pseudocolor', data)
+    # open the mesh in a VisIt session
+    iv.session = visit_session.shared()
+    iv.session.open(test_mesh, data)
     # run __get_isovol
     lbound = 5
     ubound = 15
     i = 1
     export_res, ubound_out = iv._IvDb__get_isovol(lbound, ubound, i)
     # close VisIt
-    visit.CloseComputeEngine()
+    iv.session.close()
     # check returned values
     if export_res == 1:
         r[0] = True
@@ -311,14 +672,9 @@ def test_get_isovol_nodata():
         shutil.rmtree(db)
     mkdir(db)
     mkdir(db + '/vols/')
-    # launch VisIt
-    import visit
-    try:
-        visit.LaunchNowin()
-    except:
-        pass
-    visit.OpenDatabase(test_mesh)
-    visit.AddPlot('Pseudocolor', data)
+    # open the mesh in a VisIt session
+    iv.session = visit_session.shared()
+    iv.session.open(test_mesh, data)
     # run __get_isovol
     lbound = 25
     ubound = 28
@@ -326,7 +682,7 @@ def test_get_isovol_nodata():
     with warnings.catch_warnings(record=True) as w:
         export_res, ubound_out = iv._IvDb__get_isovol(lbound, ubound, i)
     # close VisIt
-    visit.CloseComputeEngine()
+    iv.session.close()
     # check returned/changed values
     if export_res == 0:
         r[0] = True
@@ -0,0 +1,105 @@
+"""tests for the marching tetrahedra isovolume engine"""
+from collections import Counter
+import pytest
+import numpy as np
+
+from IsogeomGenerator import marching
+
+# 5x4x3 grid of nodes with a smooth field
+coords = [np.linspace(-1., 1., 5), np.linspace(0., 3., 4),
+          np.linspace(0., 1., 3)]
+X, Y, Z = np.meshgrid(coords[0], coords[1], coords[2], indexing='ij')
+grid = np.sin(2. * X) + 0.3 * Y * Z
+levels = [-0.5, 0.2, 0.8, 10.]
+volume = 2. * 3. * 1.
+
+
+def __open_edges(tris):
+    """number of directed edges that are not matched by a reverse edge"""
+    edges = Counter()
+    for tri in tris:
+        verts = [tuple(v) for v in tri]
+        for k in range(3):
+            edges[(verts[k], verts[(k + 1) % 3])] += 1
+    return sum(1 for (a, b), n in edges.items() if edges[(b, a)] != n)
+
+
+def __volume(tris):
+    """enclosed volume by the divergence theorem"""
+    return np.sum(np.einsum('ij,ij->i', tris[:, 0],
+                            np.cross(tris[:, 1], tris[:, 2]))) / 6.
+
+
+def test_cases():
+    """every case with a mix of vertices above/below has triangles"""
+    r = np.full(3, False)
+    num_tris = (marching._CASES[:, :, 0] >= 0).sum(axis=1)
+    if num_tris[0] == num_tris[15] == 0:
+        r[0] = True
+    # one vertex cut off: 1 triangle, two and two: 2 triangles
+    exp = [0] + [1 if bin(c).count('1') in [1, 3] else 2
+                 for c in range(1, 15)] + [0]
+    if list(num_tris) == exp:
+        r[1] = True
+    # six tets fill the hex (volumes add up to 1 for a unit cube)
+    vols = []
+    for tet in marching._TETS:
+        p = marching._CORNERS[tet].astype(float)
+        vols.append(abs(np.linalg.det(p[1:] - p[0])) / 6.)
+    if np.isclose(sum(vols), 1.):
+        r[2] = True
+    assert(all(r))
+
+
+def test_nodal_grid():
+    """point values are placed on the structured grid"""
+    points = np.column_stack([X.ravel(), Y.ravel(), Z.ravel()])
+    order = np.arange(len(points))[::-1]
+    coords_out, grid_out = marching.nodal_grid(points[order],
+                                               grid.ravel()[order])
+    assert(np.array_equal(grid_out, grid))
+
+
+def test_nodal_grid_error():
+    """incomplete grids raise an error"""
+    points = np.column_stack([X.ravel(), Y.ravel(), Z.ravel()])
+    with pytest.raises(RuntimeError) as error_info:
+        marching.nodal_grid(points[1:], grid.ravel()[1:])
+    assert "not a complete Cartesian grid" in str(error_info)
+
+
+def test_occupied():
+    """bands without any volume are found"""
+    occ = marching.occupied(grid, [-0.5, -0.4, 0.2, 5., 10.])
+    # sin(2x) has no values between 5 and 10
+    assert(list(occ) == [True, True, True, True, False])
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 32])
+def test_extract(chunk):
+    """each band is closed, outward facing, and the bands fill the mesh"""
+    r = np.full(3, False)
+    tris = marching.extract(grid, coords, levels, chunk=chunk)
+    if all(__open_edges(t) == 0 for t in tris):
+        r[0] = True
+    vols = [__volume(t) for t in tris]
+    if all(vol > 0 for vol in vols):
+        r[1] = True
+    if np.isclose(sum(vols), volume):
+        r[2] = True
+    assert(all(r))
+
+
+def test_extract_shared_surface():
+    """the isosurface between two bands is identical with reversed
+    orientation"""
+    tris = marching.extract(grid, coords, levels)
+    # triangles of band 0 that are not on the exterior are the level 0
+    # isosurface and must appear reversed in band 1
+    ext = np.zeros(len(tris[0]), dtype=bool)
+    for a in range(3):
+        for side in [coords[a][0], coords[a][-1]]:
+            ext |= np.all(tris[0][:, :, a] == side, axis=1)
+    iso0 = set(tuple(map(tuple, t[::-1])) for t in tris[0][~ext])
+    band1 = set(tuple(map(tuple, t)) for t in tris[1])
+    assert(len(iso0) > 0 and iso0 <= band1)
@@ -0,0 +1,89 @@
+"""tests for the min/max block index"""
+from os import getcwd, remove
+from os.path import isfile
+import pytest
+import numpy as np
+
+from IsogeomGenerator import minmax, voxel
+
+test_dir = getcwd() + "/tests/test_files/"
+
+# 16x16x16 grid of unit cells with the value equal to the x index
+coords = [np.arange(17.), np.arange(17.), np.arange(17.)]
+grid = np.repeat(np.arange(16.), 256).reshape(16, 16, 16)
+
+
+def test_build():
+    """extrema of every block and the coarser levels"""
+    r = np.full(3, False)
+    tree = minmax.build(grid, 3)
+    # 6 blocks along each axis, then 3, 2, and 1 nodes
+    if [m.shape for m in tree.mins] == [(6, 6, 6), (3, 3, 3), (2, 2, 2),
+                                        (1, 1, 1)]:
+        r[0] = True
+    if list(tree.mins[0][:, 0, 0]) == [0., 3., 6., 9., 12., 15.] and \
+            list(tree.maxs[0][:, 0, 0]) == [2., 5., 8., 11., 14., 15.]:
+        r[1] = True
+    if tree.mins[-1][0, 0, 0] == 0. and tree.maxs[-1][0, 0, 0] == 15.:
+        r[2] = True
+    assert(all(r))
+
+
+def test_blocks():
+    """only the blocks next to a band boundary or on the exterior"""
+    r = np.full(2, False)
+    tree = minmax.build(grid, 2)
+    blocks = tree.blocks([7.5, 100.])
+    # 8^3 blocks, the 6^3 interior blocks are skipped except for the
+    # two layers on each side of x = 8
+    if len(blocks) == 8**3 - 6**3 + 2 * 6**2:
+        r[0] = True
+    all_blocks = list(voxel.blocks(grid.shape, 2))
+    if blocks == [b for b in all_blocks if b in blocks]:
+        r[1] = True
+    assert(all(r))
+
+
+@pytest.mark.parametrize("tile", [1, 2])
+def test_blocks_extract(tile):
+    """visiting only the listed blocks gives all triangles"""
+    r = np.full(2, False)
+    levels = [3.5, 10.5, 100.]
+    bands = voxel.classify(grid, levels)
+    tree = minmax.build(grid, tile)
+    fnames = [test_dir + "/test-minmax-{}.stl".format(i) for i in range(3)]
+    voxel.extract_tiled(bands, coords, len(levels), fnames, tile=tile,
+                        active=tree.blocks(levels))
+    exp = voxel.extract(grid, coords, levels)
+    same = []
+    for fname, tris in zip(fnames, exp):
+        with open(fname, 'rb') as f:
+            records = np.frombuffer(f.read()[84:], dtype=voxel._STL_DTYPE)
+        gen = set(t.tobytes() for t in records['verts'])
+        same.append(len(records) == len(tris) and
+                    gen == set(t.tobytes() for t in tris.astype(np.float32)))
+        remove(fname)
+    if all(same):
+        r[0] = True
+    if len(tree.blocks(levels)) < len(list(voxel.blocks(grid.shape, tile))):
+        r[1] = True
+    assert(all(r))
+
+
+def test_save_load():
+    """index is written and read back with its key"""
+    r = np.full(4, False)
+    fname = test_dir + "/test-" + minmax.INDEX_FILE
+    tree = minmax.build(grid, 4, key='abc')
+    tree.save(fname)
+    new = minmax.load(fname)
+    remove(fname)
+    if new.key == 'abc' and new.tile == 4 and new.shape == (16, 16, 16):
+        r[0] = True
+    if all(np.array_equal(a, b) for a, b in zip(tree.mins, new.mins)):
+        r[1] = True
+    if new.blocks([7.5, 100.]) == tree.blocks([7.5, 100.]):
+        r[2] = True
+    if minmax.load(fname) is None and not isfile(fname):
+        r[3] = True
+    assert(all(r))
@@ -0,0 +1,82 @@
+"""tests for the dry-run planner"""
+from os import getcwd, remove
+import json
+import pytest
+import numpy as np
+
+from IsogeomGenerator import plan
+
+test_dir = getcwd() + "/tests/test_files/"
+test_mesh = test_dir + "test_mesh.vtk"
+test_mesh_binary = test_dir + "test_mesh_binary.vtk"
+test_mesh_nodal = test_dir + "test_mesh_nodal.vtk"
+
+# no cost for anything but the VisIt overhead of each band
+visit_costs = dict((k, 0.) for k in plan.COSTS)
+visit_costs['visit_band'] = 1.
+
+
+@pytest.mark.parametrize("filename", [test_mesh, test_mesh_binary])
+def test_estimate(filename):
+    """triangles and surfaces of each band are counted from the grid"""
+    r = np.full(5, False)
+    report = plan.estimate(filename, 'dname', [15., 25.])
+    bands = report['bands']
+    if [b['triangles'] for b in bands] == [180, 140, 180]:
+        r[0] = True
+    if [b['exterior_triangles'] for b in bands] == [130, 40, 130]:
+        r[1] = True
+    if [b['cells'] for b in bands] == [50, 25, 50]:
+        r[2] = True
+    exp_totals = {'isovolumes': 3, 'triangles': 500, 'vertices': 250,
+                  'surfaces_separated': 7, 'surfaces': 5}
+    if report['totals'] == exp_totals:
+        r[3] = True
+    if sorted(report['stages'].keys()) == \
+            ['generate_vols', 'imprint_merge', 'separate_isovols',
+             'write_geometry']:
+        r[4] = True
+    assert(all(r))
+
+
+def test_estimate_outofbounds():
+    """levels outside of the data are removed with a warning"""
+    r = np.full(2, False)
+    with pytest.warns(UserWarning) as warn_info:
+        report = plan.estimate(test_mesh, 'dname', [15., 25., 50.])
+    if report['levels'] == [15., 25.]:
+        r[0] = True
+    if 'out of data bounds' in str(warn_info[0].message):
+        r[1] = True
+    assert(all(r))
+
+
+def test_estimate_pointdata():
+    """planning requires cell data"""
+    with pytest.raises(RuntimeError) as error_info:
+        plan.estimate(test_mesh_nodal, 'dname', [15., 25.])
+    assert 'requires cell data' in str(error_info)
+
+
+@pytest.mark.parametrize("workers,exp", [(1, 3.), (2, 2.), (3, 1.)])
+def test_estimate_workers(workers, exp):
+    """VisIt bands are scheduled across the workers"""
+    report = plan.estimate(test_mesh, 'dname', [15., 25.], workers=workers,
+                           costs=visit_costs)
+    r = np.full(2, False)
+    if report['stages']['generate_vols'] == exp:
+        r[0] = True
+    if report['total_seconds'] == exp:
+        r[1] = True
+    assert(all(r))
+
+
+def test_write_report():
+    """report is written as JSON"""
+    report = plan.estimate(test_mesh, 'dname', [15., 25.])
+    fname = test_dir + "/test-plan.json"
+    plan.write_report(report, fname)
+    with open(fname, 'r') as f:
+        obs = json.load(f)
+    remove(fname)
+    assert(obs == report)
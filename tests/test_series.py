@@ -0,0 +1,131 @@
+"""tests for the block cache of a series of meshes"""
+from os import getcwd, remove, listdir
+from os.path import isdir
+import numpy as np
+
+from IsogeomGenerator import series, voxel
+
+test_dir = getcwd() + "/tests/test_files/"
+
+# 8x8x8 grid of unit cells with values increasing with the distance from
+# the center of the grid
+nodes = np.arange(9, dtype=np.float64)
+coords = [nodes, nodes, nodes]
+centers = nodes[:-1] + 0.5
+x, y, z = np.meshgrid(centers, centers, centers, indexing='ij')
+grid = np.sqrt((x - 4.) ** 2 + (y - 4.) ** 2 + (z - 4.) ** 2)
+levels = [2., 3.]
+
+
+def __read(fnames):
+    """read and remove the files"""
+    data = []
+    for fname in fnames:
+        with open(fname, 'rb') as f:
+            data.append(f.read())
+        remove(fname)
+    return data
+
+
+def __expected(bands, lvls):
+    """files written by voxel.extract_tiled()"""
+    fnames = [test_dir + "/test-series-exp-{}.stl".format(i)
+              for i in range(len(lvls))]
+    voxel.extract_tiled(bands, coords, len(lvls), fnames, tile=4)
+    return __read(fnames)
+
+
+def __extract(cache, bands, lvls):
+    """files written by the block cache"""
+    fnames = [test_dir + "/test-series-{}.stl".format(i)
+              for i in range(len(lvls))]
+    cache.extract(bands, coords, lvls, fnames, tile=4)
+    return __read(fnames)
+
+
+def test_extract_first():
+    """first step extracts every block and writes the same files as
+    extract_tiled"""
+    r = np.full(3, False)
+    bands = voxel.classify(grid, levels)
+    with series.BlockCache() as cache:
+        gen = __extract(cache, bands, levels)
+        if gen == __expected(bands, levels):
+            r[0] = True
+        if (cache.extracted, cache.reused) == (8, 0):
+            r[1] = True
+        dirname = cache.dirname
+    if not isdir(dirname):
+        r[2] = True
+    assert(all(r))
+
+
+def test_extract_reuse():
+    """only the block with a changed band is extracted again"""
+    r = np.full(2, False)
+    bands = voxel.classify(grid, levels)
+    changed = grid.copy()
+    changed[1, 1, 1] = 0.
+    new_bands = voxel.classify(changed, levels)
+    with series.BlockCache() as cache:
+        __extract(cache, bands, levels)
+        gen = __extract(cache, new_bands, levels)
+        if gen == __expected(new_bands, levels):
+            r[0] = True
+        if (cache.extracted, cache.reused) == (1, 7):
+            r[1] = True
+    assert(all(r))
+
+
+def test_extract_halo():
+    """blocks above a change extract again for the shared faces"""
+    r = np.full(2, False)
+    bands = voxel.classify(grid, levels)
+    changed = grid.copy()
+    changed[3, 3, 3] = 10.
+    new_bands = voxel.classify(changed, levels)
+    with series.BlockCache() as cache:
+        __extract(cache, bands, levels)
+        gen = __extract(cache, new_bands, levels)
+        if gen == __expected(new_bands, levels):
+            r[0] = True
+        if (cache.extracted, cache.reused) == (4, 4):
+            r[1] = True
+    assert(all(r))
+
+
+def test_extract_block_files():
+    """the triangles of each visited block are stored in a file"""
+    r = np.full(3, False)
+    bands = voxel.classify(grid, levels)
+    fnames = [test_dir + "/test-series-{}.stl".format(i)
+              for i in range(len(levels))]
+    with series.BlockCache() as cache:
+        __extract(cache, bands, levels)
+        if len(listdir(cache.dirname + "/blocks")) == 8:
+            r[0] = True
+        # only two blocks are visited, the others are removed
+        active = list(voxel.blocks(bands.shape, 4))[:2]
+        cache.extract(bands, coords, levels, fnames, tile=4, active=active)
+        __read(fnames)
+        if len(listdir(cache.dirname + "/blocks")) == 2:
+            r[1] = True
+        if (cache.extracted, cache.reused) == (0, 2):
+            r[2] = True
+    assert(all(r))
+
+
+def test_extract_levels():
+    """changed levels extract every block"""
+    r = np.full(2, False)
+    bands = voxel.classify(grid, levels)
+    new_levels = [2., 3.5]
+    new_bands = voxel.classify(grid, new_levels)
+    with series.BlockCache() as cache:
+        __extract(cache, bands, levels)
+        gen = __extract(cache, new_bands, new_levels)
+        if gen == __expected(new_bands, new_levels):
+            r[0] = True
+        if (cache.extracted, cache.reused) == (8, 0):
+            r[1] = True
+    assert(all(r))
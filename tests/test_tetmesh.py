@@ -0,0 +1,108 @@
+"""tests for the native NumPy tet mesh isovolume engine"""
+import pytest
+import numpy as np
+
+from IsogeomGenerator import tetmesh, voxel
+
+# 3x1x1 grid of unit cells with values 0, 10, 20 along x
+coords = [np.array([0., 1., 2., 3.]), np.array([0., 1.]),
+          np.array([0., 1.])]
+grid = np.array([0., 10., 20.]).reshape(3, 1, 1)
+
+
+def __tet_mesh():
+    """split each cell of the grid into six tets"""
+    nx, ny, nz = 4, 2, 2
+    x, y, z = np.meshgrid(coords[0], coords[1], coords[2], indexing='ij')
+    points = np.column_stack([x.ravel(), y.ravel(), z.ravel()])
+
+    def node(i, j, k):
+        return (i * ny + j) * nz + k
+    # Kuhn tets along the main diagonal of the cell
+    paths = [[0, 1, 2], [0, 2, 1], [1, 0, 2], [1, 2, 0], [2, 0, 1],
+             [2, 1, 0]]
+    tets = []
+    values = []
+    for i in range(3):
+        for path in paths:
+            ijk = [i, 0, 0]
+            tet = [node(*ijk)]
+            for a in path:
+                ijk[a] += 1
+                tet.append(node(*ijk))
+            tets.append(tet)
+            values.append(grid[i, 0, 0])
+    return points, np.array(tets), np.array(values)
+
+
+def __signed_volumes(points, tets):
+    p = points[tets]
+    return np.einsum('ij,ij->i', p[:, 1] - p[:, 0],
+                     np.cross(p[:, 2] - p[:, 0], p[:, 3] - p[:, 0]))
+
+
+def __tri_set(tris):
+    """set of triangles with their vertices rotated to a common start"""
+    out = set()
+    for t in np.asarray(tris).round(6):
+        rows = [tuple(v) for v in t]
+        s = rows.index(min(rows))
+        out.add(tuple(rows[s:] + rows[:s]))
+    return out
+
+
+def test_orient():
+    """all tets have a positive volume after orienting"""
+    points, tets, values = __tet_mesh()
+    vols = __signed_volumes(points, tets)
+    assert(np.any(vols < 0))
+    oriented = tetmesh.orient(points, tets)
+    assert(np.all(__signed_volumes(points, oriented) > 0))
+
+
+@pytest.mark.parametrize("num_nodes", [10, 2 ** 22])
+def test_face_keys(num_nodes):
+    """faces with the same nodes share a key for both hash paths"""
+    r = np.full(2, False)
+    faces = np.array([[1, 2, 3], [3, 1, 2], [2, 1, 4], [4, 2, 1],
+                      [1, 2, 4]])
+    keys = tetmesh.face_keys(faces, num_nodes)
+    if keys[0] == keys[1]:
+        r[0] = True
+    if keys[2] == keys[3] == keys[4] and keys[0] != keys[2]:
+        r[1] = True
+    assert(all(r))
+
+
+def test_boundary_faces():
+    """interior faces are only kept when the band changes"""
+    r = np.full(3, False)
+    points, tets, values = __tet_mesh()
+    tets = tetmesh.orient(points, tets)
+    bands = voxel.classify(values, [5., 15., 25.])
+    faces, labels = tetmesh.boundary_faces(points, tets, bands)
+    # exterior: 6 triangles on each long side, 2 on each end
+    # interior: 2 triangles on each side of both band changes
+    if len(faces) == 6 * 4 + 2 * 2 + 2 * 2 * 2:
+        r[0] = True
+    if list(np.bincount(labels)) == [12, 12, 12]:
+        r[1] = True
+    # a single band only has exterior faces
+    bands_one = voxel.classify(values, [25.])
+    faces, labels = tetmesh.boundary_faces(points, tets, bands_one)
+    if len(faces) == 6 * 4 + 2 * 2:
+        r[2] = True
+    assert(all(r))
+
+
+def test_extract():
+    """bands match the voxel engine on the same grid"""
+    levels = [5., 15., 25.]
+    points, tets, values = __tet_mesh()
+    tris = tetmesh.extract(points, tets, values, levels)
+    exp = voxel.extract(grid, coords, levels)
+    r = np.full(len(levels), False)
+    for i in range(len(levels)):
+        if __tri_set(tris[i]) == __tri_set(exp[i]):
+            r[i] = True
+    assert(all(r))
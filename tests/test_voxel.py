@@ -0,0 +1,212 @@
+"""tests for the native NumPy isovolume engine"""
+from os import getcwd, remove
+from os.path import isfile
+import pytest
+import numpy as np
+
+from IsogeomGenerator import voxel
+
+test_dir = getcwd() + "/tests/test_files/"
+
+# 3x1x1 grid of unit cells with values 0, 10, 20 along x
+coords = [np.array([0., 1., 2., 3.]), np.array([0., 1.]),
+          np.array([0., 1.])]
+grid = np.array([0., 10., 20.]).reshape(3, 1, 1)
+
+
+def __hex_mesh():
+    """unstructured representation of the 3x1x1 grid (VTK ordering)"""
+    nx, ny, nz = 4, 2, 2
+    x, y, z = np.meshgrid(coords[0], coords[1], coords[2], indexing='ij')
+    points = np.column_stack([x.ravel(), y.ravel(), z.ravel()])
+
+    def node(i, j, k):
+        return (i * ny + j) * nz + k
+    hexes = []
+    # list cells in reverse order to make sure ordering is recovered
+    for i in [2, 1, 0]:
+        hexes.append([node(i, 0, 0), node(i + 1, 0, 0), node(i + 1, 1, 0),
+                      node(i, 1, 0), node(i, 0, 1), node(i + 1, 0, 1),
+                      node(i + 1, 1, 1), node(i, 1, 1)])
+    return points, np.array(hexes), np.array([20., 10., 0.])
+
+
+def test_cartesian_grid():
+    """cell values are placed on the structured grid"""
+    r = np.full(4, False)
+    points, hexes, values = __hex_mesh()
+    coords_out, grid_out = voxel.cartesian_grid(points, hexes, values)
+    for a in range(3):
+        if list(coords_out[a]) == list(coords[a]):
+            r[a] = True
+    if np.array_equal(grid_out, grid):
+        r[3] = True
+    assert(all(r))
+
+
+def test_cartesian_grid_error():
+    """incomplete grids raise an error"""
+    points, hexes, values = __hex_mesh()
+    with pytest.raises(RuntimeError) as error_info:
+        voxel.cartesian_grid(points, hexes[:2], values[:2])
+    assert "not a complete Cartesian grid" in str(error_info)
+
+
+def test_classify():
+    """band i contains values in (levels[i - 1], levels[i]]"""
+    bands = voxel.classify(np.array([0., 5., 10., 20.]), [5., 15., 30.])
+    assert(list(bands) == [0, 0, 1, 2])
+
+
+def test_boundary_faces():
+    """faces are found where bands change and on the exterior"""
+    r = np.full(3, False)
+    bands = voxel.classify(grid, [5., 30.])
+    quads, lower, upper = voxel.boundary_faces(bands, coords)
+    # x: faces at x=0, 1, 3 (not x=2); y and z: 2 cells x 2 sides each
+    if len(quads) == 3 + 6 + 6:
+        r[0] = True
+    # the interface between band 0 and 1 at x=1
+    interface = (lower == 0) & (upper == 1)
+    if np.sum(interface) == 1 and np.all(quads[interface][0, :, 0] == 1.):
+        r[1] = True
+    # every face normal points along the positive axis
+    n = np.cross(quads[:, 1] - quads[:, 0], quads[:, 2] - quads[:, 0])
+    if np.all(n.sum(axis=1) > 0):
+        r[2] = True
+    assert(all(r))
+
+
+def test_extract():
+    """each band is a closed surface with outward facing triangles"""
+    r = np.full(3, False)
+    tris = voxel.extract(grid, coords, [5., 15., 30.])
+    # three unit cubes, 12 triangles each
+    if [len(t) for t in tris] == [12, 12, 12]:
+        r[0] = True
+    # outward normals: normal points away from the cube center
+    outward = []
+    for i, t in enumerate(tris):
+        n = np.cross(t[:, 1] - t[:, 0], t[:, 2] - t[:, 0])
+        center = np.array([i + 0.5, 0.5, 0.5])
+        outward.append(np.all(np.sum(n * (t.mean(axis=1) - center),
+                                     axis=1) > 0))
+    if all(outward):
+        r[1] = True
+    # coincident triangles between bands 0 and 1 are identical
+    shared0 = set(tuple(map(tuple, x)) for x in tris[0]
+                  if np.all(x[:, 0] == 1.))
+    shared1 = set(tuple(map(tuple, x[::-1])) for x in tris[1]
+                  if np.all(x[:, 0] == 1.))
+    if len(shared0) == 2 and shared0 != shared1:
+        # same vertices, opposite orientation
+        if set(frozenset(t) for t in shared0) == \
+                set(frozenset(t) for t in shared1):
+            r[2] = True
+    assert(all(r))
+
+
+def test_write_stl():
+    """binary STL file is written with one record per triangle"""
+    r = np.full(3, False)
+    tris = voxel.extract(grid, coords, [5., 15., 30.])[1]
+    fname = test_dir + "/test-write.stl"
+    voxel.write_stl(fname, tris)
+    if isfile(fname):
+        r[0] = True
+        with open(fname, 'rb') as f:
+            f.read(80)
+            num = np.frombuffer(f.read(4), dtype='<u4')[0]
+            records = np.frombuffer(f.read(), dtype=voxel._STL_DTYPE)
+        if num == len(records) == 12:
+            r[1] = True
+        if np.array_equal(records['verts'], tris.astype(np.float32)):
+            r[2] = True
+        remove(fname)
+    assert(all(r))
+
+
+@pytest.mark.parametrize("tile", [1, 2, 3])
+def test_block_faces(tile):
+    """blocks that tile the grid give every face exactly once"""
+    r = np.full(2, False)
+    bands = voxel.classify(grid, [5., 15., 30.])
+    exp_quads, exp_lower, exp_upper = voxel.boundary_faces(bands, coords)
+    faces = []
+    for i in range(0, 3, tile):
+        quads, lower, upper = voxel.block_faces(bands, coords, (i, 0, 0),
+                                                (min(i + tile, 3), 1, 1))
+        faces.extend(zip(map(lambda q: q.tobytes(), quads), lower, upper))
+    exp = list(zip(map(lambda q: q.tobytes(), exp_quads), exp_lower,
+                   exp_upper))
+    if len(faces) == len(exp):
+        r[0] = True
+    if sorted(faces) == sorted(exp):
+        r[1] = True
+    assert(all(r))
+
+
+@pytest.mark.parametrize("tile", [1, 3])
+def test_transition_counts(tile):
+    """faces between bands and on the exterior are counted per band"""
+    r = np.full(2, False)
+    bands = voxel.classify(grid, [5., 15., 30.])
+    pairs, exterior = voxel.transition_counts(bands, 3, tile=tile)
+    exp_pairs = np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]])
+    if np.array_equal(pairs, exp_pairs):
+        r[0] = True
+    if list(exterior) == [5, 4, 5]:
+        r[1] = True
+    assert(all(r))
+
+
+def test_extract_tiled():
+    """tiled extraction writes the same triangles as extract()"""
+    r = np.full(3, False)
+    levels = [5., 15., 30.]
+    bands = voxel.classify(grid, levels)
+    fnames = [test_dir + "/test-tiled-{}.stl".format(i) for i in range(3)]
+    voxel.extract_tiled(bands, coords, len(levels), fnames, tile=1)
+    exp = voxel.extract(grid, coords, levels)
+    counts = []
+    same = []
+    for fname, tris in zip(fnames, exp):
+        with open(fname, 'rb') as f:
+            f.read(80)
+            counts.append(np.frombuffer(f.read(4), dtype='<u4')[0])
+            records = np.frombuffer(f.read(), dtype=voxel._STL_DTYPE)
+        gen = set(t.tobytes() for t in records['verts'])
+        same.append(gen == set(t.tobytes() for t in
+                               tris.astype(np.float32)))
+        remove(fname)
+    if counts == [12, 12, 12]:
+        r[0] = True
+    if all(same):
+        r[1] = True
+    if not any(isfile(f) for f in fnames):
+        r[2] = True
+    assert(all(r))
+
+
+def test_write_labeled_vtk():
+    """labeled VTK file holds the triangles and band of every band"""
+    r = np.full(4, False)
+    tris = voxel.extract(grid, coords, [5., 15., 30.])
+    fname = test_dir + "/test-labeled.vtk"
+    voxel.write_labeled_vtk(fname, tris)
+    points, conn, labels = voxel.read_labeled_vtk(fname)
+    remove(fname)
+    if list(np.bincount(labels)) == [12, 12, 12]:
+        r[0] = True
+    # a unit cube has 8 vertices in each band
+    if len(points) == 24:
+        r[1] = True
+    same = []
+    for i, band_tris in enumerate(tris):
+        gen = points[conn[labels == i]].astype(np.float32)
+        same.append(np.array_equal(gen, band_tris.astype(np.float32)))
+    if all(same):
+        r[2] = True
+    if not isfile(fname):
+        r[3] = True
+    assert(all(r))
@@ -0,0 +1,169 @@
+"""tests for the streaming VTK scanner"""
+from os import getcwd
+import pytest
+import numpy as np
+
+from IsogeomGenerator import vtkscan, minmax, gridops
+
+test_dir = getcwd() + "/tests/test_files/"
+test_mesh = test_dir + "test_mesh.vtk"
+test_mesh_binary = test_dir + "test_mesh_binary.vtk"
+test_mesh_nodal = test_dir + "test_mesh_nodal.vtk"
+levels = [5, 15, 25, 35]
+
+
+def test_is_legacy_vtk():
+    """legacy VTK files are recognized by their header"""
+    r = np.full(2, False)
+    if vtkscan.is_legacy_vtk(test_mesh):
+        r[0] = True
+    if not vtkscan.is_legacy_vtk(test_dir + "/exp-test/levelfile"):
+        r[1] = True
+    assert(all(r))
+
+
+@pytest.mark.parametrize("filename", [test_mesh, test_mesh_binary])
+@pytest.mark.parametrize("chunk_size", [5, 2**22])
+def test_scan(filename, chunk_size):
+    """data range, extents, and band counts of cell data"""
+    r = np.full(5, False)
+    info = vtkscan.scan(filename, 'dname', levels=levels,
+                        chunk_size=chunk_size)
+    if info['min'] == 0. and info['max'] == 40.:
+        r[0] = True
+    if list(info['mins']) == [-10., -10., -10.]:
+        r[1] = True
+    if list(info['maxs']) == [10., 10., 10.]:
+        r[2] = True
+    if not info['point_data']:
+        r[3] = True
+    if list(info['counts']) == [25] * 5:
+        r[4] = True
+    assert(all(r))
+
+
+def test_scan_nodal():
+    """point data is found when there is no cell data"""
+    r = np.full(3, False)
+    info = vtkscan.scan(test_mesh_nodal, 'dname')
+    if info['point_data']:
+        r[0] = True
+    if info['min'] == -5. and info['max'] == 45.:
+        r[1] = True
+    if info['counts'] is None:
+        r[2] = True
+    assert(all(r))
+
+
+def test_scan_structured_points(tmpdir):
+    """extents of structured points come from the origin and spacing"""
+    r = np.full(3, False)
+    filename = str(tmpdir.join("sp.vtk"))
+    with open(filename, 'w') as f:
+        f.write("# vtk DataFile Version 3.0\n" +
+                "structured points\n" +
+                "ASCII\n" +
+                "DATASET STRUCTURED_POINTS\n" +
+                "DIMENSIONS 3 3 2\n" +
+                "ORIGIN 1 2 3\n" +
+                "SPACING 0.5 1 2\n" +
+                "CELL_DATA 4\n" +
+                "FIELD FieldData 2\n" +
+                "other 1 4 int\n" +
+                "7 8 9 10\n" +
+                "dname 1 4 double\n" +
+                "-1 2 3 40\n")
+    info = vtkscan.scan(filename, 'dname', levels=[2.5])
+    if list(info['mins']) == [1., 2., 3.] and \
+            list(info['maxs']) == [2., 4., 5.]:
+        r[0] = True
+    if info['min'] == -1. and info['max'] == 40.:
+        r[1] = True
+    if list(info['counts']) == [2, 2]:
+        r[2] = True
+    assert(all(r))
+
+
+def test_scan_nodata():
+    """missing data raises an error"""
+    with pytest.raises(RuntimeError) as error_info:
+        vtkscan.scan(test_mesh, 'nonsense')
+    assert "not found" in str(error_info)
+
+
+@pytest.mark.parametrize("filename", [test_mesh, test_mesh_binary])
+def test_band_grid(filename, tmpdir):
+    """cell data is classified onto a memory-mapped band grid"""
+    r = np.full(3, False)
+    coords, bands = vtkscan.band_grid(filename, 'dname', levels + [50],
+                                      str(tmpdir), chunk_size=64)
+    exp_coords = [-10., -6., -2., 2., 6., 10.]
+    if all(list(c) == exp_coords for c in coords):
+        r[0] = True
+    if isinstance(bands, np.memmap) and bands.shape == (5, 5, 5):
+        r[1] = True
+    # data increases by 10 in each slab along x
+    exp = np.repeat(np.arange(5), 25).reshape(5, 5, 5)
+    if np.array_equal(np.asarray(bands), exp):
+        r[2] = True
+    del bands
+    assert(all(r))
+
+
+@pytest.mark.parametrize("tile", [1, 2, 5])
+def test_band_grid_extrema(tile, tmpdir):
+    """block extrema are found while streaming the band grid"""
+    r = np.full(2, False)
+    coords, bands, mins, maxs = \
+        vtkscan.band_grid_extrema(test_mesh, 'dname', levels + [50],
+                                  str(tmpdir), tile, chunk_size=64)
+    if np.array_equal(np.asarray(bands),
+                      np.repeat(np.arange(5), 25).reshape(5, 5, 5)):
+        r[0] = True
+    # data is 0, 10, 20, 30, 40 along x
+    grid = np.repeat(np.arange(0., 50., 10.), 25).reshape(5, 5, 5)
+    tree = minmax.build(grid, tile)
+    if np.array_equal(mins, tree.mins[0]) and \
+            np.array_equal(maxs, tree.maxs[0]):
+        r[1] = True
+    del bands
+    assert(all(r))
+
+
+def test_value_grid(tmpdir):
+    """cell values are arranged on a memory-mapped grid"""
+    r = np.full(2, False)
+    coords, grid = vtkscan.value_grid(test_mesh_binary, 'dname',
+                                      str(tmpdir), chunk_size=64)
+    if isinstance(grid, np.memmap) and grid.shape == (5, 5, 5):
+        r[0] = True
+    exp = np.repeat(np.arange(0., 50., 10.), 25).reshape(5, 5, 5)
+    if np.array_equal(np.asarray(grid), exp):
+        r[1] = True
+    del grid
+    assert(all(r))
+
+
+def test_rectilinear_grid(tmpdir):
+    """a rectilinear grid file is read back onto the same grid"""
+    r = np.full(2, False)
+    filename = str(tmpdir.join("rg.vtk"))
+    coords = [np.array([0., 1., 3.]), np.array([0., 2.]),
+              np.array([-1., 0., 1.])]
+    values = np.arange(4.).reshape(2, 1, 2)
+    gridops.write_rectilinear_vtk(filename, coords, values, 'dname')
+    new_coords, grid = vtkscan.value_grid(filename, 'dname', str(tmpdir))
+    if all(np.array_equal(a, b) for a, b in zip(coords, new_coords)):
+        r[0] = True
+    if np.array_equal(np.asarray(grid), values):
+        r[1] = True
+    del grid
+    assert(all(r))
+
+
+def test_band_grid_error(tmpdir):
+    """tet meshes are not Cartesian grids"""
+    with pytest.raises(RuntimeError) as error_info:
+        vtkscan.band_grid(test_dir + "test_mesh_tet.vtk", 'dname',
+                          levels + [50], str(tmpdir))
+    assert "Cartesian" in str(error_info)